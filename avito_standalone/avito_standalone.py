@@ -1,5 +1,6 @@
 import requests
 import sys
+import os
 import asyncio
 import re
 import datetime
@@ -11,15 +12,25 @@ from proxy_manager import ProxyManager
 from web_client import WebClient
 from logger import Logger
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from avitoscrapper.order_push import OrderPusher
+from avitoscrapper.outbox import Outbox
+from avitoscrapper.avito_state import extract_ad
+from avitoscrapper.date_parser import parse_date
+
 
 # Init proxy manager
 class AvitoStandalone:
-    date_regex = re.compile(r"(?:размещено\s*)?(\d+\s*\w+|сегодня|вчера)", re.I)
     time_regex = re.compile(r"\d{1,2}:\d{1,2}")
 
     def __init__(self):
         self.proxy_manager = ProxyManager(ProxySettings)
-        self.web_client = WebClient(self.proxy_manager)
+        outbox = None
+        if RemoteServerSettings.OUTBOX_DIR:
+            # Apart from the outboxes of the spiders, which may use the same OUTBOX_DIR
+            outbox = Outbox(os.path.join(RemoteServerSettings.OUTBOX_DIR, 'standalone'))
+        self.pusher = OrderPusher(RemoteServerSettings.PUSH_URL, queue=outbox).start()
+        self.web_client = WebClient(self.proxy_manager, self.pusher)
         self.is_running = True
         self.duplicates = {}
 
@@ -31,16 +42,7 @@ class AvitoStandalone:
 
     # noinspection PyMethodMayBeStatic
     def get_date_from_description(self, raw_data):
-        date = self.date_regex.findall(raw_data)
-        if not date:
-            return datetime.datetime.now()
-        first = date[0].lower()
-        if first == 'сегодня':
-            return datetime.datetime.now()
-        if first == 'вчера':
-            return datetime.datetime.now() - datetime.timedelta(days=1)
-        result = month_format(first)
-        return datetime.datetime.strptime(result, '%d %m %Y')
+        return parse_date(raw_data) or datetime.datetime.now()
 
     # noinspection PyMethodMayBeStatic
     def get_time_from_description(self, raw_data):
@@ -60,6 +62,9 @@ class AvitoStandalone:
     # c
     def get_ad_date_inner(self, raw_data):
         dt = self.get_date_from_description(raw_data)
+        if not self.time_regex.search(raw_data):
+            # '25 минут назад' is already exact
+            return dt
         t = self.get_time_from_description(raw_data)
         return datetime.datetime(dt.year, dt.month, dt.day) + t
 
@@ -112,7 +117,10 @@ class AvitoStandalone:
 
     # noinspection PyMethodMayBeStatic
     def get_room_count(self, response):
-        data = self.get_title(response)
+        return self.get_room_count_from_title(self.get_title(response))
+
+    # noinspection PyMethodMayBeStatic
+    def get_room_count_from_title(self, data):
         if data is None:
             return None
         regexp = re.compile('(\d+)-к', re.I)
@@ -151,32 +159,60 @@ class AvitoStandalone:
         items = address.split(',')
         return items[0] if items else "Неизвестно"
 
+    def get_state_values(self, page):
+        """
+        The fields of the ad from the state embedded in the page, parsed
+        without building the DOM, {} if the page has none.
+        """
+        state = extract_ad(page)
+        if state is None:
+            return {}
+        values = dict((k, state[k]) for k in ('title', 'phone', 'address', 'agent', 'placed_at', 'contact_name')
+                      if k in state)
+        if 'city' in state or 'address' in state:
+            values['city'] = state.get('city') or state['address'].split(',')[0]
+        if 'cost' in state:
+            values['cost'] = str(state['cost'])
+        category = self.get_room_count_from_title(state.get('title'))
+        if category:
+            values['category'] = category
+        return values
+
     async def process_ad(self, ad, session):
         page = await self.web_client.get(ad['link'], session)
         if page is None:
             return
         Logger.info('Parsing is starting: {}'.format(ad['link']))
         start = time.time()
-        dom = html.fromstring(page)
         # TODO: add filtering
-        ad['city'] = self.get_city(dom)
-
         ad['source'] = 1
         ad['order_type'] = 1
-        ad['title'] = self.get_title(dom)
-        ad['phone'] = self.get_phone(dom)
-        ad['address'] = self.get_mobile_address(dom)
-        ad['agent'] = self.is_agent(dom)
-        ad['cost'] = self.get_price(dom)
-        ad['placed_at'] = self.get_ad_date(dom)
-        ad['contact_name'] = self.get_contact_name(dom)
-        ad['category'] = self.get_category(dom)
+        values = self.get_state_values(page)
+        getters = [
+            ('city', self.get_city),
+            ('title', self.get_title),
+            ('phone', self.get_phone),
+            ('address', self.get_mobile_address),
+            ('agent', self.is_agent),
+            ('cost', self.get_price),
+            ('placed_at', self.get_ad_date),
+            ('contact_name', self.get_contact_name),
+            ('category', self.get_category),
+        ]
+        # The DOM only for the fields missing from the embedded state
+        dom = None
+        for field, getter in getters:
+            if field not in values:
+                if dom is None:
+                    dom = html.fromstring(page)
+                values[field] = getter(dom)
+            ad[field] = values[field]
         Logger.info('order date: {}'.format( ad['placed_at']))
         end = time.time()
         Logger.info('Ad {} collected. Time {}s'.format(ad['link'], end - start))
         Logger.debug('Ad Values' + str(ad))
         if not ad['agent']:
-            await self.web_client.post_ad(RemoteServerSettings.PUSH_URL, ad)
+            await self.web_client.post_ad(ad)
         else:
             Logger.info('{} is an agent'.format(ad['link']))
 
@@ -212,7 +248,11 @@ class AvitoStandalone:
 
     def execute(self):
         Logger.info('Starting the scrapper...')
-        asyncio.run(self.process_pages())
+        try:
+            asyncio.run(self.process_pages())
+        finally:
+            self.proxy_manager.close()
+            self.pusher.close()
         Logger.info('Stopping the scrapper')
 
 
@@ -22,8 +22,16 @@ class RemoteServerSettings:
     GET_STREET_URL = 'http://{}/api/get_streets'.format(BASE_URL)
     GET_DISTRICT = False
     PUSH_LOGS = False
+    # Ads are written to OUTBOX_DIR/standalone before being pushed, see
+    # avitoscrapper.outbox
+    OUTBOX_DIR = 'outbox'
 
 
 class ProxySettings:
     #PROXY_LIST = 'ips-zone-processed.txt'
     PROXY_LIST = '../ips-processed.test'
+    # Proxy health shared with other scrapper processes, None to disable
+    HEALTH_DB = '../avitoscrapper/proxy_health.sqlite'
+    # Requests rotate over this many proxy sessions, so that their connections
+    # to the superproxy are reused; 0 picks a random proxy every time
+    WARM_SESSIONS = 16
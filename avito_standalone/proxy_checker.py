@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+from logger import Logger
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from avitoscrapper.proxy_pool import load_proxy_list
+from avitoscrapper.proxy_index import write_proxy_index
+
+
+class ProxyChecker:
+    """
+    Probes proxies concurrently on plain asyncio streams, without a process
+    or a thread per proxy. Plain http targets are fetched through the proxy
+    and the response status is recorded, https targets are checked by
+    opening a CONNECT tunnel to the target host.
+    """
+    DEFAULT_TARGET = 'http://avito.ru/robots.txt'
+
+    def __init__(self, target=DEFAULT_TARGET, concurrency=500, timeout=15.0):
+        self.target = urlsplit(target)
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def build_request(self, proxy):
+        target = self.target
+        if target.scheme == 'https':
+            host = '{}:{}'.format(target.hostname, target.port or 443)
+            lines = ['CONNECT {} HTTP/1.1'.format(host), 'Host: {}'.format(host)]
+        else:
+            lines = ['GET {} HTTP/1.1'.format(target.geturl()),
+                     'Host: {}'.format(target.netloc),
+                     'Connection: close']
+        if proxy.auth_header:
+            lines.append('Proxy-Authorization: {}'.format(proxy.auth_header))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    async def probe(self, proxy):
+        address = urlsplit(proxy.address)
+        writer = None
+        start = time.time()
+        try:
+            reader, writer = await asyncio.open_connection(address.hostname, address.port)
+            writer.write(self.build_request(proxy))
+            await writer.drain()
+            status_line = await reader.readline()
+            parts = status_line.split()
+            status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else None
+            return status, time.time() - start, None if status else 'Bad status line'
+        except (OSError, asyncio.IncompleteReadError) as e:
+            return None, time.time() - start, str(e) or e.__class__.__name__
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def check(self, proxy, semaphore):
+        async with semaphore:
+            try:
+                status, latency, error = await asyncio.wait_for(self.probe(proxy), self.timeout)
+            except asyncio.TimeoutError:
+                status, latency, error = None, self.timeout, 'Timeout'
+        return {'proxy': proxy, 'status': status, 'latency': latency, 'error': error}
+
+    async def check_all(self, proxies):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self.check(proxy, semaphore) for proxy in proxies])
+
+    def run(self, proxies):
+        start = time.time()
+        results = asyncio.run(self.check_all(proxies))
+        Logger.info('{} proxies checked in {:.1f}s'.format(len(results), time.time() - start))
+        return results
+
+    @staticmethod
+    def is_working(result):
+        return result['status'] is not None and 200 <= result['status'] < 400
+
+    @staticmethod
+    def rank(results):
+        """
+        Working proxies, fastest first.
+        """
+        return sorted((x for x in results if ProxyChecker.is_working(x)), key=lambda x: x['latency'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check proxies concurrently and rank the working ones')
+    parser.add_argument('source', help='proxy list, text or compiled')
+    parser.add_argument('-u', '--url', default=ProxyChecker.DEFAULT_TARGET, help='url to probe through proxies')
+    parser.add_argument('-c', '--concurrency', type=int, default=500)
+    parser.add_argument('--timeout', type=float, default=15.0)
+    parser.add_argument('-t', '--text', help='write working proxies, fastest first, to this file')
+    parser.add_argument('-o', '--output', help='write working proxies as a compiled index')
+    parser.add_argument('-r', '--report', help='write status and latency of every proxy (tsv)')
+    args = parser.parse_args()
+
+    checker = ProxyChecker(args.url, args.concurrency, args.timeout)
+    results = checker.run(load_proxy_list(args.source))
+    ranked = ProxyChecker.rank(results)
+    Logger.info('{} of {} proxies are working'.format(len(ranked), len(results)))
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(''.join('{}\t{}\t{:.3f}\t{}\n'.format(x['proxy'].url, x['status'], x['latency'], x['error'] or '')
+                            for x in results))
+    if args.output:
+        write_proxy_index([x['proxy'] for x in ranked], args.output)
+    text = ''.join(x['proxy'].url + '\n' for x in ranked)
+    if args.text:
+        with open(args.text, 'w') as f:
+            f.write(text)
+    elif not args.output:
+        sys.stdout.write(text)
+
+
+if __file__ == sys.argv[0]:
+    main()
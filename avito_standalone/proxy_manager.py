@@ -1,32 +1,68 @@
+import os
 import sys
-import random
 # noinspection UnresolvedReference
 from config import ProxySettings
 from logger import Logger
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from avitoscrapper.proxy_pool import ProxyPool, load_proxy_list
+from avitoscrapper.proxy_health import ProxyHealthStore
+from avitoscrapper.proxy_sessions import WarmSessions
+
 
 class ProxyManager:
+    # How many times get_random_proxy re-draws to avoid the except_list
+    MAX_DRAWS = 32
+
     def __init__(self, settings):
-        self.proxies = self.get_proxies(settings)
+        self.pool = ProxyPool(self.get_proxies(settings))
+        # Filled on hand-out, so a compiled list is never decoded as a whole
+        self.ids = {}
+        self.sessions = None
+        if getattr(settings, 'WARM_SESSIONS', 0):
+            self.sessions = WarmSessions(self.pool, settings.WARM_SESSIONS)
+        self.health = None
+        if getattr(settings, 'HEALTH_DB', None):
+            self.health = ProxyHealthStore(settings.HEALTH_DB)
+            Logger.info('Proxy health restored for {} proxies'.format(self.health.restore(self.pool)))
 
     @staticmethod
     def get_proxies(settings):
-        with open(settings.PROXY_LIST) as f:
-            return [
-                {'http': proxy.strip(), 'https': proxy.strip()} for proxy in f.readlines()
-            ]
+        return load_proxy_list(settings.PROXY_LIST)
 
     def get_random_proxy(self, except_list=[]):
+        if self.pool.is_exhausted():
+            Logger.debug('PROXY LIST IS EMPTY')
+            raise Exception('Empty Proxy List')
         current_proxy = None
-        while current_proxy is None or current_proxy in except_list:
-            current_proxy = random.choice(self.proxies)
+        for _ in range(ProxyManager.MAX_DRAWS):
+            proxy_id = self.pool.acquire() if self.sessions is None else self.sessions.acquire()
+            url = self.pool[proxy_id].url
+            self.ids[url] = proxy_id
+            current_proxy = {'http': url, 'https': url}
+            if current_proxy not in except_list:
+                break
         return current_proxy
 
-    def delete_proxy(self, current_proxy):
-        self.proxies.remove(current_proxy)
-        if len(self.proxies) == 0:
-            Logger.debug('PROXY LIST IS EMPTY')
-            raise Exception('Empty Proxy List')
+    def report_success(self, current_proxy, latency=None):
+        self.pool.record_success(self.ids[current_proxy['http']], latency)
+        if self.health is not None:
+            self.health.maybe_flush(self.pool)
+
+    def quarantine_proxy(self, current_proxy):
+        proxy_id = self.ids[current_proxy['http']]
+        self.pool.record_failure(proxy_id)
+        self.pool.quarantine(proxy_id)
+        if self.sessions is not None:
+            self.sessions.retire(proxy_id)
+        Logger.debug('Proxy {} quarantined, {} proxies left, {} quarantined'.format(
+            current_proxy['http'], len(self.pool), self.pool.quarantined_count()))
+        if self.health is not None:
+            self.health.maybe_flush(self.pool)
+
+    def close(self):
+        if self.health is not None:
+            self.health.close(self.pool)
 
 
 if __file__ == sys.argv[0]:
@@ -1,17 +1,63 @@
 import asyncio
 import requests
 import sys
-import json
+import os
 import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from requests.utils import select_proxy
 from fake_useragent import UserAgent
 from logger import Logger
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from avitoscrapper.proxy_pool import parse_proxy
+
+
+class SuperproxyAdapter(HTTPAdapter):
+    """
+    Keeps connections to the superproxy alive across proxy sessions.
+
+    requests keys its proxy connection pools by the full proxy url, so every
+    credential gets its own pool and every pool is kept forever. Here plain
+    http requests go through a single pool per superproxy address, with the
+    credentials sent as a Proxy-Authorization header of each request, and
+    the per-credential pools https tunnels need are kept in a bounded LRU.
+    """
+
+    def __init__(self, max_tunnels=64, **kwargs):
+        HTTPAdapter.__init__(self, **kwargs)
+        self.max_tunnels = max_tunnels
+        self.proxy_manager = OrderedDict()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        proxy = select_proxy(request.url, proxies) if proxies else None
+        if proxy and urlsplit(request.url).scheme == 'http':
+            proxy = parse_proxy(proxy)
+            if proxy is not None and proxy.auth_header:
+                request.headers['Proxy-Authorization'] = proxy.auth_header
+                proxies = {'http': proxy.address}
+        return HTTPAdapter.send(self, request, stream, timeout, verify, cert, proxies)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if proxy in self.proxy_manager:
+            self.proxy_manager.move_to_end(proxy)
+            return self.proxy_manager[proxy]
+        manager = HTTPAdapter.proxy_manager_for(self, proxy, **proxy_kwargs)
+        while len(self.proxy_manager) > self.max_tunnels:
+            self.proxy_manager.popitem(last=False)[1].clear()
+        return manager
+
 
 class WebClient:
-    def __init__(self, proxy_manager):
+    def __init__(self, proxy_manager, pusher):
         self.proxy_manager = proxy_manager
+        # Ads are pushed in the background from a durable outbox
+        self.pusher = pusher
         self.ua = UserAgent()
-        self.base_session = self.get_session()
+        # Shared by the sessions of all pages, so connections to the
+        # superproxy are reused while cookies stay with their session
+        self.adapter = SuperproxyAdapter(pool_maxsize=32)
 
     def __get_internal(self, url, session, proxy):
         headers={
@@ -28,25 +74,17 @@ class WebClient:
 
         return asyncio.get_running_loop().run_in_executor(None, task)
 
-    def __post_internal(self, url, ad):
-        def task():
-            start = time.time()
-            response = self.base_session['SESSION'].post(url,
-                                     data=json.dumps({'order': ad}),
-                                     headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
-            end = time.time()
-            Logger.info('[POST] {}: Finished. Time {}s'.format(url, end - start))
-            return response
-        return asyncio.get_running_loop().run_in_executor(None, task)
-
     def get_session(self):
         session = {}
         session['UA'] = self.ua.random
         session['SESSION'] = requests.Session()
+        session['SESSION'].mount('http://', self.adapter)
+        session['SESSION'].mount('https://', self.adapter)
         return session
 
     def close_session(self, session):
-        session['SESSION'].close()
+        # Not Session.close(), which would close the shared adapter
+        session['SESSION'].cookies.clear()
 
     async def get(self, url, session):
         # get proxy
@@ -59,21 +97,20 @@ class WebClient:
                 # switch proxy
                 Logger.info('Response completed with {} error, switching proxy...'.format(response.status_code))
                 check_proxy = self.proxy_manager.get_random_proxy([proxy])
-                response = await  self.__get_internal(url, proxies=check_proxy)
+                response = await self.__get_internal(url, session, check_proxy)
                 if not response.ok:
                     Logger.error('Unable to get {}, status code {}'.format(url, response.status_code))
                     return None
-                Logger.info('Removing proxy {}'.format(proxy))
-                self.proxy_manager.delete_proxy(proxy)
+                Logger.info('Quarantining proxy {}'.format(proxy))
+                self.proxy_manager.quarantine_proxy(proxy)
+                proxy = check_proxy
+            self.proxy_manager.report_success(proxy, response.elapsed.total_seconds())
             return response.text
         except requests.exceptions.ProxyError:
-            self.proxy_manager.delete_proxy(proxy)
+            self.proxy_manager.quarantine_proxy(proxy)
 
-    async def post_ad(self, url, ad):
+    async def post_ad(self, ad):
         ad['placed_at'] = str(ad['placed_at'])
         ad['link'] = ad['link'].replace('m.avito', 'www.avito')
-        response = await self.__post_internal(url, ad)
-        if not response.ok:
-            Logger.info('Push {} failed, resulted with {}] {}'.format(url, response.status_code, response.text))
-        else:
-            Logger.info('{} has been pushed'.format(ad['link']))
+        self.pusher.push(ad)
+        Logger.info('{} is queued for push'.format(ad['link']))
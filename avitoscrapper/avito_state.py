@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+# Ad data from the state Avito embeds in its pages for the client-side
+# scripts (window.__initialData__ = ..., on the desktop and the mobile
+# site), read from the page text without building its DOM.
+#
+# extract_ad() returns the fields it found ('title', 'cost', 'params', ...)
+# or None without any state; the spiders take the fields missing from it
+# from the DOM as before.
+import re
+import json
+import codecs
+import datetime
+from urllib.parse import unquote
+
+STATE_MARKERS = ('window.__initialData__', 'window.__preloadedState__', 'window.__INITIAL_STATE__')
+ASSIGNMENT = re.compile(r'\s*=\s*')
+IMAGE_SIZE = re.compile(r'(\d+)x(\d+)')
+# The item is the object of the state having all of these
+ITEM_KEYS = ('title', 'description')
+MAX_NODES = 200000
+
+# The pages show Moscow time, the state has UTC timestamps
+SITE_UTC_OFFSET = datetime.timedelta(hours=3)
+
+decoder = json.JSONDecoder()
+
+
+def percent_decode(value):
+    """
+    unquote() for the large URL-encoded states: '%D0%9F' is turned into
+    '\\xD0\\x9F' for the unicode_escape codec, several times faster.
+    """
+    if '\\' in value:
+        return unquote(value)
+    try:
+        escaped = value.replace('%', '\\x').encode('ascii')
+        return codecs.decode(escaped, 'unicode_escape').encode('latin-1').decode('utf-8')
+    except (UnicodeError, ValueError):
+        return unquote(value)
+
+
+def find_state(text):
+    """
+    Returns the decoded state of the page or None.
+    """
+    for marker in STATE_MARKERS:
+        start = text.find(marker)
+        if start < 0:
+            continue
+        assignment = ASSIGNMENT.match(text, start + len(marker))
+        if assignment is None:
+            continue
+        try:
+            state, _ = decoder.raw_decode(text, assignment.end())
+            # Either the object itself or a JSON string of it, URL-encoded
+            if isinstance(state, str):
+                state = json.loads(percent_decode(state) if state[:1] == '%' else state)
+        except ValueError:
+            continue
+        if isinstance(state, dict):
+            return state
+    return None
+
+
+def walk(node):
+    """
+    The dicts of the state, breadth-first.
+    """
+    queue = [node]
+    for current in queue:
+        if len(queue) > MAX_NODES:
+            return
+        if isinstance(current, dict):
+            yield current
+            queue.extend(x for x in current.values() if isinstance(x, (dict, list)))
+        elif isinstance(current, list):
+            queue.extend(x for x in current if isinstance(x, (dict, list)))
+
+
+def find_item(state):
+    for node in walk(state):
+        if all(isinstance(node.get(x), str) for x in ITEM_KEYS) and ('price' in node or 'priceDetailed' in node):
+            return node
+    return None
+
+
+def first(node, *paths):
+    """
+    The value at the first of the dotted paths present in node.
+    """
+    for path in paths:
+        value = node
+        for key in path.split('.'):
+            value = value.get(key) if isinstance(value, dict) else None
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def get_cost(item):
+    price = first(item, 'priceDetailed.value', 'price.value', 'price')
+    if isinstance(price, (int, float)):
+        return int(price)
+    if isinstance(price, str):
+        digits = re.sub(r'\D', '', price)
+        return int(digits) if digits else None
+    return None
+
+
+def get_date(item):
+    value = first(item, 'time', 'sortTimeStamp', 'createdAt', 'date')
+    if isinstance(value, (int, float)):
+        # Seconds or milliseconds since the epoch
+        seconds = value / 1000.0 if value > 1e11 else value
+        return datetime.datetime.utcfromtimestamp(seconds) + SITE_UTC_OFFSET
+    if isinstance(value, str):
+        try:
+            return datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+        except ValueError:
+            return None
+    return None
+
+
+def get_images(item):
+    images = []
+    for image in first(item, 'images', 'gallery.images') or []:
+        if isinstance(image, str):
+            images.append(image)
+        elif isinstance(image, dict):
+            sizes = [(int(x.group(1)) * int(x.group(2)), k) for k, x in
+                     ((k, IMAGE_SIZE.match(k)) for k in image) if x]
+            url = image[max(sizes)[1]] if sizes else first(image, 'url', 'src')
+            if isinstance(url, str):
+                images.append(url)
+    return ['http:' + x if x.startswith('//') else x for x in images]
+
+
+def get_params(item):
+    """
+    {'Этаж': '5', 'Общая площадь': '54 м²', ...}
+    """
+    raw = first(item, 'parameters', 'params', 'attributes')
+    if isinstance(raw, dict):
+        raw = [x for value in raw.values() for x in (value if isinstance(value, list) else [value])]
+    params = {}
+    for param in raw if isinstance(raw, list) else []:
+        if not isinstance(param, dict):
+            continue
+        name = first(param, 'title', 'name', 'label')
+        value = first(param, 'description', 'value', 'text')
+        if isinstance(name, str) and value is not None:
+            params.setdefault(name.strip().rstrip(':'), str(value).strip())
+    return params
+
+
+def get_breadcrumbs(state):
+    for node in walk(state):
+        crumbs = node.get('breadcrumbs')
+        if isinstance(crumbs, list) and crumbs:
+            names = [first(x, 'title', 'name') if isinstance(x, dict) else x for x in crumbs]
+            return [x for x in names if isinstance(x, str)]
+    return None
+
+
+def get_agent(item):
+    seller = first(item, 'seller')
+    if not isinstance(seller, dict):
+        return None
+    for key in ('isCompany', 'isShop', 'isAgent'):
+        if isinstance(seller.get(key), bool):
+            return seller[key]
+    kind = first(seller, 'type', 'sellerType', 'postfix')
+    if isinstance(kind, str):
+        return any(x in kind.lower() for x in ('посредник', 'агентство', 'company', 'agency'))
+    return None
+
+
+def extract_ad(text):
+    """
+    The fields of the ad found in the state of the page, None if the page
+    has no state or no ad in it.
+    """
+    state = find_state(text)
+    if state is None:
+        return None
+    item = find_item(state)
+    if item is None:
+        return None
+    phone = first(item, 'phone', 'contacts.phone')
+    result = {
+        'title': item['title'].strip(),
+        'description': item['description'],
+        'cost': get_cost(item),
+        'placed_at': get_date(item),
+        'address': first(item, 'address', 'location.address', 'geo.formattedAddress'),
+        'city': first(item, 'location.name', 'city.name', 'city'),
+        'contact_name': first(item, 'seller.name', 'sellerName', 'seller.title'),
+        'image_list': get_images(item),
+        'params': get_params(item),
+        'breadcrumbs': get_breadcrumbs(state),
+        'agent': get_agent(item),
+        'phone': phone if isinstance(phone, str) else None,
+    }
+    return dict((k, v) for k, v in result.items() if v not in (None, '', [], {}))
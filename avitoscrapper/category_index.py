@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import threading
+
+
+def category_key(name):
+    return name.strip().lower() if name else name
+
+
+class SingleFlight(object):
+    """
+    Runs a function at most once at a time per key: callers arriving while
+    a call for the same key is in progress wait for it and share its result
+    (or its exception).
+    """
+
+    class Call(object):
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn, *args):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = SingleFlight.Call()
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args)
+            except Exception as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class CategoryIndex(object):
+    """
+    Category name or alias -> category id.
+
+    categories is the list returned by the API ({'id', 'name', 'mapping'},
+    mapping being '|'-separated aliases), aliases maps source category names
+    to category names (AvitoscrapperPipeline.category_map). The index is
+    built once and rebuilt only when a category is added or the list is
+    updated. Unknown names are created with create(name), once however many
+    items ask for them concurrently.
+    """
+
+    def __init__(self, categories, aliases=None, create=None):
+        self.categories = list(categories)
+        self.aliases = dict((category_key(k), v) for k, v in (aliases or {}).items())
+        self.create = create
+        self.lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.index = {}
+        self.rebuild()
+
+    def rebuild(self):
+        index = {}
+        # Aliases from the mappings first so that a category name wins
+        for category in self.categories:
+            for alias in (category.get('mapping') or '').split('|'):
+                if alias.strip():
+                    index.setdefault(category_key(alias), category['id'])
+        for category in self.categories:
+            index[category_key(category['name'])] = category['id']
+        for alias, name in self.aliases.items():
+            if category_key(name) in index:
+                index.setdefault(alias, index[category_key(name)])
+        self.index = index
+
+    def update(self, categories):
+        """
+        Replaces the categories, e.g. with a newer list from the API.
+        """
+        with self.lock:
+            self.categories = list(categories)
+            self.rebuild()
+
+    def canonical_name(self, name):
+        return self.aliases.get(category_key(name), name)
+
+    def get(self, name):
+        key = category_key(name)
+        if key in self.index:
+            return self.index[key]
+        return self.index.get(category_key(self.canonical_name(name)))
+
+    def resolve(self, name):
+        """
+        Returns the id of the category, creating it if it is unknown.
+        """
+        category_id = self.get(name)
+        if category_id is not None or self.create is None:
+            return category_id
+        name = self.canonical_name(name).strip()
+        return self.flight.do(category_key(name), self.add, name)
+
+    def add(self, name):
+        # Another flight may have finished creating it meanwhile
+        category_id = self.get(name)
+        if category_id is not None:
+            return category_id
+        category = self.create(name)
+        with self.lock:
+            self.categories.append({'id': category['id'], 'name': category.get('name', name),
+                                    'mapping': category.get('mapping')})
+            self.rebuild()
+        return category['id']
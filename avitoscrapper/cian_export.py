@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# Offers from the XLS export of a Cian search (/export/xls/offers/?...),
+# a row per offer. The workbook is streamed by openpyxl in read-only mode
+# and cleaned a chunk of rows at a time with pandas, the column operations
+# being vectorised rather than run per offer.
+import io
+import openpyxl
+import pandas
+
+# Field -> header of the column in the export
+COLUMNS = {
+    'link': 'Ссылка на объявление',
+    'rooms': 'Количество комнат',
+    'address': 'Адрес',
+    'area': 'Площадь, м2',
+    'house': 'Дом',
+    'cost': 'Цена',
+    'phone': 'Телефоны',
+    'description': 'Описание',
+    'complex': 'Название ЖК',
+}
+# The fields of Ad read_offers() fills, the others are on the ad pages only
+FIELDS = ('link', 'cost', 'address', 'phone', 'description', 'flat_area', 'floor', 'floor_count',
+          'category', 'new_building')
+CHUNK_ROWS = 1000
+
+
+def room_category(count):
+    if pandas.isna(count):
+        return None
+    count = int(count)
+    return '1 комната' if count == 1 else \
+           '{} комнаты'.format(count) if 1 < count < 5 else \
+           '{} комнат'.format(count)
+
+
+def column(frame, field):
+    """
+    The column of the field as stripped strings, all missing if the export
+    has no such column.
+    """
+    header = COLUMNS[field]
+    if header not in frame:
+        return pandas.Series(pandas.NA, index=frame.index, dtype='string')
+    return frame[header].astype('string').str.strip()
+
+
+def clean(frame):
+    """
+    The fields of Ad from a frame of export rows, None where missing:
+    'Цена' '3 150 000 руб.' -> '3150000', 'Площадь, м2' '54.0/30.0/9.0' -> '54 м²',
+    'Дом' '5/9, Кирпичный' -> floor '5', floor_count '9', ...
+    """
+    result = pandas.DataFrame(index=frame.index)
+    result['link'] = column(frame, 'link')
+    # Digits as on the ad pages, without the currency and the rent terms
+    result['cost'] = column(frame, 'cost').str.replace(r'[\s\xa0]', '', regex=True).str.extract(r'^(\d+)')[0]
+    result['address'] = column(frame, 'address')
+    result['phone'] = column(frame, 'phone').str.split(',').str[0].str.strip()
+    result['description'] = column(frame, 'description')
+    # The total of 'total/living/kitchen'
+    area = column(frame, 'area').str.extract(r'^(\d+(?:[.,]\d+)?)')[0].str.replace(r'[.,]0+$', '', regex=True)
+    result['flat_area'] = area + ' м²'
+    floors = column(frame, 'house').str.extract(r'^\s*(\d+)\s*/\s*(\d+)')
+    result['floor'] = floors[0]
+    result['floor_count'] = floors[1]
+    rooms = pandas.to_numeric(column(frame, 'rooms').str.extract(r'(\d+)')[0], errors='coerce')
+    result['category'] = rooms.map(room_category)
+    result['new_building'] = column(frame, 'complex').fillna('') != ''
+    return result.astype(object).where(result.notna(), None)
+
+
+def read_offers(data, chunk_rows=CHUNK_ROWS):
+    """
+    Yields a dict of the FIELDS for each offer of the export (bytes), the
+    rows without a link skipped.
+    """
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(x).strip() if x is not None else '' for x in header]
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield from records(header, chunk)
+                chunk = []
+        if chunk:
+            yield from records(header, chunk)
+    finally:
+        workbook.close()
+
+
+def records(header, rows):
+    frame = clean(pandas.DataFrame.from_records(rows, columns=header))
+    for offer in frame.to_dict('records'):
+        if offer['link']:
+            yield offer
@@ -6,6 +6,22 @@ class AvitoSettings:
     RANGE_RIGHT = None
     ETERNAL_SCRAPPING = False
     EXCLUDE_AGENCY = False
+    # 'desktop+mobile' scrapes the desktop page, then the mobile one for the
+    # phone, address and agent badge; 'mobile' builds the ad from the mobile
+    # page alone, one request per ad instead of two (python -m
+    # benchmarks.mobile_parity compares the ads of both modes)
+    EXTRACTION_MODE = 'desktop+mobile'
+    # With PARTITION, a search is split by price (pmin/pmax), again and again
+    # down to slices of MIN_PRICE_STEP, until every slice has at most
+    # SLICE_PAGES pages of ADS_PER_PAGE ads; the slices are then crawled
+    # concurrently. SLICE_PAGES can't be over PAGE_CAP, the last page the
+    # site shows
+    PARTITION = False
+    PAGE_CAP = 100
+    SLICE_PAGES = 10
+    ADS_PER_PAGE = 50
+    PRICE_MAX = 1000000000
+    MIN_PRICE_STEP = 1000
     URL_FORMATS = [
         'https://www.avito.ru/{}/kvartiry?view=list&s=104',
         'https://www.avito.ru/{}/komnaty?view=list&s=104',
@@ -35,7 +51,20 @@ class BazarSettings:
 
 
 class CianSettings:
-    pass
+    # 'pages' crawls the search pages and every offer page; 'xls' downloads
+    # the XLS export of each of EXPORT_SEARCHES (the query of the search on
+    # the site) and builds the ads from its rows, fetching the offer pages
+    # only for EXPORT_PAGE_FIELDS, the fields the export lacks (an empty list
+    # for none: placed_at is then the day of the crawl), and for the category
+    # of the rows without a room count (studios, houses)
+    EXTRACTION_MODE = 'pages'
+    EXPORT_SEARCHES = [
+        'deal_type=sale&engine_version=2&offer_type=flat&region=4969',
+        'deal_type=sale&engine_version=2&offer_type=flat&region=4969&room0=1',
+        'deal_type=sale&engine_version=2&offer_type=suburban&region=4969',
+        'deal_type=rent&engine_version=2&offer_type=flat&region=4969&type=4',
+    ]
+    EXPORT_PAGE_FIELDS = ['title', 'placed_at', 'contact_name', 'image_list']
 
 
 class RemoteServerSettings:
@@ -46,8 +75,70 @@ class RemoteServerSettings:
     GET_STREET_URL = 'http://{}/api/get_streets'.format(BASE_URL)
     GET_CATEGORY_URL = 'http://{}/api/get_categories'.format(BASE_URL)
     ADD_CATEGORY_URL = 'http://{}/api/create_category'.format(BASE_URL)
+    # Orders are pushed from background threads, see order_push.OrderPusher.
+    # Without PUSH_BATCH_URL the orders of a batch go to PUSH_URL one by one.
+    PUSH_BATCH_URL = None
+    PUSH_BATCH_SIZE = 50
+    PUSH_BATCH_INTERVAL = 5.0
+    PUSH_GZIP = False
+    PUSH_MAX_CONCURRENCY = 8
+    PUSH_TARGET_LATENCY = 1.0
+    # Orders are written here before being pushed, so none is lost while the
+    # API is down or across restarts; None keeps them in memory only. Each
+    # spider has its own subdirectory (outbox/avito_ru), locked while in use
+    OUTBOX_DIR = 'outbox'
     GET_DISTRICT = True
+    # Streets and categories are read from this local copy and revalidated
+    # in the background once older than the TTL (seconds); None to always
+    # fetch them at start
+    REFERENCE_CACHE_DIR = 'reference_cache'
+    REFERENCE_CACHE_TTL = 3600
+
+
+class SeenAdsSettings:
+    # Ads scraped before, so the spiders skip those unchanged on the listing
+    # pages; an ad is fetched again anyway after MAX_AGE seconds. None for DB
+    # follows every ad as before
+    DB = 'seen_ads.sqlite'
+    MAX_AGE = 7 * 24 * 3600
+
+
+class ExportSettings:
+    # Used by JsonWithEncodingPipeline: <DIRECTORY>/<PREFIX>-<spider>-...jsonl,
+    # COMPRESSION None, 'gzip' or 'zstd' (needs the zstandard package). A new
+    # file is started after MAX_BYTES of JSON or MAX_SECONDS, None for never
+    DIRECTORY = 'export'
+    PREFIX = 'scraped_data'
+    COMPRESSION = None
+    BUFFER_SIZE = 1024 * 1024
+    MAX_BYTES = 64 * 1024 * 1024
+    MAX_SECONDS = 3600
+
+
+class ReplaySettings:
+    # 'record' keeps the responses of the crawl in ARCHIVE (SQLite), 'replay'
+    # serves the crawl from it without the network, each response after
+    # LATENCY seconds give or take LATENCY_JITTER; None for a normal crawl
+    MODE = None
+    ARCHIVE = 'replay.sqlite'
+    LATENCY = 0.0
+    LATENCY_JITTER = 0.0
+    SEED = 0
+
+
+class ShardSettings:
+    # The seeds of AvitoRuSpider (a listing per city and category) are spread
+    # over COUNT shards by a consistent hash ring of VIRTUAL_NODES points per
+    # shard, see run_sharded.py. Every shard has its own seen ads, outbox and
+    # feed; the stats of each shard are written to STATS_DIR
+    COUNT = 1
+    VIRTUAL_NODES = 100
+    STATS_DIR = 'shard_stats'
 
 
 class ProxySettings:
+    # Either a text list or an index compiled by process_ip_list.py -o,
+    # which is mmapped instead of being parsed at every crawl start
     PROXY_LIST = 'test.txt'
+    # Proxy health shared by all crawl processes, None to start cold every time
+    HEALTH_DB = 'proxy_health.sqlite'
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Dates of the ads as the sites write them, in Russian:
+#
+#     'размещено 20 ноября в 12:30', '20 ноя, 12:30', '3 марта 2019',
+#     'сегодня в 09:15', 'вчера, 18:00', '25 минут назад', '20.11.2018 12:30'
+#
+# The day, the month and the time are found by small regular expressions
+# (one alternation over the whole text is several times slower), the month
+# being looked up by its first three letters. A date without a year is in the
+# current year unless that puts it in the future (an ad placed on the 30th
+# of December seen on the 2nd of January). What a text means is memoised
+# by parse_parts(), only the relative dates being resolved at each call.
+import re
+import datetime
+import functools
+
+# First three letters of the month, full ('ноября') or short ('ноя', 'май')
+MONTHS = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'мая': 5, 'май': 5, 'июн': 6,
+    'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12,
+}
+# 'позавчера' before the 'вчера' it contains
+RELATIVE_DAYS = [('позавчера', 2), ('сегодня', 0), ('вчера', 1)]
+# Units of 'N ... назад'
+UNITS = {
+    'секунд': datetime.timedelta(seconds=1),
+    'минут': datetime.timedelta(minutes=1),
+    'час': datetime.timedelta(hours=1),
+    'дн': datetime.timedelta(days=1),
+    'день': datetime.timedelta(days=1),
+    'недел': datetime.timedelta(weeks=1),
+}
+AGO = re.compile(r'(\d+)?\s*(секунд|минут|час|дн|день|недел)[а-яё]*\s+назад')
+DAY = re.compile(r'(?<!\d)(\d{1,2})\s+([а-яё]{3,})\.?(?:\s+(\d{4})(?!\d))?')
+NUMERIC_DAY = re.compile(r'(?<!\d)(\d{1,2})\.(\d{1,2})\.(\d{4})(?!\d)')
+TIME = re.compile(r'(?<!\d)(\d{1,2}):(\d{2})(?!\d)')
+CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_parts(text):
+    """
+    What the text says, independently of the current date:
+    ('ago', timedelta), ('date', (year or None, month, day), time or None),
+    ('days_ago', days, time or None), ('time', time) or None.
+    """
+    text = text.lower()
+    if 'назад' in text:
+        match = AGO.search(text)
+        if match:
+            return 'ago', UNITS[match.group(2)] * int(match.group(1) or 1)
+    day = None
+    for match in DAY.finditer(text):
+        month = MONTHS.get(match.group(2)[:3])
+        if month is not None:
+            year = match.group(3)
+            day = 'date', (int(year) if year else None, month, int(match.group(1)))
+            break
+    if day is None:
+        match = NUMERIC_DAY.search(text)
+        if match:
+            day = 'date', (int(match.group(3)), int(match.group(2)), int(match.group(1)))
+    if day is None:
+        for word, days in RELATIVE_DAYS:
+            if word in text:
+                day = 'days_ago', days
+                break
+    time = None
+    match = TIME.search(text)
+    if match and int(match.group(1)) < 24 and int(match.group(2)) < 60:
+        time = datetime.time(int(match.group(1)), int(match.group(2)))
+    if day is None:
+        return ('time', time) if time is not None else None
+    return day + (time,)
+
+
+def day_of(parts, now):
+    if parts is None or parts[0] == 'time':
+        return None
+    today = now.date()
+    if parts[0] == 'ago':
+        return (now - parts[1]).date()
+    if parts[0] == 'days_ago':
+        return today - datetime.timedelta(days=parts[1])
+    year, month, day = parts[1]
+    try:
+        if year is not None:
+            return datetime.date(year, month, day)
+        result = datetime.date(today.year, month, day)
+        if result > today + datetime.timedelta(days=1):
+            result = datetime.date(today.year - 1, month, day)
+        return result
+    except ValueError:
+        return None
+
+
+def parse_day(text, now=None):
+    """
+    The date of the text (datetime.date), None if it has none.
+    """
+    return day_of(parse_parts(text or ''), now or datetime.datetime.now())
+
+
+def parse_date(text, now=None):
+    """
+    The datetime of the text, today if it only has a time, None if it has
+    neither a date nor a time.
+    """
+    parts = parse_parts(text or '')
+    if parts is None:
+        return None
+    now = now or datetime.datetime.now()
+    if parts[0] == 'ago':
+        return now - parts[1]
+    if parts[0] == 'time':
+        return datetime.datetime.combine(now.date(), parts[1])
+    day = day_of(parts, now)
+    if day is None:
+        return None
+    return datetime.datetime.combine(day, parts[-1] or datetime.time())
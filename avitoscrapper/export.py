@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# JSON lines export of the scraped items.
+#
+# Items are encoded into an in-memory buffer which is written out once it
+# holds buffer_size bytes, through gzip or zstd if asked. The current file
+# is <prefix>-<date>-<time>-<number>.jsonl[.gz|.zst].part and is renamed
+# without .part once it is rotated (after max_bytes of JSON or max_seconds)
+# or closed, so whatever reads the directory only sees complete files.
+import os
+import gzip
+import json
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTENSIONS = {None: '.jsonl', 'gzip': '.jsonl.gz', 'zstd': '.jsonl.zst'}
+
+
+class JsonLinesWriter(object):
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, directory, prefix, compression=None, buffer_size=BUFFER_SIZE,
+                 max_bytes=None, max_seconds=None):
+        if compression not in EXTENSIONS:
+            raise ValueError('Unknown compression %r' % compression)
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        self.directory = directory
+        self.prefix = prefix
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.buffer = []
+        self.buffered = 0
+        self.file_number = 0
+        self.raw = None
+        self.stream = None
+        self.path = None
+        self.opened_at = None
+        self.written = 0
+        self.items = 0
+        self.files = []
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def open(self):
+        self.file_number += 1
+        name = '{}-{}-{}{}'.format(self.prefix, time.strftime('%Y%m%d-%H%M%S'), self.file_number,
+                                   EXTENSIONS[self.compression])
+        self.path = os.path.join(self.directory, name)
+        self.raw = open(self.path + '.part', 'wb')
+        if self.compression == 'gzip':
+            self.stream = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        elif self.compression == 'zstd':
+            self.stream = zstandard.ZstdCompressor(level=3).stream_writer(self.raw)
+        else:
+            self.stream = self.raw
+        self.opened_at = time.time()
+        self.written = 0
+
+    def write(self, item):
+        line = (json.dumps(item, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        self.buffer.append(line)
+        self.buffered += len(line)
+        self.items += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+        if self.stream is not None and self.max_seconds and time.time() - self.opened_at >= self.max_seconds:
+            self.rotate()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.stream is None:
+            self.open()
+        self.stream.write(b''.join(self.buffer))
+        self.written += self.buffered
+        self.buffer = []
+        self.buffered = 0
+        if self.max_bytes and self.written >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """
+        Finishes the current file, the next write starts a new one.
+        """
+        if self.buffer:
+            self.flush()
+        if self.stream is None:
+            return
+        if self.stream is not self.raw:
+            self.stream.close()
+        if not self.raw.closed:
+            self.raw.close()
+        os.replace(self.path + '.part', self.path)
+        self.files.append(self.path)
+        self.stream = self.raw = None
+
+    def close(self):
+        self.rotate()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# Helpers shared by the spiders to extract an ad from its page cheaply:
+# XPath expressions compiled once at import rather than at every call, and
+# structures used by several fields (breadcrumbs, parameter lists) parsed
+# once per response.
+import weakref
+import functools
+from lxml import etree
+
+# response -> {method name: result}, dropped along with the response
+_response_cache = weakref.WeakKeyDictionary()
+
+
+def per_response(method):
+    """
+    Caches the result of a spider method taking the response as its only
+    argument, for as long as the response lives.
+    """
+    @functools.wraps(method)
+    def wrapper(self, response):
+        cache = _response_cache.setdefault(response, {})
+        if method.__name__ not in cache:
+            cache[method.__name__] = method(self, response)
+        return cache[method.__name__]
+    return wrapper
+
+
+class XPath(object):
+    """
+    A precompiled XPath expression evaluated on the document of a response,
+    on a selector or on an lxml element, returning strings like
+    Selector.extract() does.
+    """
+
+    def __init__(self, query):
+        self.query = query
+        self.compiled = etree.XPath(query)
+
+    def __repr__(self):
+        return 'XPath({!r})'.format(self.query)
+
+    @staticmethod
+    def to_string(value):
+        if isinstance(value, etree._Element):
+            return etree.tostring(value, encoding='unicode', method='html', with_tail=False)
+        if isinstance(value, bool):
+            return '1' if value else '0'
+        return str(value)
+
+    @staticmethod
+    def element(node):
+        if isinstance(node, etree._Element):
+            return node
+        if hasattr(node, 'selector'):
+            return node.selector.root
+        return node.root
+
+    def __call__(self, node, **variables):
+        """
+        Returns the raw result of the expression: elements, strings or a
+        number. Keyword arguments are the values of its $variables.
+        """
+        return self.compiled(XPath.element(node), **variables)
+
+    def extract(self, node, **variables):
+        result = self(node, **variables)
+        if not isinstance(result, list):
+            return [XPath.to_string(result)]
+        return [XPath.to_string(x) for x in result]
+
+    def extract_first(self, node, default=None, **variables):
+        result = self(node, **variables)
+        if not isinstance(result, list):
+            return XPath.to_string(result)
+        return XPath.to_string(result[0]) if result else default
@@ -122,109 +122,115 @@ class AvitoscrapperDownloaderMiddleware(object):
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
-import re
 import random
-import base64
 import logging
+from .proxy_pool import ProxyPool, load_proxy_list, parse_proxy
+from .proxy_health import ProxyHealthStore
+from .proxy_sessions import WarmSessions
 
 log = logging.getLogger('scrapy.proxies')
 
 
 class Mode:
-    RANDOMIZE_PROXY_EVERY_REQUESTS, RANDOMIZE_PROXY_ONCE, SET_CUSTOM_PROXY = range(3)
+    RANDOMIZE_PROXY_EVERY_REQUESTS, RANDOMIZE_PROXY_ONCE, SET_CUSTOM_PROXY, ROTATE_WARM_SESSIONS = range(4)
 
 
 class RandomProxy(object):
     def __init__(self, settings):
         self.mode = settings.get('PROXY_MODE')
         self.proxy_list = settings.get('PROXY_LIST')
-        self.chosen_proxy = ''
+        self.failure_codes = set(int(x) for x in settings.getlist('RETRY_HTTP_CODES'))
+        self.chosen_proxy = None
+        self.sessions = None
 
-        if self.mode == Mode.RANDOMIZE_PROXY_EVERY_REQUESTS or self.mode == Mode.RANDOMIZE_PROXY_ONCE:
+        if self.mode in (Mode.RANDOMIZE_PROXY_EVERY_REQUESTS, Mode.RANDOMIZE_PROXY_ONCE, Mode.ROTATE_WARM_SESSIONS):
             if self.proxy_list is None:
                 raise KeyError('PROXY_LIST setting is missing')
-            self.proxies = {}
-            fin = open(self.proxy_list)
-            try:
-                for line in fin.readlines():
-                    parts = re.match('(\w+://)([^:]+?:[^@]+?@)?(.+)', line.strip())
-                    if not parts:
-                        continue
-
-                    # Cut trailing @
-                    if parts.group(2):
-                        user_pass = parts.group(2)[:-1]
-                    else:
-                        user_pass = ''
-
-                    self.proxies[parts.group(1) + parts.group(2) + parts.group(3)] = user_pass
-            finally:
-                fin.close()
-            if self.mode == Mode.RANDOMIZE_PROXY_ONCE:
-                self.chosen_proxy = random.choice(list(self.proxies.keys()))
+            self.pool = ProxyPool(load_proxy_list(self.proxy_list))
+            if self.mode == Mode.RANDOMIZE_PROXY_ONCE and len(self.pool) > 0:
+                self.chosen_proxy = random.randrange(len(self.pool))
+            if self.mode == Mode.ROTATE_WARM_SESSIONS:
+                self.sessions = WarmSessions(self.pool,
+                                             settings.getint('PROXY_WARM_SESSIONS', 16),
+                                             settings.getint('PROXY_SESSION_MAX_REQUESTS', 50),
+                                             settings.getfloat('PROXY_SESSION_MAX_AGE', 300))
         elif self.mode == Mode.SET_CUSTOM_PROXY:
-            custom_proxy = settings.get('CUSTOM_PROXY')
-            self.proxies = {}
-            parts = re.match('(\w+://)([^:]+?:[^@]+?@)?(.+)', custom_proxy.strip())
-            if not parts:
+            custom_proxy = parse_proxy(settings.get('CUSTOM_PROXY'))
+            if custom_proxy is None:
                 raise ValueError('CUSTOM_PROXY is not well formatted')
+            self.pool = ProxyPool([custom_proxy])
+            self.chosen_proxy = 0
 
-            if parts.group(2):
-                user_pass = parts.group(2)[:-1]
-            else:
-                user_pass = ''
-
-            self.proxies[parts.group(1) + parts.group(2) + parts.group(3)] = user_pass
-            self.chosen_proxy = parts.group(1) + parts.group(2) + parts.group(3)
+        self.health = None
+        health_db = settings.get('PROXY_HEALTH_DB')
+        if health_db and self.mode != Mode.SET_CUSTOM_PROXY:
+            self.health = ProxyHealthStore(health_db)
+            log.info('Proxy health restored for %d proxies, %d quarantined' % (
+                self.health.restore(self.pool), self.pool.quarantined_count()))
 
     @classmethod
     def from_crawler(cls, crawler):
-        return cls(crawler.settings)
+        obj = cls(crawler.settings)
+        crawler.signals.connect(obj.spider_closed, signal=signals.spider_closed)
+        return obj
+
+    def spider_closed(self, spider):
+        if self.health is not None:
+            self.health.close(self.pool)
 
     def process_request(self, request, spider):
         # Don't overwrite with a random one (server-side state for IP)
         if 'proxy' in request.meta:
-            if request.meta["exception"] is False:
+            if request.meta.get('exception') is False:
                 return
-        request.meta["exception"] = False
-        if len(self.proxies) == 0:
+        request.meta['exception'] = False
+        if self.pool.is_exhausted():
             raise ValueError('All proxies are unusable, cannot proceed')
 
         if self.mode == Mode.RANDOMIZE_PROXY_EVERY_REQUESTS:
-            proxy_address = random.choice(list(self.proxies.keys()))
+            proxy_id = self.pool.acquire()
+        elif self.mode == Mode.ROTATE_WARM_SESSIONS:
+            proxy_id = self.sessions.acquire()
         else:
-            proxy_address = self.chosen_proxy
-
-        parts = re.match('(\w+://)([^:]+?:[^@]+?@)?(.+)', proxy_address.strip())
-        if not parts:
-            raise ValueError('PROXY is not well formatted')
-
-        address = parts.group(1) + parts.group(3)
+            proxy_id = self.chosen_proxy
 
-        proxy_user_pass = self.proxies[proxy_address]
-
-        if proxy_user_pass:
-            request.meta['proxy'] = address
-            basic_auth = 'Basic ' + base64.b64encode(proxy_user_pass.encode()).decode()
-            request.headers['Proxy-Authorization'] = basic_auth
+        proxy = self.pool[proxy_id]
+        request.meta['proxy_id'] = proxy_id
+        if proxy.auth_header:
+            request.meta['proxy'] = proxy.address
+            request.headers['Proxy-Authorization'] = proxy.auth_header
         else:
             log.debug('Proxy user pass not found')
-        log.debug('Using proxy <%s>, %d proxies left' % (
-                proxy_address, len(self.proxies)))
+        log.debug('Using proxy <%s>, %d proxies left, %d quarantined' % (
+                proxy.url, len(self.pool), self.pool.quarantined_count()))
+
+    def process_response(self, request, response, spider):
+        proxy_id = request.meta.get('proxy_id')
+        if proxy_id is None:
+            return response
+        if response.status in self.failure_codes:
+            self.pool.record_failure(proxy_id)
+        else:
+            self.pool.record_success(proxy_id, request.meta.get('download_latency'))
+        if self.health is not None:
+            self.health.maybe_flush(self.pool)
+        return response
 
     def process_exception(self, request, exception, spider):
-        if 'proxy' not in request.meta:
+        if 'proxy_id' not in request.meta:
             print('Proxy not specified')
             return
         print('proxy is failed')
-        if self.mode == Mode.RANDOMIZE_PROXY_EVERY_REQUESTS or self.mode == Mode.RANDOMIZE_PROXY_ONCE:
-            proxy = request.meta['proxy']
-            try:
-                del self.proxies[proxy]
-            except KeyError:
-                pass
+        if self.mode != Mode.SET_CUSTOM_PROXY:
+            proxy_id = request.meta['proxy_id']
+            self.pool.record_failure(proxy_id)
+            self.pool.quarantine(proxy_id)
+            if self.sessions is not None:
+                self.sessions.retire(proxy_id)
             request.meta["exception"] = True
             if self.mode == Mode.RANDOMIZE_PROXY_ONCE:
-                self.chosen_proxy = random.choice(list(self.proxies.keys()))
-            log.info('Removing failed proxy <%s>, %d proxies left' % (
-                proxy, len(self.proxies)))
+                self.chosen_proxy = self.pool.acquire()
+            log.info('Quarantining failed proxy <%s>, %d proxies left, %d quarantined' % (
+                self.pool[proxy_id].url, len(self.pool), self.pool.quarantined_count()))
+            if self.health is not None:
+                self.health.maybe_flush(self.pool)
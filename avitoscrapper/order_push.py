@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+import json
+import gzip
+import time
+import logging
+import threading
+import collections
+import requests
+import requests.adapters
+
+log = logging.getLogger('avitoscrapper.push')
+
+
+class MemoryQueue(object):
+    """
+    Orders waiting to be pushed. A batch taken with get_batch() is in flight
+    until it is acknowledged, or put back at the front with nack().
+    """
+
+    def __init__(self):
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.in_flight = {}
+        self.next_token = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.items) + sum(len(x) for x in self.in_flight.values())
+
+    def put(self, item):
+        with self.condition:
+            self.items.append(item)
+            self.condition.notify()
+
+    def get_batch(self, max_size, timeout):
+        """
+        Waits up to timeout seconds for max_size items, returns
+        (token, items) with whatever is there then, or None if empty.
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            while len(self.items) < max_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            if not self.items:
+                return None
+            batch = [self.items.popleft() for _ in range(min(max_size, len(self.items)))]
+            self.next_token += 1
+            self.in_flight[self.next_token] = batch
+            return self.next_token, batch
+
+    def ack(self, token):
+        with self.condition:
+            self.in_flight.pop(token, None)
+
+    def nack(self, token, items=None):
+        """
+        Puts the batch back, or only the given items of it.
+        """
+        with self.condition:
+            batch = self.in_flight.pop(token, [])
+            self.items.extendleft(reversed(batch if items is None else items))
+            self.condition.notify()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+
+class OrderPusher(object):
+    """
+    Pushes orders to the remote API from background threads, so the caller
+    (the Twisted reactor thread of the crawl) never waits for the server.
+
+    Orders are sent in batches once batch_size of them are queued or
+    batch_interval seconds have passed. With a batch_url the whole batch is
+    one request ({'orders': [...]}), without it the orders of a batch are
+    posted one by one to push_url; either way over one keep-alive session
+    and optionally gzip-compressed. The number of batches in flight is
+    tuned by AIMD: +1/limit per request answered within target_latency,
+    halved on a slow answer or an error. Orders that could not be sent
+    after MAX_ATTEMPTS go back to the queue, which may be a durable
+    outbox.Outbox, rather than being dropped.
+    """
+    HEADERS = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+    MAX_ATTEMPTS = 5
+    RETRY_DELAY = 1.0
+
+    def __init__(self, push_url, batch_url=None, batch_size=50, batch_interval=5.0, use_gzip=False,
+                 max_concurrency=8, target_latency=1.0, queue=None, session=None):
+        self.push_url = push_url
+        self.batch_url = batch_url
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.use_gzip = use_gzip
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.queue = queue if queue is not None else MemoryQueue()
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=max_concurrency))
+            session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=max_concurrency))
+        self.session = session
+        self.limit = 1.0
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.running = False
+        self.dispatcher = None
+        self.stats = collections.Counter()
+        self.latencies = collections.deque(maxlen=10000)
+
+    def start(self):
+        self.running = True
+        self.dispatcher = threading.Thread(target=self.dispatch, name='order-pusher', daemon=True)
+        self.dispatcher.start()
+        return self
+
+    def push(self, order):
+        self.queue.put(order)
+
+    def close(self, timeout=60.0):
+        """
+        Sends what is still queued (waiting at most timeout seconds) and
+        stops the background threads.
+        """
+        deadline = time.time() + timeout
+        while len(self.queue) and time.time() < deadline:
+            time.sleep(0.05)
+        self.running = False
+        self.queue.wake()
+        if self.dispatcher is not None:
+            self.dispatcher.join(max(0.0, deadline - time.time()))
+        with self.condition:
+            while self.in_flight and time.time() < deadline:
+                self.condition.wait(deadline - time.time())
+        self.session.close()
+        log.info('Order pusher stopped: %s' % dict(self.stats))
+
+    def dispatch(self):
+        while self.running:
+            with self.condition:
+                while self.in_flight >= int(self.limit):
+                    self.condition.wait()
+            batch = self.queue.get_batch(self.batch_size, self.batch_interval)
+            if batch is None:
+                continue
+            with self.condition:
+                self.in_flight += 1
+            threading.Thread(target=self.send, args=batch, daemon=True).start()
+
+    def encode(self, data):
+        body = json.dumps(data).encode()
+        headers = dict(OrderPusher.HEADERS)
+        if self.use_gzip:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return body, headers
+
+    def post(self, url, data):
+        body, headers = self.encode(data)
+        start = time.time()
+        try:
+            response = self.session.post(url, data=body, headers=headers, timeout=60)
+        except requests.RequestException as e:
+            log.warning('Push to %s failed: %s' % (url, e))
+            return None, time.time() - start
+        return response, time.time() - start
+
+    def send_orders(self, orders):
+        """
+        Returns the orders that should be retried.
+        """
+        if self.batch_url:
+            requests_list = [(self.batch_url, {'orders': orders}, orders)]
+        else:
+            requests_list = [(self.push_url, {'order': x}, [x]) for x in orders]
+        failed = []
+        for url, data, sent in requests_list:
+            response, latency = self.post(url, data)
+            self.latencies.append(latency)
+            slow = latency > self.target_latency
+            if response is None or response.status_code >= 500 or response.status_code == 429:
+                self.adjust(False)
+                failed += sent
+                continue
+            self.adjust(not slow)
+            if response.ok:
+                self.count('pushed', len(sent))
+            else:
+                # The server refused the order itself, retrying won't help
+                self.count('rejected', len(sent))
+                log.warning('Push %s resulted with %s %s' % (url, response.status_code, response.text))
+        return failed
+
+    def send(self, token, orders):
+        try:
+            for attempt in range(OrderPusher.MAX_ATTEMPTS):
+                orders = self.send_orders(orders)
+                if not orders:
+                    self.queue.ack(token)
+                    return
+                self.count('retried', len(orders))
+                time.sleep(OrderPusher.RETRY_DELAY * 2 ** attempt)
+            # The API is likely down, keep the rest queued (across restarts
+            # with a durable queue) and let the next round try again
+            self.count('deferred', len(orders))
+            log.error('%d orders deferred after %d attempts' % (len(orders), OrderPusher.MAX_ATTEMPTS))
+            self.queue.nack(token, orders)
+        except Exception:
+            self.queue.nack(token)
+            raise
+        finally:
+            with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+    def count(self, key, value):
+        with self.condition:
+            self.stats[key] += value
+
+    def adjust(self, success):
+        with self.condition:
+            if success:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            else:
+                self.limit = max(1.0, self.limit / 2.0)
+            self.condition.notify_all()
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+# Disk-backed outbox of orders waiting to be pushed.
+#
+# Orders are appended to segment files (segment-<number>.log), every record
+# is a uint32 length, a uint32 crc32 and the JSON body, little-endian. The
+# cursor file holds the position (segment, offset) up to which everything
+# has been acknowledged; segments entirely behind it are deleted. On start,
+# delivery resumes from the cursor, so an order is sent at least once even
+# if the process dies between scraping and pushing it.
+#
+# A directory has a single writer: the outbox holds an exclusive lock on its
+# lock file while open, and a second one opened on it fails at once.
+import os
+import json
+import time
+import zlib
+import fcntl
+import struct
+import threading
+import collections
+
+RECORD_HEADER = struct.Struct('<II')
+SEGMENT_FORMAT = 'segment-{:012d}.log'
+CURSOR_FILE = 'cursor'
+LOCK_FILE = 'lock'
+
+
+class OutboxLocked(Exception):
+    pass
+
+
+class Outbox(object):
+    """
+    Same interface as order_push.MemoryQueue, backed by a write-ahead log.
+    Batches can be acknowledged in any order, the cursor only moves over
+    the acknowledged prefix.
+    """
+    SEGMENT_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, directory, segment_size=SEGMENT_SIZE, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync = fsync
+        self.condition = threading.Condition()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = self.acquire_lock()
+
+        self.committed = self.read_cursor()
+        segments = self.list_segments()
+        self.write_segment = segments[-1] if segments else self.committed[0]
+        self.truncate_tail(self.write_segment)
+        self.writer = open(self.segment_path(self.write_segment), 'ab')
+        # Next record to be read and the handle it is read from
+        self.read_position = self.committed
+        self.reader = None
+        # Batches handed out: token -> [start, end, items, acked]
+        self.pending = collections.OrderedDict()
+        # Nacked batches, served before anything new
+        self.retry = collections.deque()
+        self.next_token = 0
+        self.size = self.count_from(self.committed)
+        self.compact()
+
+    def acquire_lock(self):
+        lock = open(os.path.join(self.directory, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            lock.close()
+            raise OutboxLocked('Outbox {} is used by another process'.format(self.directory))
+        return lock
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, SEGMENT_FORMAT.format(segment))
+
+    def list_segments(self):
+        return sorted(int(x[8:-4]) for x in os.listdir(self.directory)
+                      if x.startswith('segment-') and x.endswith('.log'))
+
+    def read_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, OSError, ValueError):
+            segments = self.list_segments()
+            return (segments[0] if segments else 0), 0
+
+    def write_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write('{} {}'.format(*self.committed))
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def read_record(f):
+        header = f.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        length, crc = RECORD_HEADER.unpack(header)
+        body = f.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return None
+        return body
+
+    def truncate_tail(self, segment):
+        """
+        Drops a record half-written by a process killed in the middle of put().
+        """
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb+') as f:
+            valid = 0
+            while self.read_record(f) is not None:
+                valid = f.tell()
+            f.truncate(valid)
+
+    def count_from(self, position):
+        count = 0
+        segment, offset = position
+        while segment <= self.write_segment:
+            path = self.segment_path(segment)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    while self.read_record(f) is not None:
+                        count += 1
+            segment, offset = segment + 1, 0
+        return count
+
+    def __len__(self):
+        with self.condition:
+            return self.size
+
+    def put(self, item):
+        body = json.dumps(item).encode()
+        with self.condition:
+            if self.writer.tell() >= self.segment_size:
+                self.writer.close()
+                self.write_segment += 1
+                self.writer = open(self.segment_path(self.write_segment), 'ab')
+            self.writer.write(RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body)
+            self.writer.flush()
+            if self.fsync:
+                os.fsync(self.writer.fileno())
+            self.size += 1
+            self.condition.notify()
+
+    def read_next(self):
+        """
+        Returns the next unread record (its end position and the item) or None.
+        """
+        while True:
+            segment, offset = self.read_position
+            if self.reader is None or self.reader[0] != segment:
+                if self.reader is not None:
+                    self.reader[1].close()
+                path = self.segment_path(segment)
+                if not os.path.exists(path):
+                    if segment >= self.write_segment:
+                        self.reader = None
+                        return None
+                    self.read_position = (segment + 1, 0)
+                    continue
+                self.reader = (segment, open(path, 'rb'))
+            f = self.reader[1]
+            f.seek(offset)
+            body = self.read_record(f)
+            if body is not None:
+                self.read_position = (segment, f.tell())
+                return self.read_position, json.loads(body.decode())
+            if segment >= self.write_segment:
+                return None
+            self.read_position = (segment + 1, 0)
+
+    def get_batch(self, max_size, timeout):
+        deadline = time.time() + timeout
+        with self.condition:
+            while True:
+                if self.retry:
+                    token = self.retry.popleft()
+                    return token, self.pending[token][2]
+                unread = self.size - sum(len(x[2]) for x in self.pending.values())
+                if unread >= max_size or (unread and time.time() >= deadline):
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            start = self.read_position
+            items = []
+            end = start
+            while len(items) < max_size:
+                record = self.read_next()
+                if record is None:
+                    break
+                end, item = record
+                items.append(item)
+            if not items:
+                return None
+            self.next_token += 1
+            self.pending[self.next_token] = [start, end, items, False]
+            return self.next_token, items
+
+    def ack(self, token):
+        with self.condition:
+            if token not in self.pending:
+                return
+            self.pending[token][3] = True
+            moved = False
+            while self.pending:
+                first = next(iter(self.pending))
+                start, end, items, acked = self.pending[first]
+                if not acked:
+                    break
+                del self.pending[first]
+                self.committed = end
+                self.size -= len(items)
+                moved = True
+            if moved:
+                self.write_cursor()
+                self.compact()
+
+    def nack(self, token, items=None):
+        """
+        Schedules the batch, or only the given items of it, for another try.
+        After a restart the whole batch is delivered again.
+        """
+        with self.condition:
+            if token in self.pending:
+                if items is not None:
+                    self.size -= len(self.pending[token][2]) - len(items)
+                    self.pending[token][2] = items
+                self.retry.append(token)
+                self.condition.notify()
+
+    def wake(self):
+        with self.condition:
+            self.condition.notify_all()
+
+    def compact(self):
+        for segment in self.list_segments():
+            if segment >= min(self.committed[0], self.write_segment):
+                break
+            os.remove(self.segment_path(segment))
+
+    def close(self):
+        with self.condition:
+            self.writer.close()
+            if self.reader is not None:
+                self.reader[1].close()
+            # Closing the file releases the lock
+            self.lock.close()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# Decoder of the inline scripts bazarpnz.ru and i58.ru write the phone
+# numbers with, e.g.
+#
+#     document.write('<a href="tel:' + String.fromCharCode(56, 57) + '...">');
+#     var p = unescape('%38%39...'); document.write(p.split('').reverse().join(''));
+#
+# The scripts are evaluated by a small interpreter of the part of JavaScript
+# they use: var assignments, document.write, string and number literals,
+# '+', String.fromCharCode, unescape/decodeURI(Component), and the
+# split/reverse/join/concat/substring/replace/charAt/toString methods.
+# Anything else raises UnsupportedScript, so the caller can fall back to a
+# full JavaScript engine.
+import re
+import hashlib
+import collections
+from urllib.parse import unquote
+
+TOKEN = re.compile(r'''
+    \s+|//[^\n]*|/\*.*?\*/
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<number>0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<punct>[-+*(),;=.\[\]])
+''', re.X | re.S)
+ESCAPE = re.compile(r'''\\(x[0-9a-fA-F]{2}|u[0-9a-fA-F]{4}|u\{[0-9a-fA-F]+\}|[0-7]{1,3}|.)''', re.S)
+SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+PERCENT_UNICODE = re.compile(r'%u([0-9a-fA-F]{4})')
+PERCENT_BYTE = re.compile(r'%([0-9a-fA-F]{2})')
+
+
+class UnsupportedScript(Exception):
+    pass
+
+
+def unescape_string(body):
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == 'x':
+            return chr(int(escape[1:], 16))
+        if escape[0] == 'u':
+            return chr(int(escape[1:].strip('{}'), 16))
+        if escape in SIMPLE_ESCAPES:
+            return SIMPLE_ESCAPES[escape]
+        if escape.isdigit():
+            return chr(int(escape, 8))
+        # \' \" \\ \/ and line continuations
+        return '' if escape == '\n' else escape
+    return ESCAPE.sub(replace, body)
+
+
+def js_unescape(value):
+    # unescape() works on single bytes, unlike decodeURIComponent
+    value = PERCENT_UNICODE.sub(lambda x: chr(int(x.group(1), 16)), value)
+    return PERCENT_BYTE.sub(lambda x: chr(int(x.group(1), 16)), value)
+
+
+def tokenize(script):
+    tokens = []
+    position = 0
+    while position < len(script):
+        match = TOKEN.match(script, position)
+        if match is None:
+            raise UnsupportedScript('Unexpected {!r}'.format(script[position:position + 20]))
+        position = match.end()
+        kind = match.lastgroup
+        if kind is not None:
+            tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def to_string(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, list):
+        return ','.join(to_string(x) for x in value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Interpreter(object):
+    FUNCTIONS = {
+        'String.fromCharCode': lambda *codes: ''.join(chr(int(x)) for x in codes),
+        'unescape': lambda value: js_unescape(to_string(value)),
+        'decodeURIComponent': lambda value: unquote(to_string(value)),
+        'decodeURI': lambda value: unquote(to_string(value)),
+        'parseInt': lambda value, base=10: int(to_string(value).strip(), int(base)),
+    }
+
+    def __init__(self, script):
+        self.tokens = tokenize(script)
+        self.position = 0
+        self.variables = {}
+        self.output = None
+
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, value=None):
+        kind, token = self.peek()
+        if kind is None or (value is not None and token != value):
+            raise UnsupportedScript('Expected {!r}, got {!r}'.format(value, token))
+        self.position += 1
+        return kind, token
+
+    def accept(self, value):
+        if self.peek()[1] == value and self.peek()[0] == 'punct':
+            self.position += 1
+            return True
+        return False
+
+    def run(self):
+        while self.peek()[0] is not None:
+            if not self.accept(';'):
+                self.statement()
+        return self.output
+
+    def statement(self):
+        kind, token = self.peek()
+        if token == 'var':
+            self.take()
+            while True:
+                name = self.take()
+                if name[0] != 'name':
+                    raise UnsupportedScript('Expected a name, got {!r}'.format(name[1]))
+                self.variables[name[1]] = self.expression() if self.accept('=') else None
+                if not self.accept(','):
+                    break
+            return
+        if kind == 'name' and self.peek(1)[1] == '=':
+            self.take()
+            self.take('=')
+            self.variables[token] = self.expression()
+            return
+        if token == 'document' and self.peek(1)[1] == '.' and self.peek(2)[1] in ('write', 'writeln'):
+            self.position += 3
+            self.take('(')
+            self.output = to_string(self.expression())
+            self.take(')')
+            return
+        raise UnsupportedScript('Unsupported statement at {!r}'.format(token))
+
+    def expression(self):
+        value = self.term()
+        while True:
+            if self.accept('+'):
+                right = self.term()
+                if isinstance(value, (int, float)) and isinstance(right, (int, float)):
+                    value = value + right
+                else:
+                    value = to_string(value) + to_string(right)
+            elif self.accept('-'):
+                value = self.number(value) - self.number(self.term())
+            else:
+                return value
+
+    def term(self):
+        value = self.unary()
+        while True:
+            if self.accept('*'):
+                value = self.number(value) * self.number(self.unary())
+            else:
+                return value
+
+    @staticmethod
+    def number(value):
+        if isinstance(value, (int, float)):
+            return value
+        raise UnsupportedScript('Arithmetic on {!r}'.format(value))
+
+    def unary(self):
+        if self.accept('-'):
+            return -self.number(self.unary())
+        if self.accept('+'):
+            return self.number(self.unary())
+        return self.postfix(self.primary())
+
+    def arguments(self):
+        self.take('(')
+        values = []
+        if not self.accept(')'):
+            values.append(self.expression())
+            while self.accept(','):
+                values.append(self.expression())
+            self.take(')')
+        return values
+
+    def primary(self):
+        kind, token = self.take()
+        if kind == 'string':
+            return unescape_string(token[1:-1])
+        if kind == 'number':
+            return int(token, 16) if token[:2].lower() == '0x' else (float(token) if '.' in token else int(token))
+        if kind == 'punct' and token == '(':
+            value = self.expression()
+            self.take(')')
+            return value
+        if kind == 'punct' and token == '[':
+            values = []
+            if not self.accept(']'):
+                values.append(self.expression())
+                while self.accept(','):
+                    values.append(self.expression())
+                self.take(']')
+            return values
+        if kind == 'name':
+            if token == 'String' and self.peek()[1] == '.':
+                self.take('.')
+                token = 'String.' + self.take()[1]
+            if token in Interpreter.FUNCTIONS and self.peek()[1] == '(':
+                try:
+                    return Interpreter.FUNCTIONS[token](*self.arguments())
+                except (TypeError, ValueError) as e:
+                    raise UnsupportedScript('{}: {}'.format(token, e))
+            if token in self.variables:
+                return self.variables[token]
+        raise UnsupportedScript('Unsupported expression at {!r}'.format(token))
+
+    def postfix(self, value):
+        while True:
+            if self.accept('['):
+                index = self.expression()
+                self.take(']')
+                try:
+                    value = value[int(index)]
+                except (IndexError, TypeError, ValueError):
+                    raise UnsupportedScript('Bad index {!r}'.format(index))
+            elif self.accept('.'):
+                method = self.take()[1]
+                if method == 'length' and self.peek()[1] != '(':
+                    value = len(value)
+                    continue
+                value = self.call_method(value, method, self.arguments())
+            else:
+                return value
+
+    @staticmethod
+    def call_method(value, method, args):
+        if method == 'toString' and not args:
+            return to_string(value)
+        if isinstance(value, list):
+            if method == 'reverse' and not args:
+                return value[::-1]
+            if method == 'join':
+                return (to_string(args[0]) if args else ',').join(to_string(x) for x in value)
+            if method == 'concat':
+                return value + [y for x in args for y in (x if isinstance(x, list) else [x])]
+        if isinstance(value, str):
+            if method == 'split' and len(args) == 1:
+                separator = to_string(args[0])
+                return list(value) if separator == '' else value.split(separator)
+            if method == 'concat':
+                return value + ''.join(to_string(x) for x in args)
+            if method in ('substring', 'substr', 'slice') and args:
+                start = int(args[0])
+                if method == 'substr':
+                    return value[start:start + int(args[1])] if len(args) > 1 else value[start:]
+                if method == 'substring':
+                    end = int(args[1]) if len(args) > 1 else len(value)
+                    start, end = sorted((max(0, start), max(0, end)))
+                    return value[start:end]
+                return value[start:int(args[1])] if len(args) > 1 else value[start:]
+            if method == 'charAt' and len(args) == 1:
+                index = int(args[0])
+                return value[index] if 0 <= index < len(value) else ''
+            if method == 'replace' and len(args) == 2 and isinstance(args[0], str):
+                return value.replace(args[0], to_string(args[1]), 1)
+            if method in ('toLowerCase', 'toUpperCase') and not args:
+                return value.lower() if method == 'toLowerCase' else value.upper()
+        raise UnsupportedScript('Unsupported method {}'.format(method))
+
+
+def decode_script(script):
+    """
+    Returns what the script passes to document.write (the last call), or
+    raises UnsupportedScript.
+    """
+    try:
+        output = Interpreter(script).run()
+    except RecursionError:
+        raise UnsupportedScript('Script too deep')
+    except (TypeError, ValueError, IndexError, OverflowError) as e:
+        # Operations on values of types the interpreter does not model
+        raise UnsupportedScript('Unsupported operation: {!r}'.format(e))
+    if output is None:
+        raise UnsupportedScript('Nothing written')
+    return output
+
+
+class PhoneScriptDecoder(object):
+    """
+    decode_script with a fallback (e.g. a JavaScript engine) for the scripts
+    it does not understand, and a memo of the last MEMO_SIZE scripts by hash
+    since the same contact is often on many ads.
+    """
+    MEMO_SIZE = 10000
+
+    def __init__(self, fallback=None, memo_size=MEMO_SIZE):
+        self.fallback = fallback
+        self.memo_size = memo_size
+        self.memo = collections.OrderedDict()
+        self.stats = collections.Counter()
+
+    def decode(self, script):
+        key = hashlib.sha1(script.encode('utf-8')).digest()
+        if key in self.memo:
+            self.memo.move_to_end(key)
+            self.stats['memo'] += 1
+            return self.memo[key]
+        try:
+            output = decode_script(script)
+            self.stats['native'] += 1
+        except UnsupportedScript:
+            if self.fallback is None:
+                raise
+            output = self.fallback(script)
+            self.stats['fallback'] += 1
+        self.memo[key] = output
+        if len(self.memo) > self.memo_size:
+            self.memo.popitem(last=False)
+        return output
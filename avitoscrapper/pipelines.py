@@ -1,14 +1,21 @@
 # -*- coding: utf-8 -*-
 
+import os
 import json
-import codecs
 
 # Define your item pipelines here
 #
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://doc.scrapy.org/en/latest/topics/item-pipeline.html
 import requests
-from .config import RemoteServerSettings
+from .config import RemoteServerSettings, ExportSettings
+from .order_push import OrderPusher
+from .outbox import Outbox
+from .street_matcher import StreetMatcher, normalize_string
+from .category_index import CategoryIndex
+from .reference_cache import ReferenceCache
+from .export import JsonLinesWriter
+from .sharding import spider_file_name
 
 
 class AvitoscrapperPipeline(object):
@@ -37,15 +44,74 @@ class AvitoscrapperPipeline(object):
     }
 
     def __init__(self):
+        self.reference = AvitoscrapperPipeline.create_reference_cache()
         if RemoteServerSettings.GET_DISTRICT:
-            self.street_map = AvitoscrapperPipeline.get_street_map()
+            self.street_map = self.load_street_map()
+            self.street_matcher = StreetMatcher(self.street_map)
         else:
             self.street_map = None
-        cat_list = AvitoscrapperPipeline.get_categories()
+            self.street_matcher = None
+        cat_list = self.load_categories()
         print(cat_list)
-        self.categories = {}
-        for i in cat_list: 
-              self.categories[i['name']] = (i['id'], i['mapping'])
+        self.categories = CategoryIndex(cat_list, AvitoscrapperPipeline.category_map, self.create_category)
+        if self.reference is not None:
+            # Only once everything is built, the update callbacks replace it
+            if self.street_map is not None:
+                self.reference.revalidate('streets', RemoteServerSettings.GET_STREET_URL, self.update_street_map)
+            self.reference.revalidate('categories', AvitoscrapperPipeline.get_category_url, self.categories.update)
+        self.pusher = None
+
+    @staticmethod
+    def create_reference_cache():
+        if not RemoteServerSettings.REFERENCE_CACHE_DIR:
+            return None
+        return ReferenceCache(RemoteServerSettings.REFERENCE_CACHE_DIR, RemoteServerSettings.REFERENCE_CACHE_TTL)
+
+    def load_street_map(self):
+        if self.reference is None:
+            return AvitoscrapperPipeline.get_street_map()
+        objs = self.reference.get('streets', RemoteServerSettings.GET_STREET_URL)
+        return AvitoscrapperPipeline.build_street_map(objs)
+
+    def update_street_map(self, objs):
+        # Called from the revalidation thread, swap both at once
+        street_map = AvitoscrapperPipeline.build_street_map(objs)
+        self.street_map, self.street_matcher = street_map, StreetMatcher(street_map)
+
+    def load_categories(self):
+        if self.reference is None:
+            return AvitoscrapperPipeline.get_categories()
+        return self.reference.get('categories', AvitoscrapperPipeline.get_category_url)
+
+    def create_category(self, name):
+        result = AvitoscrapperPipeline.add_category(name)
+        if self.reference is not None:
+            self.reference.invalidate('categories')
+        return result
+
+    @staticmethod
+    def create_pusher(spider):
+        # An outbox per spider, the spiders of a process each having a
+        # pipeline, and per shard (outbox.shard-3/avito.ru)
+        outbox = None
+        if RemoteServerSettings.OUTBOX_DIR:
+            outbox = Outbox(os.path.join(spider_file_name(spider, RemoteServerSettings.OUTBOX_DIR), spider.name))
+        return OrderPusher(AvitoscrapperPipeline.push_url,
+                           batch_url=RemoteServerSettings.PUSH_BATCH_URL,
+                           batch_size=RemoteServerSettings.PUSH_BATCH_SIZE,
+                           batch_interval=RemoteServerSettings.PUSH_BATCH_INTERVAL,
+                           use_gzip=RemoteServerSettings.PUSH_GZIP,
+                           max_concurrency=RemoteServerSettings.PUSH_MAX_CONCURRENCY,
+                           target_latency=RemoteServerSettings.PUSH_TARGET_LATENCY,
+                           queue=outbox)
+
+    def open_spider(self, spider):
+        self.pusher = AvitoscrapperPipeline.create_pusher(spider).start()
+
+    def close_spider(self, spider):
+        self.pusher.close()
+        if isinstance(self.pusher.queue, Outbox):
+            self.pusher.queue.close()
 
     @staticmethod
     def get_street_map():
@@ -53,8 +119,11 @@ class AvitoscrapperPipeline(object):
         response = requests.get(url).text
         print(response)
         objs = json.loads(response)
-        map = dict((x['name'], x['district_id']) for x in objs)
-        return map
+        return AvitoscrapperPipeline.build_street_map(objs)
+
+    @staticmethod
+    def build_street_map(objs):
+        return dict((x['name'], x['district_id']) for x in objs)
 
     # noinspection PyMethodMayBeStatic
     def process_item(self, item, spider):
@@ -73,29 +142,12 @@ class AvitoscrapperPipeline(object):
             if 'district_id' in result:
                 print(result['district_id'])
 
-        category_found = False
-        for key in self.categories:
-            if key == item['category']:
-                result['category_id'] = self.categories[key][0]
-                category_found = True
-                break
-            raw_mapping = self.categories[key][1]
-            if not raw_mapping:
-                continue
-            mapping = raw_mapping.split("|")
-            if item['category'] in mapping:
-                result['category_id'] = self.categories[key][0]
-                category_found = True
-
-        if not category_found:
-            cat_result = AvitoscrapperPipeline.add_category(item['category'])
-            self.categories[item['category']] = (cat_result['id'], None)
-            result['category_id'] = self.categories[item['category']]
-
-        response = requests.post(AvitoscrapperPipeline.push_url,
-                                 data=json.dumps({'order': result}),
-                                 headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
-        print(response.content)
+        result['category_id'] = self.categories.resolve(item['category'])
+
+        self.pusher.push(result)
+        seen_ads = getattr(spider, 'seen_ads', None)
+        if seen_ads is not None:
+            seen_ads.mark(result['link'], result.get('cost'), result['placed_at'])
         return item
 
     @staticmethod
@@ -119,37 +171,36 @@ class AvitoscrapperPipeline(object):
         return result  
     @staticmethod
     def normalize_string(s):
-        if s is None:
-            return None
-        return s.lower().replace('ё', 'е')
+        return normalize_string(s)
 
     def get_district(self, item):
-        title = AvitoscrapperPipeline.normalize_string(item['title'] if 'title' in item else None)
-        address = AvitoscrapperPipeline.normalize_string(item['address'] if 'address' in item else None)
-        if title:
-            for key in self.street_map:
-                if key in title:
-                    item['district_id'] = self.street_map[key]
-                    return
-
-        if address:
-            for key in self.street_map:
-                if key in address:
-                    item['district_id'] = self.street_map[key]
-                    return
+        for key in ('title', 'address'):
+            district_id = self.street_matcher.find(item.get(key))
+            if district_id is not None:
+                item['district_id'] = district_id
+                return
         return
 
 
 class JsonWithEncodingPipeline(object):
+    """
+    Streams the items to rotated JSON lines files, see export.JsonLinesWriter.
+    """
+
     def __init__(self):
-        pass
+        self.writer = None
+
+    def open_spider(self, spider):
+        prefix = spider_file_name(spider, ExportSettings.PREFIX)
+        self.writer = JsonLinesWriter(ExportSettings.DIRECTORY, '{}-{}'.format(prefix, spider.name),
+                                      compression=ExportSettings.COMPRESSION,
+                                      buffer_size=ExportSettings.BUFFER_SIZE,
+                                      max_bytes=ExportSettings.MAX_BYTES,
+                                      max_seconds=ExportSettings.MAX_SECONDS)
 
     def process_item(self, item, spider):
-        file = codecs.open('scraped_data_utf8.json', 'w', encoding='utf-8')
-        line = json.dumps(dict(item), ensure_ascii=False) + "\n"
-        file.write(line)
-        file.close()
+        self.writer.write(dict(item))
         return item
 
-    def spider_closed(self, spider):
-        pass
+    def close_spider(self, spider):
+        self.writer.close()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import time
+import sqlite3
+
+
+class ProxyHealthStore(object):
+    """
+    Proxy health (see ProxyPool) persisted in SQLite, so that a new crawl
+    process starts with what the previous ones learned about dead and slow
+    proxies. The database is in WAL mode, several processes can read and
+    update it at once; changes are written in batches every FLUSH_INTERVAL
+    seconds rather than on every request.
+    """
+    FLUSH_INTERVAL = 30.0
+
+    def __init__(self, file_name, flush_interval=FLUSH_INTERVAL):
+        self.file_name = file_name
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.connection = sqlite3.connect(file_name, timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS proxy_health ('
+                                'url TEXT PRIMARY KEY, '
+                                'success_rate REAL NOT NULL, '
+                                'latency REAL NOT NULL, '
+                                'failures INTEGER NOT NULL, '
+                                'release_at REAL NOT NULL, '
+                                'updated_at REAL NOT NULL)')
+
+    def restore(self, pool):
+        """
+        Applies the stored health to the proxies of the pool, returns how
+        many proxies were known.
+        """
+        rows = self.connection.execute(
+            'SELECT url, success_rate, latency, failures, release_at FROM proxy_health').fetchall()
+        if not rows:
+            return 0
+        # A compiled index finds the urls without decoding all its records
+        find = getattr(pool.proxies, 'find', None)
+        if find is None:
+            find = dict((proxy.url, i) for i, proxy in enumerate(pool.proxies)).get
+        now = time.time()
+        restored = 0
+        for url, success_rate, latency, failures, release_at in rows:
+            proxy_id = find(url)
+            if proxy_id is None:
+                continue
+            pool.restore(proxy_id, success_rate, latency, failures, release_at, now)
+            restored += 1
+        # Nothing has changed compared to the store
+        pool.collect_dirty()
+        return restored
+
+    def maybe_flush(self, pool):
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush(pool)
+
+    def flush(self, pool):
+        self.last_flush = time.time()
+        dirty = pool.collect_dirty()
+        if not dirty:
+            return
+        rows = [(pool[i].url,) + pool.snapshot(i) + (self.last_flush,) for i in dirty]
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('INSERT OR REPLACE INTO proxy_health '
+                                        '(url, success_rate, latency, failures, release_at, updated_at) '
+                                        'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    def close(self, pool=None):
+        if pool is not None:
+            self.flush(pool)
+        self.connection.close()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+# Compiled proxy list.
+#
+# Parsing a 20k lines text list with regexes on every crawl start is wasted
+# work, so the list can be compiled once into a binary index and mmapped:
+#
+#     header   MAGIC, uint32 record count
+#     offsets  (count + 1) uint32 offsets of the records in the data section
+#     lookup   count (uint64 hash of the url, uint32 record) sorted by hash
+#     data     for every record: url \0 address \0 Proxy-Authorization value
+#
+# All integers are little-endian. Records are only decoded when accessed,
+# a url is found by a binary search of the lookup table (ProxyIndex.find).
+# Indexes written before the lookup table (MAGIC_V1) are still read.
+import os
+import mmap
+import struct
+import hashlib
+from .proxy_pool import Proxy
+
+MAGIC = b'PRXIDX02'
+MAGIC_V1 = b'PRXIDX01'
+HEADER = struct.Struct('<8sI')
+OFFSET = struct.Struct('<I')
+LOOKUP = struct.Struct('<QI')
+
+
+def url_hash(url):
+    return int.from_bytes(hashlib.md5(url.encode()).digest()[:8], 'little')
+
+
+def compile_proxies(proxies):
+    data = []
+    offsets = [0]
+    for proxy in proxies:
+        record = b'\0'.join(x.encode() for x in (proxy.url, proxy.address, proxy.auth_header or ''))
+        data.append(record)
+        offsets.append(offsets[-1] + len(record))
+    lookup = sorted((url_hash(proxy.url), i) for i, proxy in enumerate(proxies))
+    return b''.join([HEADER.pack(MAGIC, len(data)),
+                     struct.pack('<{}I'.format(len(offsets)), *offsets)] +
+                    [LOOKUP.pack(*x) for x in lookup] + data)
+
+
+def write_proxy_index(proxies, file_name):
+    tmp_name = file_name + '.tmp'
+    with open(tmp_name, 'wb') as f:
+        f.write(compile_proxies(proxies))
+    # Readers never see a half-written index
+    os.replace(tmp_name, file_name)
+
+
+class ProxyIndex(object):
+    def __init__(self, file_name):
+        with open(file_name, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.data, 0)
+        if magic not in (MAGIC, MAGIC_V1):
+            raise ValueError('{} is not a compiled proxy list'.format(file_name))
+        self.lookup = HEADER.size + OFFSET.size * (self.count + 1) if magic == MAGIC else None
+        self.base = HEADER.size + OFFSET.size * (self.count + 1)
+        if self.lookup is not None:
+            self.base += LOOKUP.size * self.count
+        # url -> record of an index without a lookup table, built on first use
+        self.ids = None
+
+    @staticmethod
+    def is_index(file_name):
+        with open(file_name, 'rb') as f:
+            return f.read(len(MAGIC)) in (MAGIC, MAGIC_V1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('Proxy index out of range')
+        start, end = struct.unpack_from('<II', self.data, HEADER.size + OFFSET.size * i)
+        url, address, auth_header = self.data[self.base + start:self.base + end].decode().split('\0')
+        return Proxy(url, address, auth_header or None)
+
+    def find(self, url):
+        """
+        The record of the proxy with this url, None if there is none.
+        """
+        if self.lookup is None:
+            if self.ids is None:
+                self.ids = dict((proxy.url, i) for i, proxy in enumerate(self))
+            return self.ids.get(url)
+        key = url_hash(url)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if LOOKUP.unpack_from(self.data, self.lookup + LOOKUP.size * middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        # Equal hashes are next to each other, the url tells them apart
+        while low < self.count:
+            found, i = LOOKUP.unpack_from(self.data, self.lookup + LOOKUP.size * low)
+            if found != key:
+                break
+            if self[i].url == url:
+                return i
+            low += 1
+        return None
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        self.data.close()
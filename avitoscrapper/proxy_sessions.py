@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import time
+from collections import deque
+
+
+class WarmSessions(object):
+    """
+    Rotates requests over a small set of proxy sessions (credentials) taken
+    from a ProxyPool.
+
+    All our proxies are sessions of the same superproxy host. Plain http
+    requests can share a keep-alive connection to it whatever the
+    credentials are, but an https request goes through a CONNECT tunnel
+    that is bound to the credentials it was opened with. Picking a random
+    proxy out of 20k for every request means a new TCP + TLS handshake
+    every time; going round-robin over a few warm sessions still switches
+    credentials on every request, while each one lands on a tunnel its
+    session has left open. A session is retired after max_requests uses or
+    max_age seconds and replaced by a fresh pick, so exits keep rotating.
+    """
+
+    def __init__(self, pool, size=16, max_requests=50, max_age=300.0):
+        self.pool = pool
+        self.size = size
+        self.max_requests = max_requests
+        self.max_age = max_age
+        # [proxy_id, requests served, started at]
+        self.sessions = deque()
+
+    def acquire(self, now=None):
+        now = time.time() if now is None else now
+        sessions = self.sessions
+        while sessions and not self.is_usable(sessions[0], now):
+            sessions.popleft()
+        # Bounded, the pool may return a proxy that is already in use
+        for _ in range(self.size * 4):
+            if len(sessions) >= self.size or len(self.pool) <= len(sessions):
+                break
+            proxy_id = self.pool.acquire(now)
+            if not any(x[0] == proxy_id for x in sessions):
+                sessions.append([proxy_id, 0, now])
+        if not sessions:
+            return self.pool.acquire(now)
+        session = sessions[0]
+        sessions.rotate(-1)
+        session[1] += 1
+        return session[0]
+
+    def is_usable(self, session, now):
+        if session[1] >= self.max_requests or now - session[2] >= self.max_age:
+            return False
+        # A quarantined proxy handed out as a probe gets its one request
+        return session[1] == 0 or self.pool.is_active(session[0])
+
+    def retire(self, proxy_id):
+        for session in self.sessions:
+            if session[0] == proxy_id:
+                self.sessions.remove(session)
+                return True
+        return False
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# Local copy of the reference data of the API (streets, categories).
+#
+# Every document is kept in <directory>/<name>.json along with its ETag and
+# Last-Modified. A cached copy is returned at once; when it is older than
+# the TTL it can be revalidated with a conditional GET in a background thread,
+# so a crawl never waits for the API unless there is no copy at all.
+import os
+import json
+import time
+import logging
+import threading
+import requests
+
+log = logging.getLogger('avitoscrapper.reference')
+
+
+class ReferenceCache(object):
+    HEADERS = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+    def __init__(self, directory, ttl=3600, timeout=30):
+        self.directory = directory
+        self.ttl = ttl
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.refreshing = set()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.json')
+
+    def load(self, name):
+        try:
+            with open(self.path(name), encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save(self, name, entry):
+        path = self.path(name)
+        with self.lock:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(path + '.tmp', path)
+
+    def get(self, name, url):
+        """
+        Returns the data of url, from the cache if there is a copy.
+        """
+        entry = self.load(name)
+        if entry is None:
+            entry = self.fetch(name, url, None)
+        return entry['data']
+
+    def revalidate(self, name, url, on_update=None):
+        """
+        Refreshes a copy older than the TTL in a background thread; if newer
+        data is found, on_update(data) is called with it from that thread.
+        """
+        entry = self.load(name)
+        if entry is None or time.time() - entry.get('fetched_at', 0) < self.ttl:
+            return None
+        return self.refresh_in_background(name, url, entry, on_update)
+
+    def invalidate(self, name):
+        """
+        Drops the copy, e.g. after a change made through the API, so the next
+        get() fetches it again.
+        """
+        try:
+            os.remove(self.path(name))
+        except OSError:
+            pass
+
+    def fetch(self, name, url, entry):
+        """
+        GETs url, conditionally if there is a cached entry. Returns the new
+        entry, or the cached one refreshed on 304 Not Modified.
+        """
+        headers = dict(ReferenceCache.HEADERS)
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = requests.get(url, headers=headers, timeout=self.timeout)
+        if entry is not None and response.status_code == 304:
+            entry = dict(entry, fetched_at=time.time())
+        else:
+            response.raise_for_status()
+            entry = {
+                'url': url,
+                'data': json.loads(response.text),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            }
+        self.save(name, entry)
+        return entry
+
+    def refresh_in_background(self, name, url, entry, on_update):
+        with self.lock:
+            if name in self.refreshing:
+                return
+            self.refreshing.add(name)
+        thread = threading.Thread(target=self.refresh, args=(name, url, entry, on_update),
+                                  name='reference-' + name, daemon=True)
+        thread.start()
+        return thread
+
+    def refresh(self, name, url, entry, on_update):
+        try:
+            fresh = self.fetch(name, url, entry)
+            if fresh['data'] != entry['data']:
+                log.info('Reference data %s changed' % name)
+                if on_update is not None:
+                    on_update(fresh['data'])
+        except Exception as e:
+            # The cached copy stays in use, it is revalidated at the next start
+            log.warning('Revalidation of %s failed: %s' % (name, e))
+        finally:
+            with self.lock:
+                self.refreshing.discard(name)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# Record and replay of the responses of a crawl, to run the whole Scrapy
+# stack (proxies, retries, spiders, pipelines) offline and at full speed
+# for load tests:
+#
+#   - with ReplaySettings.MODE = 'record' RecordResponses keeps every
+#     response of a real crawl in the ResponseArchive,
+#   - with MODE = 'replay' ReplayDownloadHandler serves the requests from
+#     the archive instead of the network, after a synthetic latency.
+#
+# Responses are looked up by the fingerprint of their request (method, URL
+# and body), so a replay is deterministic whatever the proxy or user agent
+# of the requests.
+import zlib
+import json
+import time
+import random
+import sqlite3
+from twisted.internet import defer
+from twisted.internet.task import deferLater
+from scrapy import signals
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+
+def request_key(request, crawler=None):
+    """
+    The fingerprint of the request, as a hex string.
+    """
+    fingerprinter = getattr(crawler, 'request_fingerprinter', None)
+    if fingerprinter is not None:
+        return fingerprinter.fingerprint(request).hex()
+    try:
+        from scrapy.utils.request import fingerprint
+    except ImportError:
+        from scrapy.utils.request import request_fingerprint
+        return request_fingerprint(request)
+    return fingerprint(request).hex()
+
+
+class ResponseArchive(object):
+    """
+    Responses by request fingerprint in SQLite, the bodies compressed with
+    zlib. Written in batches of BATCH_SIZE responses.
+
+    A successful response (below 400) is never replaced by a failed one, so
+    the archive keeps the response a request finally got after its retries.
+    """
+    BATCH_SIZE = 100
+
+    def __init__(self, file_name, batch_size=BATCH_SIZE):
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.pending = []
+        self.connection = sqlite3.connect(file_name, timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                'fingerprint TEXT PRIMARY KEY, '
+                                'url TEXT NOT NULL, '
+                                'status INTEGER NOT NULL, '
+                                'headers TEXT NOT NULL, '
+                                'body BLOB NOT NULL, '
+                                'recorded_at REAL NOT NULL)')
+
+    def put(self, fingerprint, response):
+        headers = dict((k.decode('latin-1'), [x.decode('latin-1') for x in v])
+                       for k, v in response.headers.items())
+        self.pending.append((fingerprint, response.url, response.status, json.dumps(headers),
+                             zlib.compress(response.body), time.time()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        rows, self.pending = self.pending, []
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany(
+                'INSERT INTO responses (fingerprint, url, status, headers, body, recorded_at) '
+                'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(fingerprint) DO UPDATE SET '
+                'url = excluded.url, status = excluded.status, headers = excluded.headers, '
+                'body = excluded.body, recorded_at = excluded.recorded_at '
+                'WHERE excluded.status < 400 OR responses.status >= 400', rows)
+
+    def get(self, fingerprint):
+        """
+        (url, status, headers, body) of the response, None if not recorded.
+        """
+        row = self.connection.execute('SELECT url, status, headers, body FROM responses WHERE fingerprint = ?',
+                                      (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body = row
+        return url, status, Headers(json.loads(headers)), zlib.decompress(body)
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+def check_replay_handlers(settings):
+    """
+    Raises ValueError if REPLAY_MODE is 'replay' while http or https is not
+    served by ReplayDownloadHandler: the crawl would go to the sites.
+    """
+    if settings.get('REPLAY_MODE') != 'replay':
+        return
+    handlers = settings.getdict('DOWNLOAD_HANDLERS')
+    path = 'avitoscrapper.replay.ReplayDownloadHandler'
+    missing = [x for x in ('http', 'https') if handlers.get(x) not in (path, ReplayDownloadHandler)]
+    if missing:
+        raise ValueError('REPLAY_MODE is replay but DOWNLOAD_HANDLERS does not serve {} with {}; set '
+                         'ReplaySettings.MODE rather than -s REPLAY_MODE, settings.py then installs it'
+                         .format(' and '.join(missing), path))
+
+
+class RecordResponses(object):
+    """
+    Downloader middleware keeping the responses in the archive. Installed
+    next to the downloader, it records them as received, before the other
+    middlewares look at them. Loaded for every crawl, it also stops a replay
+    the download handlers would not serve (check_replay_handlers).
+    """
+
+    def __init__(self, archive, crawler):
+        self.archive = archive
+        self.crawler = crawler
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        check_replay_handlers(crawler.settings)
+        if crawler.settings.get('REPLAY_MODE') != 'record':
+            raise NotConfigured
+        obj = cls(ResponseArchive(crawler.settings.get('REPLAY_ARCHIVE')), crawler)
+        crawler.signals.connect(obj.spider_closed, signal=signals.spider_closed)
+        return obj
+
+    def spider_closed(self, spider):
+        self.archive.close()
+
+    def process_response(self, request, response, spider):
+        self.archive.put(request_key(request, self.crawler), response)
+        self.crawler.stats.inc_value('replay/recorded')
+        return response
+
+
+class ReplayDownloadHandler(object):
+    """
+    Download handler for http and https answering from the archive. Each
+    response comes after LATENCY seconds, give or take JITTER, drawn from a
+    random generator seeded with SEED so runs are repeatable. Requests not
+    in the archive are dropped (IgnoreRequest), counted in replay/missing.
+    """
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        self.crawler = crawler
+        self.archive = ResponseArchive(settings.get('REPLAY_ARCHIVE'))
+        self.latency = settings.getfloat('REPLAY_LATENCY', 0.0)
+        self.jitter = settings.getfloat('REPLAY_LATENCY_JITTER', 0.0)
+        self.random = random.Random(settings.getint('REPLAY_SEED', 0))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def delay(self):
+        if self.jitter:
+            return max(0.0, self.random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+        return self.latency
+
+    def download_request(self, request, spider):
+        delay = self.delay()
+        if delay > 0:
+            from twisted.internet import reactor
+            return deferLater(reactor, delay, self.respond, request)
+        return defer.maybeDeferred(self.respond, request)
+
+    def respond(self, request):
+        stats = self.crawler.stats if self.crawler is not None else None
+        found = self.archive.get(request_key(request, self.crawler))
+        if found is None:
+            if stats is not None:
+                stats.inc_value('replay/missing')
+            raise IgnoreRequest('Not in the replay archive: {}'.format(request.url))
+        url, status, headers, body = found
+        if stats is not None:
+            stats.inc_value('replay/hit')
+        response_class = responsetypes.from_args(headers=headers, url=url, body=body)
+        return response_class(url=request.url, status=status, headers=headers, body=body, request=request)
+
+    def close(self):
+        self.archive.close()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+import re
+import time
+import sqlite3
+from urllib.parse import urlsplit
+
+AD_NUMBER = re.compile(r'(\d+)/?$')
+NOT_DIGIT = re.compile(r'\D')
+
+
+def canonical_ad_id(url):
+    """
+    'avito.ru:1238892161' for https://m.avito.ru/penza/doma/dom_42_m_1238892161,
+    the site and the number ending the path, so the desktop and mobile pages,
+    query strings and fragments of an ad give the same id. None if the path
+    does not end with a number.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url)
+    number = AD_NUMBER.search(parts.path)
+    if number is None:
+        return None
+    host = parts.netloc.lower().split(':')[0]
+    for prefix in ('www.', 'm.'):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    # Subdomains are cities (penza.cian.ru), the ad number is unique per site
+    host = '.'.join(host.split('.')[-2:])
+    return '{}:{}'.format(host, number.group(1))
+
+
+def ad_number(ad_id):
+    """
+    1238892161 for 'avito.ru:1238892161', None for None.
+    """
+    if ad_id is None:
+        return None
+    return int(ad_id.rpartition(':')[2])
+
+
+def normalize_price(price):
+    if price is None:
+        return None
+    digits = NOT_DIGIT.sub('', str(price))
+    return digits or None
+
+
+class SeenAds(object):
+    """
+    Ads already scraped, by canonical id, with the price and date they had
+    then. The spiders consult it on the listing pages and only follow the
+    ads which are new, changed price, or were last fetched more than max_age
+    seconds ago; the pipeline marks every scraped ad. Marks are written in
+    batches every FLUSH_INTERVAL seconds, the database is in WAL mode so
+    the crawl processes can share it.
+
+    It also keeps a watermark per seed (a listing sorted newest first): the
+    newest ad, by ad number, of its first page in the last run that went
+    through the whole pagination. The listing can stop paginating at a page
+    holding only known ads or ads not newer than that watermark, the rest
+    was scraped before. Comparing numbers rather than looking for the
+    watermark itself keeps an old ad bumped to the top of the listing from
+    stopping the pagination there.
+
+    The watermark of a run is only a candidate until the spider reports the
+    pagination of its seed complete (complete_seed()) and the crawl finished
+    (commit_watermarks()): an interrupted run must not hide the pages it did
+    not get to from the next one.
+    """
+    FLUSH_INTERVAL = 10.0
+
+    def __init__(self, file_name, max_age=None, flush_interval=FLUSH_INTERVAL):
+        self.file_name = file_name
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.last_flush = time.time()
+        self.pending = {}
+        self.connection = sqlite3.connect(file_name, timeout=30, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS seen_ads ('
+                                'ad_id TEXT PRIMARY KEY, '
+                                'price TEXT, '
+                                'placed_at TEXT, '
+                                'seen_at REAL NOT NULL)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS seed_watermarks ('
+                                'seed TEXT PRIMARY KEY, '
+                                'ad_id TEXT NOT NULL, '
+                                'updated_at REAL NOT NULL)')
+        # As left by the previous run, new watermarks only go to the database
+        self.watermarks = dict(self.connection.execute('SELECT seed, ad_id FROM seed_watermarks'))
+        # seed -> watermark of this run, from its first page / once its pagination is complete
+        self.candidates = {}
+        self.completed = {}
+
+    def get(self, ad_id):
+        """
+        Returns (price, placed_at, seen_at) of the ad or None.
+        """
+        if ad_id in self.pending:
+            return self.pending[ad_id]
+        return self.connection.execute('SELECT price, placed_at, seen_at FROM seen_ads WHERE ad_id = ?',
+                                       (ad_id,)).fetchone()
+
+    def is_unchanged(self, url, price=None, placed_at=None):
+        """
+        True if the ad at url was scraped already and, as far as the listing
+        tells (price and date, when given), has not changed since.
+        """
+        ad_id = canonical_ad_id(url)
+        if ad_id is None:
+            return False
+        seen = self.get(ad_id)
+        if seen is None:
+            return False
+        seen_price, seen_placed_at, seen_at = seen
+        if self.max_age is not None and time.time() - seen_at >= self.max_age:
+            return False
+        price = normalize_price(price)
+        if price is not None and price != seen_price:
+            return False
+        if placed_at is not None and str(placed_at) != seen_placed_at:
+            return False
+        return True
+
+    def is_known(self, url):
+        ad_id = canonical_ad_id(url)
+        return ad_id is not None and self.get(ad_id) is not None
+
+    def is_page_known(self, seed, urls):
+        """
+        True if the listing page of seed with the ads at urls holds nothing
+        newer than the previous run: every ad on it is known or not newer
+        than the watermark of that run.
+        """
+        if not urls:
+            return False
+        watermark = ad_number(self.watermarks.get(seed))
+        for url in urls:
+            number = ad_number(canonical_ad_id(url))
+            if watermark is not None and number is not None and number <= watermark:
+                continue
+            if not self.is_known(url):
+                return False
+        return True
+
+    def propose_watermark(self, seed, urls):
+        """
+        Takes the newest of the ads at urls, on the first page of seed, as
+        its watermark once the pagination of seed is complete.
+        """
+        ad_ids = [x for x in (canonical_ad_id(x) for x in urls) if x is not None]
+        if ad_ids:
+            self.candidates[seed] = max(ad_ids, key=ad_number)
+
+    def complete_seed(self, seed):
+        """
+        The pagination of seed went down to its last page or to a known page.
+        """
+        if seed in self.candidates:
+            self.completed[seed] = self.candidates.pop(seed)
+
+    def commit_watermarks(self):
+        """
+        Writes the watermarks of the completed seeds, once their ads have
+        been scraped (at the end of the crawl).
+        """
+        if not self.completed:
+            return
+        now = time.time()
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO seed_watermarks (seed, ad_id, updated_at) '
+                                        'VALUES (?, ?, ?)', [(k, v, now) for k, v in self.completed.items()])
+        self.completed = {}
+
+    def mark(self, url, price=None, placed_at=None):
+        ad_id = canonical_ad_id(url)
+        if ad_id is None:
+            return
+        self.pending[ad_id] = (normalize_price(price), None if placed_at is None else str(placed_at), time.time())
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.time()
+        if not self.pending:
+            return
+        rows = [(ad_id,) + values for ad_id, values in self.pending.items()]
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany('INSERT OR REPLACE INTO seen_ads (ad_id, price, placed_at, seen_at) '
+                                        'VALUES (?, ?, ?, ?)', rows)
+        self.pending = {}
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -8,7 +8,7 @@
 #     https://doc.scrapy.org/en/latest/topics/settings.html
 #     https://doc.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://doc.scrapy.org/en/latest/topics/spider-middleware.html
-from .config import ProxySettings
+from .config import ProxySettings, ReplaySettings
 BOT_NAME = 'avitoscrapper'
 
 SPIDER_MODULES = ['avitoscrapper.spiders']
@@ -18,17 +18,40 @@ RETRY_TIMES = 10
 # Retry on most error codes since proxies fail for different reasons
 RETRY_HTTP_CODES = [500, 503, 504, 400, 403, 404, 408]
 PROXY_LIST = ProxySettings.PROXY_LIST
+PROXY_HEALTH_DB = ProxySettings.HEALTH_DB
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.useragent.UserAgentMiddleware': 1,
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': 90,
     'avitoscrapper.middlewares.RandomProxy': 1000,
     'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 110,
     'scrapy_fake_useragent.middleware.RandomUserAgentMiddleware': 400,
+    # Next to the downloader, records the responses as they come
+    'avitoscrapper.replay.RecordResponses': 1100,
 }
+# 0 - random proxy per request, 1 - one random proxy, 2 - CUSTOM_PROXY,
+# 3 - rotate over a few warm sessions to reuse superproxy connections
 PROXY_MODE = 0
+PROXY_WARM_SESSIONS = 16
+PROXY_SESSION_MAX_REQUESTS = 50
+PROXY_SESSION_MAX_AGE = 300
+# Record the responses of a crawl, or replay a crawl from them (see replay.py).
+# A replay is set with ReplaySettings.MODE, which installs its download
+# handlers here; -s REPLAY_MODE=replay without them is refused
+REPLAY_MODE = ReplaySettings.MODE
+REPLAY_ARCHIVE = ReplaySettings.ARCHIVE
+REPLAY_LATENCY = ReplaySettings.LATENCY
+REPLAY_LATENCY_JITTER = ReplaySettings.LATENCY_JITTER
+REPLAY_SEED = ReplaySettings.SEED
+if REPLAY_MODE == 'replay':
+    DOWNLOAD_HANDLERS = {
+        'http': 'avitoscrapper.replay.ReplayDownloadHandler',
+        'https': 'avitoscrapper.replay.ReplayDownloadHandler',
+    }
 
 FEED_FORMAT = 'json'
-FEED_URI = 'output.json'
+# output.shard-3.json for shard 3 of a sharded crawl, see sharding.py
+FEED_URI = 'output%(shard_suffix)s.json'
+FEED_URI_PARAMS = 'avitoscrapper.sharding.feed_uri_params'
 FEED_EXPORT_ENCODING = 'utf-8'
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 #USER_AGENT = 'Real Estate Spider [Hi :3]'
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Sharding of a crawl over processes and machines. The seeds of a spider, a
+# listing per city and category ('penza/kvartiry'), are placed on a
+# consistent hash ring: a seed is always crawled by the same shard, and
+# going from N to N + 1 shards only moves about 1/(N + 1) of them, so the
+# state a shard keeps (seen ads, watermarks) mostly stays with its seeds.
+#
+# A shard runs as its own process with its own files (Shard.file_name, used
+# by the spider and the pipelines through spider_file_name() and by the feed
+# through feed_uri_params()), the proxy health only being shared; their
+# stats are merged by merge_stats().
+import os
+import json
+import bisect
+import hashlib
+import datetime
+from urllib.parse import urlsplit
+from .config import ShardSettings
+
+
+def stable_hash(key):
+    """
+    64 bits of the MD5 of the key, the same in every process (unlike hash()).
+    """
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+def seed_key(url):
+    """
+    'penza/kvartiry' for https://www.avito.ru/penza/kvartiry?view=list&s=104
+    """
+    return urlsplit(url).path.strip('/')
+
+
+class HashRing(object):
+    """
+    virtual_nodes points per shard on a ring of 64-bit hashes, a key going
+    to the shard of the first point after its hash.
+    """
+
+    def __init__(self, count, virtual_nodes=ShardSettings.VIRTUAL_NODES):
+        points = sorted((stable_hash('shard-{}#{}'.format(shard, i)), shard)
+                        for shard in range(count) for i in range(virtual_nodes))
+        self.count = count
+        self.hashes = [x[0] for x in points]
+        self.shards = [x[1] for x in points]
+
+    def shard_of(self, key):
+        i = bisect.bisect(self.hashes, stable_hash(key))
+        return self.shards[i % len(self.shards)]
+
+
+class Shard(object):
+    """
+    Shard index of count, owning the seeds the ring places on it.
+    """
+
+    def __init__(self, index, count, virtual_nodes=ShardSettings.VIRTUAL_NODES):
+        if not 0 <= index < count:
+            raise ValueError('Shard {} of {} does not exist'.format(index, count))
+        self.index = index
+        self.count = count
+        self.ring = HashRing(count, virtual_nodes)
+
+    @classmethod
+    def from_args(cls, shard, shards):
+        """
+        The shard of the spider arguments (strings with scrapy crawl -a),
+        None when the crawl is not sharded.
+        """
+        if shard is None:
+            return None
+        return cls(int(shard), int(shards if shards is not None else ShardSettings.COUNT))
+
+    def owns(self, url):
+        return self.ring.shard_of(seed_key(url)) == self.index
+
+    def seeds(self, urls):
+        return [x for x in urls if self.owns(x)]
+
+    def suffix(self):
+        """
+        '.shard-3', '' for a single shard.
+        """
+        return '' if self.count == 1 else '.shard-{}'.format(self.index)
+
+    def file_name(self, file_name):
+        """
+        'seen_ads.shard-3.sqlite' for 'seen_ads.sqlite', 'outbox.shard-3'
+        for 'outbox'; unchanged for a single shard.
+        """
+        if file_name is None:
+            return file_name
+        root, extension = os.path.splitext(file_name)
+        return root + self.suffix() + extension
+
+    def __str__(self):
+        return '{}/{}'.format(self.index, self.count)
+
+
+def spider_file_name(spider, file_name):
+    """
+    The file of the shard the spider crawls, file_name if it is not sharded.
+    """
+    shard = getattr(spider, 'shard', None)
+    return shard.file_name(file_name) if shard is not None else file_name
+
+
+def feed_uri_params(params, spider):
+    """
+    FEED_URI_PARAMS: %(shard_suffix)s is '.shard-3' in the feed of shard 3,
+    empty when the crawl is not sharded.
+    """
+    shard = getattr(spider, 'shard', None)
+    params['shard_suffix'] = shard.suffix() if shard is not None else ''
+    return params
+
+
+def plan(urls, count, virtual_nodes=ShardSettings.VIRTUAL_NODES):
+    """
+    shard -> seeds it owns, for all the shards.
+    """
+    ring = HashRing(count, virtual_nodes)
+    result = dict((x, []) for x in range(count))
+    for url in urls:
+        result[ring.shard_of(seed_key(url))].append(url)
+    return result
+
+
+def dump_stats(stats, file_name):
+    directory = os.path.dirname(file_name)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(file_name + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(dict((k, v.isoformat() if isinstance(v, datetime.datetime) else v) for k, v in stats.items()),
+                  f, indent=4, sort_keys=True)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def merge_stats(shard_stats):
+    """
+    The stats of the whole crawl from those of its shards: counters are
+    summed, except the maxima (memusage/max, request_depth_max,
+    elapsed_time_seconds), the start and finish times are the earliest and
+    latest, the finish reasons are counted.
+    """
+    result = {}
+    reasons = {}
+    for stats in shard_stats:
+        for key, value in stats.items():
+            if key == 'finish_reason':
+                reasons[value] = reasons.get(value, 0) + 1
+            elif key == 'start_time':
+                result[key] = min(result.get(key, value), value)
+            elif key in ('finish_time', 'elapsed_time_seconds') or key.endswith(('/max', '_max')):
+                result[key] = max(result.get(key, value), value)
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                result[key] = result.get(key, 0) + value
+    if reasons:
+        result['finish_reason'] = reasons
+    result['shards'] = len(shard_stats)
+    return result
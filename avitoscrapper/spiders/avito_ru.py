@@ -1,12 +1,19 @@
 # -*- coding: utf-8 -*-
 import scrapy
 import datetime
+import functools
 import re
-from ..config import AvitoSettings
+from w3lib.url import add_or_replace_parameter, url_query_parameter
+from ..config import AvitoSettings, SeenAdsSettings
 from scrapy.loader import ItemLoader
 from ..items import Ad
-from ..order_types import OrderTypes, month_format
+from ..order_types import OrderTypes
+from ..date_parser import parse_date
 from ..logger import Logger
+from ..seen_ads import SeenAds
+from ..extraction import XPath, per_response
+from ..avito_state import extract_ad
+from ..sharding import Shard, spider_file_name
 
 
 class AvitoRuSpider(scrapy.Spider):
@@ -15,59 +22,111 @@ class AvitoRuSpider(scrapy.Spider):
     USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/70.0.3538.77 Chrome/70.0.3538.77 Safari/537.36'
     MOBILE_USER_AGENT = "Mozilla/5.0 (Linux; U; Android 2.2) AppleWebKit/533.1 (KHTML, like Gecko) Version/4.0 Mobile Safari/533.1"
     item_selector = '//div[contains(@class, \'item_table clearfix js-catalog-item-enum\')]'
-    date_regex = re.compile(r"размещено\s*(\d+\s*\w+|сегодня|вчера)", re.I)
-    time_regex = re.compile(r"\d\d:\d\d")
+    # Category of the URL (/penza/<category>/...) as named on the desktop breadcrumbs
+    URL_CATEGORIES = {
+        'kvartiry': 'Квартиры',
+        'komnaty': 'Комнаты',
+        'doma_dachi_kottedzhi': 'Дома, дачи, коттеджи',
+        'zemelnye_uchastki': 'Земельные участки',
+        'garazhi_i_mashinomesta': 'Гаражи и машиноместа',
+        'kommercheskaya_nedvizhimost': 'Коммерческая недвижимость',
+    }
+    phone_regex = re.compile(r'tel:([\d\+ -]+)', re.I)
+    number_regex = re.compile(r'\d+')
+    not_digit_regex = re.compile(r'\D')
+
+    LISTING_ITEMS = XPath(item_selector)
+    LISTING_URL = XPath('.//a[contains(@class, \'description-title-link\')]/@href')
+    LISTING_COST = XPath('.//*[@itemprop=\'price\']/@content')
+    NEXT_PAGE = XPath('//a[contains(@class,\'js-pagination-next\')]/@href')
+    PAGES = XPath('//a[contains(@class, \'pagination-page\')]/@href')
+    RESULT_COUNT = XPath("//span[contains(@class, 'page-title-count')]/text() | "
+                         "//span[@data-marker='page-title/count']/text()")
+    TITLE = XPath('//span[contains(@class, \'title-info-title-text\')]/text()')
+    ADDRESS = XPath('//span[contains(@class, \'item-map-address\')]/span/text()')
+    DESCRIPTION = XPath('//div[contains(@class, \'item-description\')]/p/text()')
+    PHONE = XPath("//a[contains(@data-marker, 'item-contact-bar/call')]/@href")
+    PARAMS = XPath('//li[contains(@class, \'item-params-list-item\')]')
+    PARAM_LABEL = XPath('./span/text()')
+    PARAM_VALUE = XPath('./text()')
+    CONTACT_NAME = XPath('(//div[@class = \'seller-info-name\']/a/text())[1]')
+    IMAGES = XPath('//div[contains(@class, \'gallery-img-frame\')]//@data-url')
+    COST = XPath('(//span[contains(@class, \'js-item-price\')])[1]/@content')
+    BREADCRUMBS = XPath("//a[contains(@class, 'js-breadcrumbs-link-interaction')]/text()")
+    METADATA = XPath("//div[contains(@class, 'title-info-metadata-item')]/text()")
+    CITY = XPath('//meta[@itemprop="addressLocality"]/@content')
+    MOBILE_ADDRESS = XPath("//span[@data-marker='delivery/location']/text()")
+    MOBILE_AGENT = XPath('//div[@class="_1qEI9"]//div[@class = "_1Jm7J"]/text()')
+    MOBILE_MARKED = XPath('//*[@data-marker]')
+    MOBILE_OG_TITLE = XPath("//meta[@property='og:title']/@content")
+    MOBILE_OG_IMAGE = XPath("//meta[@property='og:image']/@content")
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
         'DOWNLOAD_DELAY': 0
     }
 
-    def __init__(self):
-        scrapy.Spider.__init__(self)
+    def __init__(self, shard=None, shards=None, *args, **kwargs):
+        """
+        With shard and shards (scrapy crawl avito.ru -a shard=2 -a shards=8),
+        only the seeds of that shard are crawled, with the seen ads, outbox,
+        export and feed files of that shard, see sharding.py.
+        """
+        scrapy.Spider.__init__(self, *args, **kwargs)
         self.total_count = 0
-        self.current_depth = {x.format(k).split('?')[0]: 0
-                              for x in AvitoSettings.URL_FORMATS
-                              for k in AvitoSettings.LOCATION_PARTS
-                              }
+        self.shard = Shard.from_args(shard, shards)
+        self.current_depth = {x.split('?')[0]: 0 for x in self.seeds()}
+        seen_ads_db = spider_file_name(self, SeenAdsSettings.DB)
+        self.seen_ads = SeenAds(seen_ads_db, SeenAdsSettings.MAX_AGE) if seen_ads_db else None
+
+    def seeds(self):
+        urls = [x.format(loc) for x in AvitoSettings.URL_FORMATS for loc in AvitoSettings.LOCATION_PARTS]
+        return self.shard.seeds(urls) if self.shard is not None else urls
+
+    def closed(self, reason):
+        if self.seen_ads is not None:
+            if reason == 'finished':
+                self.seen_ads.commit_watermarks()
+            self.seen_ads.close()
 
     def start_requests(self):
-        return [
-            scrapy.Request(x.format(loc), dont_filter=True)
-            for x in AvitoSettings.URL_FORMATS
-            for loc in AvitoSettings.LOCATION_PARTS
-        ]
+        callback = self.parse_partition if AvitoSettings.PARTITION else self.parse
+        return [scrapy.Request(x, callback=callback, dont_filter=True, meta={'seed': x, 'page': 0})
+                for x in self.seeds()]
 
     # noinspection PyMethodMayBeStatic
-    def get_date_from_description(self, raw_data):
-        date = AvitoRuSpider.date_regex.findall(raw_data)
-        if not date:
-            return datetime.datetime.today()
-        first = date[0].lower()
-        if first == 'сегодня':
-            return datetime.datetime.today()
-        if first == 'вчера':
-            return datetime.date.today() - datetime.timedelta(1)
-        result = month_format(first)
-        return datetime.datetime.strptime(result, '%d %m %Y')
+    def get_date(self, raw_data):
+        """
+        The date of 'размещено 20 ноября в 12:30', '25 минут назад', ...,
+        today at midnight if there is none.
+        """
+        return parse_date(raw_data) or datetime.datetime.combine(datetime.date.today(), datetime.time())
 
     # noinspection PyMethodMayBeStatic
-    def get_time_from_description(self, raw_data):
-        time = AvitoRuSpider.time_regex.findall(raw_data)
-        if not time:
-            return datetime.timedelta(0, 0)
-        t = time[0].lower().split(':')
-        return datetime.timedelta(hours=int(t[0]), minutes=int(t[1]))
+    @per_response
+    def get_state(self, response):
+        """
+        The fields of the ad embedded in the page as JSON, {} without them.
+        """
+        return extract_ad(response.text) or {}
+
+    def from_state(self, response, field, getter):
+        """
+        The field from the embedded state of the page, else from the page
+        itself by getter(response), so the DOM is only built when needed.
+        """
+        value = self.get_state(response).get(field)
+        return value if value is not None else getter(response)
 
     # noinspection PyMethodMayBeStatic
     def get_ad_data_from_category(self, item):
         return {
-            'url': item.xpath('.//a[contains(@class, \'description-title-link\')]/@href').extract_first(),
+            'url': AvitoRuSpider.LISTING_URL.extract_first(item),
+            'cost': AvitoRuSpider.LISTING_COST.extract_first(item),
         }
 
     # noinspection PyMethodMayBeStatic
     def get_address(self, response):
-        district = response.xpath(
-            '//span[contains(@class, \'item-map-address\')]/span/text()').extract_first()
+        district = AvitoRuSpider.ADDRESS.extract_first(response)
         if district is None:
             return None
         # address = response.xpath(
@@ -76,24 +135,37 @@ class AvitoRuSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_description(self, response):
-        descriptions = response.xpath('//div[contains(@class, \'item-description\')]/p/text()').extract()
+        descriptions = AvitoRuSpider.DESCRIPTION.extract(response)
         return '\r\n'.join(descriptions)
 
     # noinspection PyMethodMayBeStatic
     def get_phone(self, response):
-        phone_raw = response.xpath("//a[contains(@data-marker, 'item-contact-bar/call')]/@href").extract_first()
-        reg = re.compile('tel:([\d\+ -]+)', re.I)
-        result = reg.findall(phone_raw)
+        phone_raw = AvitoRuSpider.PHONE.extract_first(response)
+        result = AvitoRuSpider.phone_regex.findall(phone_raw)
         return result[0] if result else None
 
+    # noinspection PyMethodMayBeStatic
+    @per_response
+    def get_params(self, response):
+        """
+        The parameter list of the page, {'Этаж': '5', 'Общая площадь': '54 м²', ...}.
+        """
+        if 'params' in self.get_state(response):
+            return self.get_state(response)['params']
+        params = {}
+        for item in AvitoRuSpider.PARAMS(response):
+            label = ''.join(AvitoRuSpider.PARAM_LABEL(item)).strip().rstrip(':').strip()
+            value = ' '.join(AvitoRuSpider.PARAM_VALUE(item)).strip()
+            if label and label not in params:
+                params[label] = value
+        return params
+
     # noinspection PyMethodMayBeStatic
     def get_room_count(self, response):
-        data = response.xpath('//li[contains(@class, \'item-params-list-item\')\
-         and contains(./span/text(), \'Количество комнат\')]/text()').extract()
+        data = self.get_params(response).get('Количество комнат')
         if data is None:
             return None
-        regexp = re.compile('\d+', re.I)
-        count_raw = regexp.findall(' '.join(data).strip())
+        count_raw = AvitoRuSpider.number_regex.findall(data)
         if not count_raw:
             return None
         count = int(count_raw[0])
@@ -103,48 +175,28 @@ class AvitoRuSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_total_square(self, response):
-        data = response.xpath('//li[contains(@class, \'item-params-list-item\')\
-         and contains(./span/text(), \'Общая площадь\')]/text()').extract()
-        if data is None:
-            return None
-        return ' '.join(data).strip()
+        return self.get_params(response).get('Общая площадь', '')
 
     # noinspection PyMethodMayBeStatic
     def get_floor(self, response):
-        data = response.xpath('//li[contains(@class, \'item-params-list-item\')\
-         and contains(./span/text(), \'Этаж:\')]/text()').extract()
-        if data is None:
-            return None
-        return ' '.join(data).strip()
+        return self.get_params(response).get('Этаж', '')
 
     # noinspection PyMethodMayBeStatic
     def get_floor_count(self, response):
-        data = response.xpath('//li[contains(@class, \'item-params-list-item\')\
-         and contains(./span/text(), \'Этажей в доме:\')]/text()').extract()
-        if data is None:
-            return None
-        return ' '.join(data).strip()
+        return self.get_params(response).get('Этажей в доме', '')
 
     # noinspection PyMethodMayBeStatic
     def get_contact_name(self, response):
-        data = response.xpath('(//div[@class = \'seller-info-name\']/a/text())[1]')
-        if data is None:
-            Logger.log('Warning', 'Contact name not found')
-            return None
-        result = data.extract_first()
+        result = AvitoRuSpider.CONTACT_NAME.extract_first(response)
         return result if result is not None else 'Неизвестно'
 
     # noinspection PyMethodMayBeStatic
     def get_image_list(self, response):
-        data = response.xpath('//div[contains(@class, \'gallery-img-frame\')]//@data-url')
-        if data is None:
-            Logger.log('Warning', 'Image list not found')
-            return None
-        return ["http:" + x for x in data.extract()]
+        return ["http:" + x for x in AvitoRuSpider.IMAGES.extract(response)]
 
     # noinspection PyMethodMayBeStatic
     def get_cost(self, response):
-        data = response.xpath('(//span[contains(@class, \'js-item-price\')])[1]/@content').extract_first()
+        data = AvitoRuSpider.COST.extract_first(response)
         if data is None:
             Logger.log('Warning', 'Price not found')
             return None
@@ -153,7 +205,7 @@ class AvitoRuSpider(scrapy.Spider):
     def get_category(self, response):
         data = self.get_room_count(response)
         if not data:
-            data = response.xpath("//a[contains(@class, 'js-breadcrumbs-link-interaction')]/text()").extract()
+            data = self.get_breadcrumbs(response)
             if data[2]:
                 return data[2]
             url = response.url.split('/')[4]
@@ -162,22 +214,25 @@ class AvitoRuSpider(scrapy.Spider):
             return 'Без категории'
         return data
 
+    # noinspection PyMethodMayBeStatic
+    @per_response
+    def get_breadcrumbs(self, response):
+        if 'breadcrumbs' in self.get_state(response):
+            return self.get_state(response)['breadcrumbs']
+        return AvitoRuSpider.BREADCRUMBS.extract(response)
+
     def is_new_building(self, response):
-        data = response.xpath("//a[contains(@class, 'js-breadcrumbs-link-interaction')]/text()").extract()
+        data = self.get_breadcrumbs(response)
         return data[-1] == 'Новостройки' if data else False
 
 
     # noinspection PyMethodMayBeStatic
     def get_ad_date(self, response):
-        raw_data = response.xpath("//div[contains(@class, 'title-info-metadata-item')]/text()").extract_first()
-        dt = self.get_date_from_description(raw_data)
-        time = self.get_time_from_description(raw_data)
-        return datetime.datetime(dt.year, dt.month, dt.day) + time
+        return self.get_date(AvitoRuSpider.METADATA.extract_first(response))
 
     # noinspection PyMethodMayBeStatic
     def get_order_type(self, response):
-        data = [x.lower() for x in response.xpath(
-            "//a[contains(@class, 'js-breadcrumbs-link-interaction')]/text()").extract()]
+        data = [x.lower() for x in self.get_breadcrumbs(response)]
         if not data:
             Logger.log('Warning', 'Order type is not found')
             return 0
@@ -193,69 +248,287 @@ class AvitoRuSpider(scrapy.Spider):
         return 0
 
     def get_city(self, response):
-        city = response.xpath('//meta[@itemprop="addressLocality"]/@content').extract_first()
+        city = AvitoRuSpider.CITY.extract_first(response)
         return city if city else "Неизвестно"
 
     def get_district(self, response):
+        return self.get_district_from_address(self.from_state(response, 'address', self.get_address))
+
+    # noinspection PyMethodMayBeStatic
+    def get_district_from_address(self, address):
         fallback_value = 'Неизвестно'
-        address = self.get_address(response)
         if address is None:
             return fallback_value
-        items = address.split(',')
-        for i in items:
-            if 'р-н' in items:
-                return i
+        for i in address.split(','):
+            if 'р-н' in i:
+                return i.strip()
         return fallback_value
 
     # noinspection PyMethodMayBeStatic
     def get_mobile_address(self, response):
-        raw_data = response.xpath("//span[@data-marker='delivery/location']/text()").extract_first()
+        if 'address' in self.get_state(response):
+            return self.get_state(response)['address']
+        raw_data = AvitoRuSpider.MOBILE_ADDRESS.extract_first(response)
         return raw_data
 
-    def parse_mobile(self, response):
-        ad_loader = response.meta['ad_loader']
-        ad_loader.add_value('phone', self.get_phone(response))
+    # noinspection PyMethodMayBeStatic
+    @per_response
+    def get_mobile_blocks(self, response):
+        """
+        The elements of the mobile page by data-marker, found in one pass.
+        """
+        blocks = {}
+        for element in AvitoRuSpider.MOBILE_MARKED(response):
+            blocks.setdefault(element.get('data-marker'), []).append(element)
+        return blocks
+
+    def get_mobile_texts(self, response, marker):
+        return [x for element in self.get_mobile_blocks(response).get(marker, []) for x in element.itertext()]
+
+    def get_mobile_text(self, response, marker):
+        """
+        The text of the first element with the marker, spaces normalized.
+        """
+        elements = self.get_mobile_blocks(response).get(marker)
+        return ' '.join(''.join(elements[0].itertext()).split()) if elements else ''
+
+    # noinspection PyMethodMayBeStatic
+    def get_mobile_params(self, response):
+        """
+        The parameters of the mobile page ('Этаж: 5', ...) as one text, a line each.
+        """
+        if 'params' in self.get_state(response):
+            return '\n'.join('{}: {}'.format(k, v) for k, v in self.get_state(response)['params'].items())
+        lists = self.get_mobile_blocks(response).get('item-properties/list', [])
+        lines = [' '.join(''.join(x.itertext()).split()) for element in lists for x in element.iter('li')]
+        return '\n'.join(x for x in lines if x)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def mobile_param_regex(name):
+        return re.compile(r'^' + re.escape(name) + r'\s*:?\s*(.+)$', re.M | re.I)
+
+    # noinspection PyMethodMayBeStatic
+    def get_mobile_param(self, params, name):
+        found = AvitoRuSpider.mobile_param_regex(name).search(params)
+        return found.group(1).strip() if found else None
+
+    def get_mobile_room_count(self, params):
+        raw = self.get_mobile_param(params, 'Количество комнат')
+        count_raw = AvitoRuSpider.number_regex.findall(raw) if raw else None
+        if not count_raw:
+            return None
+        count = int(count_raw[0])
+        return '1 комната' if count == 1 else \
+               '{} комнаты'.format(count) if 1 < count < 5 else \
+               '{} комнат'.format(count)
+
+    def get_mobile_category(self, response, params):
+        room_count = self.get_mobile_room_count(params)
+        if room_count:
+            return room_count
+        parts = response.url.split('/')
+        category = parts[4] if len(parts) > 4 else None
+        return AvitoRuSpider.URL_CATEGORIES.get(category, 'Без категории')
+
+    def get_mobile_title(self, response):
+        title = self.get_mobile_text(response, 'item-description/title')
+        return title or AvitoRuSpider.MOBILE_OG_TITLE.extract_first(response)
+
+    def get_mobile_description(self, response):
+        return '\r\n'.join(self.get_mobile_texts(response, 'item-description/text'))
+
+    def get_mobile_contact_name(self, response):
+        return self.get_mobile_text(response, 'seller-info/name') or 'Неизвестно'
+
+    # noinspection PyMethodMayBeStatic
+    def get_mobile_cost(self, response):
+        raw = ' '.join(self.get_mobile_texts(response, 'item-description/price'))
+        digits = AvitoRuSpider.not_digit_regex.sub('', raw.split('₽')[0])
+        if not digits:
+            Logger.log('Warning', 'Price not found')
+            return None
+        return int(digits)
+
+    # noinspection PyMethodMayBeStatic
+    def get_mobile_order_type(self, response):
+        if 'breadcrumbs' in self.get_state(response):
+            return self.get_order_type(response)
+        # The mobile page has no breadcrumbs, rents are priced per month or day
+        raw = ' '.join(self.get_mobile_texts(response, 'item-description/price')).lower()
+        if 'месяц' in raw or 'сутки' in raw:
+            return OrderTypes['RENT_OUT']
+        return OrderTypes['SALE']
+
+    def get_mobile_ad_date(self, response):
+        return self.get_date(' '.join(self.get_mobile_texts(response, 'item-stats/timestamp')))
+
+    # noinspection PyMethodMayBeStatic
+    def get_mobile_image_list(self, response):
+        images = [x.get('src') for element in self.get_mobile_blocks(response).get('item-photo', [])
+                  for x in element.iter('img') if x.get('src')]
+        if not images:
+            images = AvitoRuSpider.MOBILE_OG_IMAGE.extract(response)
+        return ["http:" + x if x.startswith('//') else x for x in images]
+
+    # noinspection PyMethodMayBeStatic
+    def get_desktop_url(self, url):
+        return url.replace('//m.', '//www.', 1)
+
+    def add_mobile_contacts(self, ad_loader, response):
+        """
+        Phone, address and the agent badge, only on the mobile page. Returns
+        the item, or None for an agent when EXCLUDE_AGENCY is set.
+        """
+        ad_loader.add_value('phone', self.from_state(response, 'phone', self.get_phone))
         ad_loader.add_value('address', self.get_mobile_address(response))
-        is_agent = 'Посредник' in response.xpath('//div[@class="_1qEI9"]//div[@class = "_1Jm7J"]/text()').extract()
+        is_agent = self.from_state(response, 'agent',
+                                   lambda x: 'Посредник' in AvitoRuSpider.MOBILE_AGENT.extract(x))
         ad_loader.add_value('agent', is_agent)
 
         if AvitoSettings.EXCLUDE_AGENCY and is_agent:
             print('=' * 5 + 'Посредник')
             return None
 
-        print(ad_loader.load_item())
-        return ad_loader.load_item()
+        item = ad_loader.load_item()
+        print(item)
+        return item
+
+    def parse_mobile(self, response):
+        ad_loader = ItemLoader(item=response.meta['ad'])
+        return self.add_mobile_contacts(ad_loader, response)
+
+    def parse_mobile_ad(self, response):
+        """
+        The whole ad from its mobile page alone, see AvitoSettings.EXTRACTION_MODE.
+
+        @url https://m.avito.ru/penza/doma_dachi_kottedzhi/dom_42_m_na_uchastke_4_sot._1238892161
+        """
+        params = self.get_mobile_params(response)
+        address = self.get_mobile_address(response)
+        ad_loader = ItemLoader(item=Ad())
+        ad_loader.add_value('title', self.from_state(response, 'title', self.get_mobile_title))
+        ad_loader.add_value('source', 1)
+        ad_loader.add_value('link', self.get_desktop_url(response.url))
+        ad_loader.add_value('order_type', self.get_mobile_order_type(response))
+        ad_loader.add_value('placed_at', self.from_state(response, 'placed_at', self.get_mobile_ad_date))
+        ad_loader.add_value('city', self.from_state(
+            response, 'city', lambda x: address.split(',')[0].strip() if address else 'Неизвестно'))
+        ad_loader.add_value('floor', self.get_mobile_param(params, 'Этаж'))
+        ad_loader.add_value('flat_area', self.get_mobile_param(params, 'Общая площадь'))
+        ad_loader.add_value('cost', self.from_state(response, 'cost', self.get_mobile_cost))
+        ad_loader.add_value('district', self.get_district_from_address(address))
+        ad_loader.add_value('description', self.from_state(response, 'description', self.get_mobile_description))
+        ad_loader.add_value('category', self.get_mobile_category(response, params))
+        ad_loader.add_value('floor_count', self.get_mobile_param(params, 'Этажей в доме'))
+        ad_loader.add_value('contact_name', self.from_state(response, 'contact_name', self.get_mobile_contact_name))
+        ad_loader.add_value('image_list', self.from_state(response, 'image_list', self.get_mobile_image_list))
+        ad_loader.add_value('new_building', 'новостройк' in params.lower())
+        return self.add_mobile_contacts(ad_loader, response)
 
     def parse_ad(self, response):
         """
         @url https://www.avito.ru/penza/doma_dachi_kottedzhi/dom_42_m_na_uchastke_4_sot._1238892161
         """
-        ad_loader = ItemLoader(item=Ad(), response=response)
-        ad_loader.add_xpath('title', '//span[contains(@class, \'title-info-title-text\')]/text()')
+        ad_loader = ItemLoader(item=Ad())
+        ad_loader.add_value('title', self.from_state(response, 'title', AvitoRuSpider.TITLE.extract))
         ad_loader.add_value('source', 1)
         ad_loader.add_value('link', response.url)
         ad_loader.add_value('order_type', self.get_order_type(response))
-        ad_loader.add_value('placed_at', self.get_ad_date(response))
-        ad_loader.add_value('city', self.get_city(response))
+        ad_loader.add_value('placed_at', self.from_state(response, 'placed_at', self.get_ad_date))
+        ad_loader.add_value('city', self.from_state(response, 'city', self.get_city))
         ad_loader.add_value('floor', self.get_floor(response))
         ad_loader.add_value('flat_area', self.get_total_square(response))
         # plot_size
         # ad_loader.add_value('plot_size', self.get_total_square(response))
-        ad_loader.add_value('cost', self.get_cost(response))
+        ad_loader.add_value('cost', self.from_state(response, 'cost', self.get_cost))
         ad_loader.add_value('district', self.get_district(response))
-        ad_loader.add_value('description', self.get_description(response))
+        ad_loader.add_value('description', self.from_state(response, 'description', self.get_description))
         ad_loader.add_value('category', self.get_category(response))
         ad_loader.add_value('floor_count', self.get_floor_count(response))
-        ad_loader.add_value('contact_name', self.get_contact_name(response))
-        ad_loader.add_value('image_list', self.get_image_list(response))
+        ad_loader.add_value('contact_name', self.from_state(response, 'contact_name', self.get_contact_name))
+        ad_loader.add_value('image_list', self.from_state(response, 'image_list', self.get_image_list))
         ad_loader.add_value('new_building', self.is_new_building(response))
         url = response.url.replace('www.', 'm.')
-        yield response.follow(url, callback=self.parse_mobile, meta={'ad_loader': ad_loader}, headers={'User-Agent': AvitoRuSpider.MOBILE_USER_AGENT})
+        # The item rather than the loader, which would keep this response alive
+        yield response.follow(url, callback=self.parse_mobile, meta={'ad': ad_loader.load_item()},
+                              headers={'User-Agent': AvitoRuSpider.MOBILE_USER_AGENT})
+
+    def follow_ad(self, response, url):
+        if AvitoSettings.EXTRACTION_MODE == 'mobile':
+            url = response.urljoin(url).replace('//www.', '//m.', 1)
+            return response.follow(url, callback=self.parse_mobile_ad,
+                                   headers={'User-Agent': AvitoRuSpider.MOBILE_USER_AGENT})
+        return response.follow(url, callback=self.parse_ad)
+
+    def get_result_count(self, response):
+        """
+        The number of ads of the search, from the title of the listing or
+        else from its last page number, None if it shows neither.
+        """
+        count = self.not_digit_regex.sub('', AvitoRuSpider.RESULT_COUNT.extract_first(response) or '')
+        if count:
+            return int(count)
+        pages = [url_query_parameter(response.urljoin(x), 'p') for x in AvitoRuSpider.PAGES.extract(response)]
+        pages = [int(x) for x in pages if x and x.isdigit()]
+        return max(pages) * AvitoSettings.ADS_PER_PAGE if pages else None
+
+    @staticmethod
+    def split_price_range(low, high):
+        """
+        The two halves of the price range [low, high] (high None for no upper
+        bound), [] when it is too narrow to be split.
+        """
+        if high is None:
+            if low >= AvitoSettings.PRICE_MAX:
+                return []
+            return [(low, AvitoSettings.PRICE_MAX), (AvitoSettings.PRICE_MAX + 1, None)]
+        if high - low < 2 * AvitoSettings.MIN_PRICE_STEP:
+            return []
+        middle = (low + high) // 2
+        return [(low, middle), (middle + 1, high)]
+
+    @staticmethod
+    def with_price(url, low, high):
+        if low:
+            url = add_or_replace_parameter(url, 'pmin', str(low))
+        if high is not None:
+            url = add_or_replace_parameter(url, 'pmax', str(high))
+        return url
+
+    def parse_partition(self, response):
+        """
+        The first page of a search (AvitoSettings.PARTITION) or of a price
+        slice of it: split in two slices if it has more than SLICE_PAGES
+        pages, crawled as usual otherwise. Each slice is its own seed, with
+        its own depth and watermark.
+        """
+        search = response.meta.get('search', response.meta.get('seed', response.url))
+        low, high = response.meta.get('price', (0, None))
+        count = self.get_result_count(response)
+        max_pages = min(AvitoSettings.SLICE_PAGES, AvitoSettings.PAGE_CAP)
+        if count is not None and count > max_pages * AvitoSettings.ADS_PER_PAGE:
+            slices = self.split_price_range(low, high)
+            if slices:
+                self.crawler.stats.inc_value('partition/split')
+                result = []
+                for price in slices:
+                    url = self.with_price(search, *price)
+                    result.append(scrapy.Request(url, callback=self.parse_partition, meta={
+                        'seed': url, 'page': 0, 'search': search, 'price': price, 'slice': url}))
+                return result
+            if count > AvitoSettings.PAGE_CAP * AvitoSettings.ADS_PER_PAGE:
+                print('{} ads priced {} to {} in {}, only the first pages are reachable'.format(
+                    count, low, high, search))
+                self.crawler.stats.inc_value('partition/capped')
+        self.crawler.stats.inc_value('partition/slices')
+        return self.parse(response)
 
     def parse(self, response):
         result = []
+        ad_urls = []
         scrapped_ads = 0
-        for item in response.xpath(self.item_selector):
+        for item in AvitoRuSpider.LISTING_ITEMS(response):
             self.total_count += 1
             scrapped_ads += 1
             if AvitoSettings.AD_DEPTH is not None and scrapped_ads >= AvitoSettings.AD_DEPTH:
@@ -269,17 +542,30 @@ class AvitoRuSpider(scrapy.Spider):
                 break
 
             ad = self.get_ad_data_from_category(item)
-            location_reg = re.compile('/([a-zA-Z_]+)/.*', re.I)
+            ad_urls.append(response.urljoin(ad['url']))
             #if not location[0] in AvitoSettings.LOCATION_PARTS:
             #    continue
-            result.append(response.follow(ad['url'], callback=self.parse_ad))
+            if self.seen_ads is not None and self.seen_ads.is_unchanged(response.urljoin(ad['url']), ad['cost']):
+                self.crawler.stats.inc_value('seen_ads/skipped')
+                continue
+            result.append(self.follow_ad(response, ad['url']))
         print("Total count {0}".format(self.total_count))
-        url = response.xpath('//a[contains(@class,\'js-pagination-next\')]/@href')\
-            .extract_first()
-        if not url:
+        seed = response.meta.get('seed', response.url)
+        page = response.meta.get('page', 0)
+        page_known = self.seen_ads is not None and self.seen_ads.is_page_known(seed, ad_urls)
+        if self.seen_ads is not None and page == 0:
+            self.seen_ads.propose_watermark(seed, ad_urls)
+        url = AvitoRuSpider.NEXT_PAGE.extract_first(response)
+        if not url or page_known:
+            if self.seen_ads is not None:
+                self.seen_ads.complete_seed(seed)
+            if url:
+                # Sorted by date, the next pages were scraped by the previous runs
+                print('Nothing new on page {} of {}, stopping there'.format(page, seed))
+                self.crawler.stats.inc_value('seen_ads/pagination_stopped')
             return result
-        location = response.url.split('?')[0]
-        self.current_depth[location] += 1
+        location = response.meta.get('slice', response.url.split('?')[0])
+        self.current_depth[location] = self.current_depth.get(location, 0) + 1
         if AvitoSettings.SCRAPPING_DEPTH is not None and \
                 self.current_depth[location] >= AvitoSettings.SCRAPPING_DEPTH:
             if AvitoSettings.ETERNAL_SCRAPPING and (AvitoSettings.ETERNAL_SCRAPPING is None and self.total_count < AvitoSettings.ITERATION_LIMIT):
@@ -287,5 +573,10 @@ class AvitoRuSpider(scrapy.Spider):
             return result
         print('Current depth is {}, scrapping_depth is {}'.format(self.current_depth[location],
                                                                   AvitoSettings.SCRAPPING_DEPTH))
-        result.append(response.follow(url, callback=self.parse))
+        meta = {'seed': seed, 'page': page + 1}
+        if 'slice' in response.meta:
+            # The slice stays within its prices whatever the link keeps
+            url = self.with_price(response.urljoin(url), *response.meta['price'])
+            meta.update((x, response.meta[x]) for x in ('search', 'price', 'slice'))
+        result.append(response.follow(url, callback=self.parse, meta=meta))
         return result
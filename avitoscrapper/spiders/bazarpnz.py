@@ -7,6 +7,10 @@ from scrapy.loader import ItemLoader
 from ..items import Ad
 from ..logger import Logger
 from ..order_types import OrderTypes
+from ..config import SeenAdsSettings
+from ..seen_ads import SeenAds
+from ..extraction import XPath, per_response
+from ..phone_decoder import PhoneScriptDecoder
 import js2py
 import io
 import re
@@ -42,13 +46,48 @@ class BazarpnzSpider(scrapy.Spider):
         3: OrderTypes['RENT_OUT']
     }
 
+    mode_regex = re.compile(r'[&?]s=(\d+)', re.I)
+    number_regex = re.compile(r'\d+')
+    href_phone_regex = re.compile(r'tel:\s*([\d\ -]+)', re.I)
+    phone_regex = re.compile(r'[\d\-\(\)\ ]+', re.I)
+    room_count_regex = re.compile("Количество комнат: (.+?)<br>", re.I)
+    room_number_regex = re.compile(r"Количество\s*комнат:\s*(\d+)\s*", re.I)
+    total_square_regex = re.compile(r"Общая\s*площадь:\s*(\d+)\s*", re.I)
+    contact_name_regex = re.compile(r"Имя:\s*(\w+)\s*", re.I)
+    date_regex = re.compile(r"Дата публикации объявления:\s*([\d.:\W]+)\s*", re.I | re.MULTILINE)
+
+    #LISTING_ITEMS = XPath("//tr[contains(@class, 'norm') and .//div[contains(@class, 'vdatext')]]")
+    LISTING_ITEMS = XPath("//table[contains(@class, 'list')]//tr[.//div[contains(@class, 'vdatext')]]")
+    LISTING_URL = XPath('.//td[contains(@class, \'text\')]//a/@href')
+    LISTING_TITLE = XPath('.//td[contains(@class, \'text\')]//a/text()')
+    LISTING_DATE = XPath('.//td[contains(@class, \'date\')]/text()')
+    NEXT_PAGE = XPath("//form[@name='topage']/a[./text()='следующей']/@href")
+    COST = XPath('//span[@class="price"]/text()')
+    PHONE_SCRIPT = XPath('//p[@class="contact_info"][last()]/script/text()')
+    DESCRIPTION = XPath("//p[contains(@class, 'adv_text')]/text()")
+    ADDRESS = XPath("//p[@class='contact_info'][last()]/a/text()")
+    CONTACT_INFO = XPath('//p[contains(@class, "contact_info")]')
+    CONTACT_INFO_TEXT = XPath("//p[@class='contact_info']/text()")
+    LAST_CONTACT_INFO_TEXT = XPath("//p[@class='contact_info'][last()]/text()")
+    NAV_LINK = XPath("//div[contains(@id, 'nav')]/a[$number]/text()")
+    PUBLICATION_DATE = XPath("//span[@class='views' and contains(text(), 'Дата публикации')]/text()")
+    IMAGES = XPath('//a[contains(@class, "big_photo")]/@href')
+
     def __init__(self):
         scrapy.Spider.__init__(self)
         self.uptodate_count  = 0
         self.outdate_treshold = 2
-        #self.item_selector = "//tr[contains(@class, 'norm') and .//div[contains(@class, 'vdatext')]]"
-        self.item_selector = "//table[contains(@class, 'list')]//tr[.//div[contains(@class, 'vdatext')]]"
-        self.js_context = js2py.EvalJs()
+        # Created on the first script the native decoder does not understand
+        self.js_context = None
+        self.phone_decoder = PhoneScriptDecoder(self.run_script)
+        self.seen_ads = SeenAds(SeenAdsSettings.DB, SeenAdsSettings.MAX_AGE) if SeenAdsSettings.DB else None
+
+    def closed(self, reason):
+        if self.seen_ads is not None:
+            if reason == 'finished':
+                self.seen_ads.commit_watermarks()
+            self.seen_ads.close()
+        self.logger.info('Phone scripts decoded: %s', dict(self.phone_decoder.stats))
 
     # noinspection PyMethodMayBeStatic
     def normalize(self, raw_str):
@@ -56,72 +95,80 @@ class BazarpnzSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def check_ad_scrapping_eligible(self, item):
-        date = ' '.join(item.xpath('.//td[contains(@class, \'date\')]/text()').extract()).strip()
+        date = ' '.join(BazarpnzSpider.LISTING_DATE.extract(item)).strip()
         return 'сегодня' in date.lower()
 
     def get_ad_data_from_category(self, item, response):
-        mode_regexp = re.compile(r'[&?]s=(\d+)', re.I)
-        mode = mode_regexp.findall(response.url)
+        mode = BazarpnzSpider.mode_regex.findall(response.url)
         return {
-            'url': item.xpath('.//td[contains(@class, \'text\')]//a/@href').extract_first(),
+            'url': BazarpnzSpider.LISTING_URL.extract_first(item),
             'order_type': int(mode[0]) if mode else -1,
-            'title': item.xpath('.//td[contains(@class, \'text\')]//a/text()').extract_first()
+            'title': BazarpnzSpider.LISTING_TITLE.extract_first(item)
         }
 
     # noinspection PyMethodMayBeStatic
     def get_cost(self, response):
-        cost = response.xpath('//span[@class="price"]/text()').extract_first()
+        cost = BazarpnzSpider.COST.extract_first(response)
         if cost is None:
             return None
         cost = cost.replace(' ', '').replace('\xa0', '')
-        output = re.findall('\d+', cost)
+        output = BazarpnzSpider.number_regex.findall(cost)
         return output[0] if output else ''
 
     # noinspection PyMethodMayBeStatic
     def get_phone(self, response):
-        element = response.xpath('//p[@class="contact_info"][last()]/script/text()').extract_first()
+        element = BazarpnzSpider.PHONE_SCRIPT.extract_first(response)
         if element is None:
             return None
-        full_js = """                                                           
-            var output;                                                         
-            document = {                                                        
-                write: function(value){                                         
-                    output = value;                                             
-                }                                                               
-            }                                                                   
-        """ + element
-        self.js_context.execute(full_js)
-        output = self.js_context.output
+        output = self.phone_decoder.decode(element)
+        if output is None:
+            Logger.log("WARN", "Unable to parse phone from " + response.url)
+            return None
         output = output.replace('&#45;', '')
         output = output.replace('&#43;', '')
         output = output.replace('&#40;', '')
         output = output.replace('&#41;', '')
         if 'href' in output:
-            href_regex = re.compile('tel:\s*([\d\ -]+)', re.I)
-            phones = href_regex.findall(output)
+            phones = BazarpnzSpider.href_phone_regex.findall(output)
             return phones[0] if phones else None
-        phone_regexp = re.compile('[\d\-\(\)\ ]+', re.I)
-        phone = phone_regexp.findall(output)
+        phone = BazarpnzSpider.phone_regex.findall(output)
         if not phone:
             Logger.log("WARN", "Unable to parse phone from " + response.url)
             return None
         return phone[0] if phone else None
 
+    def run_script(self, script):
+        """
+        Runs a phone script in js2py, returns what it writes.
+        """
+        if self.js_context is None:
+            self.js_context = js2py.EvalJs()
+        full_js = """
+            var output;
+            document = {
+                write: function(value){
+                    output = value;
+                }
+            }
+        """ + script
+        self.js_context.execute(full_js)
+        output = self.js_context.output
+        return None if output is None else str(output)
+
     # noinspection PyMethodMayBeStatic
     def get_description(self, response):
-        return self.normalize(' '.join(response.xpath("//p[contains(@class, 'adv_text')]/text()").extract()))
+        return self.normalize(' '.join(BazarpnzSpider.DESCRIPTION.extract(response)))
 
     # noinspection PyMethodMayBeStatic
     def get_address(self, response):
-        return self.normalize(' '.join(response.xpath("//p[@class='contact_info'][last()]/a/text()").extract()))
+        return self.normalize(' '.join(BazarpnzSpider.ADDRESS.extract(response)))
 
     # noinspection PyMethodMayBeStatic
     def get_category(self, response):
-        contact_info = response.xpath('//p[contains(@class, "contact_info")]').extract()
+        contact_info = BazarpnzSpider.CONTACT_INFO.extract(response)
         if contact_info:
             raw = "\n".join(contact_info)
-            regexp = re.compile("Количество комнат: (.+?)<br>", re.I)
-            result = regexp.findall(raw)
+            result = BazarpnzSpider.room_count_regex.findall(raw)
             if result is not None and len(result) > 0:
                 return result[0]
         return self.get_category_from_breadcrumbs(response)
@@ -131,15 +178,14 @@ class BazarpnzSpider(scrapy.Spider):
         category_number = '3'
         if 'i58.ru' in response.url:
             category_number = '4'
-        breadcrumb_category = response.xpath('//div[contains(@id, \'nav\')]/a[' + category_number + ']/text()').extract_first()
+        breadcrumb_category = self.get_nav_link(response, category_number)
         if breadcrumb_category is not None:
             return breadcrumb_category
-        regexp = re.compile("Количество\s*комнат:\s*(\d+)\s*", re.I)
-        elements = response.xpath("//p[@class='contact_info']/text()").extract_first()
+        elements = next(iter(self.get_contact_info_text(response)), None)
         if not elements:
             Logger.log("WARN", "Unable to parse category from " + response.url)
             return 'Не указано'
-        result = regexp.findall(elements)
+        result = BazarpnzSpider.room_number_regex.findall(elements)
         return 'Комнат: {}'.format(result[0]) if result else 'Неизвестно'
 
     # noinspection PyMethodMayBeStatic
@@ -147,35 +193,40 @@ class BazarpnzSpider(scrapy.Spider):
         category_number = '4'
         if 'i58.ru' in response.url:
             category_number = '5'
-        breadcrumb_category = response.xpath(
-            '//div[contains(@id, \'nav\')]/a[' + category_number + ']/text()').extract_first()
+        breadcrumb_category = self.get_nav_link(response, category_number)
         return breadcrumb_category == 'Новостройки' if breadcrumb_category is not None else False
 
+    # noinspection PyMethodMayBeStatic
+    def get_nav_link(self, response, number):
+        return BazarpnzSpider.NAV_LINK.extract_first(response, number=int(number))
+
+    # noinspection PyMethodMayBeStatic
+    @per_response
+    def get_contact_info_text(self, response):
+        return BazarpnzSpider.CONTACT_INFO_TEXT.extract(response)
+
     # noinspection PyMethodMayBeStatic
     def get_total_square(self, response):
-        regexp = re.compile("Общая\s*площадь:\s*(\d+)\s*", re.I)
-        elements = '\n'.join(response.xpath("//p[@class='contact_info']/text()").extract())
+        elements = '\n'.join(self.get_contact_info_text(response))
         if not elements:
             return None
-        result = regexp.findall(elements)
+        result = BazarpnzSpider.total_square_regex.findall(elements)
         return float(result[0]) if result else None
 
     # noinspection PyMethodMayBeStatic
     def get_contact_name(self, response):
-        regexp = re.compile("Имя:\s*(\w+)\s*", re.I)
-        elements = response.xpath("//p[@class='contact_info'][last()]/text()").extract_first()
+        elements = BazarpnzSpider.LAST_CONTACT_INFO_TEXT.extract_first(response)
         if not elements:
             return None
-        result = regexp.findall(elements)
+        result = BazarpnzSpider.contact_name_regex.findall(elements)
         return result[0] if result else None
 
     # noinspection PyMethodMayBeStatic
     def get_ad_date(self, response):
-        date_regex = re.compile("Дата публикации объявления:\s*([\d.:\W]+)\s*", re.I | re.MULTILINE)
-        element = response.xpath("//span[@class='views' and contains(text(), 'Дата публикации')]/text()").extract_first()
+        element = BazarpnzSpider.PUBLICATION_DATE.extract_first(response)
         if not element:
             return datetime.datetime.today()
-        results = date_regex.findall(element)
+        results = BazarpnzSpider.date_regex.findall(element)
         if not results:
             return datetime.datetime.today()
         date_raw = self.normalize(results[0])
@@ -187,10 +238,7 @@ class BazarpnzSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_image_list(self, response):
-        raw = response.xpath('//a[contains(@class, "big_photo")]/@href')
-        if not raw:
-            return []
-        hrefs = raw.extract()
+        hrefs = BazarpnzSpider.IMAGES.extract(response)
         return [BazarpnzSpider.name + x for x in hrefs]
 
     # noinspection PyMethodMayBeStatic
@@ -200,7 +248,7 @@ class BazarpnzSpider(scrapy.Spider):
         """
 
         meta = response.meta['ad']
-        ad_loader = ItemLoader(item=Ad(), response=response)
+        ad_loader = ItemLoader(item=Ad(), selector=response.selector)
         ad_loader.add_value('title', meta['title'])
         ad_loader.add_value('source', 0)
         ad_loader.add_value('link', response.url)
@@ -237,19 +285,34 @@ class BazarpnzSpider(scrapy.Spider):
         """
 
         self.uptodate_count = 0
-        for item in response.xpath(self.item_selector):
+        seed = response.meta.get('seed', response.url)
+        page = response.meta.get('page', 0)
+        ad_urls = []
+        for item in BazarpnzSpider.LISTING_ITEMS(response):
             ad = self.get_ad_data_from_category(item, response)
+            ad_urls.append(response.urljoin(ad['url']))
+            if self.seen_ads is not None and self.seen_ads.is_unchanged(response.urljoin(ad['url'])):
+                self.crawler.stats.inc_value('seen_ads/skipped')
+                continue
             yield response.follow(ad['url'],
                                   meta={'ad': ad, 'dont_merge_cookies': True},
                                   headers={'Referer': None},
                                   callback=self.parse_ad)
-        #if self.uptodate_count > 0:
-        url = response.xpath("//form[@name='topage']/a[./text()='следующей']/@href")\
-            .extract_first()
+        if self.seen_ads is not None:
+            if page == 0:
+                self.seen_ads.propose_watermark(seed, ad_urls)
+            if self.seen_ads.is_page_known(seed, ad_urls):
+                # Sorted by date, the next pages were scraped by the previous runs
+                self.crawler.stats.inc_value('seen_ads/pagination_stopped')
+                self.seen_ads.complete_seed(seed)
+                return None
+        url = BazarpnzSpider.NEXT_PAGE.extract_first(response)
         if not url:
             Logger.log('WARN', 'Next page url not found on the {}'.format(response.url))
+            if self.seen_ads is not None:
+                self.seen_ads.complete_seed(seed)
             return None
-        yield response.follow(url + '?', callback=self.parse)
+        yield response.follow(url + '?', callback=self.parse, meta={'seed': seed, 'page': page + 1})
 
 
 
@@ -4,7 +4,13 @@ import logging
 import traceback
 from scrapy.loader import ItemLoader
 from ..items import Ad
-from ..order_types import OrderTypes, month_format
+from ..order_types import OrderTypes
+from ..date_parser import parse_date
+from ..config import SeenAdsSettings, CianSettings
+from ..seen_ads import SeenAds
+from ..extraction import XPath, per_response
+from ..cian_export import read_offers
+from urllib.parse import parse_qs
 import requests
 import os
 import time
@@ -25,9 +31,47 @@ class CianSpider(scrapy.Spider):
     base_url_format = 'https://penza.cian.ru/export/xls/offers'
     referer_format = 'https://penza.cian.ru/'
     file = 'offers.xlsx'
-    date_regex = re.compile(r"\s*(\d+\s*\w+|сегодня|вчера)", re.I)
     floor_regex = re.compile(r'(\d+)/(\d+),.*', re.I)
+    room_count_regex = re.compile(r'>(\d+)<', re.I)
+    phone_regex = re.compile(r'tel:([\d\+ -]+)', re.I)
+
+    PARAMS = XPath("//li[@class='a10a3f92e9--item--_ipjK']")
+    PARAM_NAME = XPath("./span[@class='a10a3f92e9--name--3bt8k']/text()")
+    PARAM_VALUE = XPath("./span[@class='a10a3f92e9--value--3Ftu5']/text()")
+    COST = XPath("//span[@itemprop='price']/@content")
+    FLAT_AREA = XPath("//div[@class='a10a3f92e9--info--2ywQI' and div[@class='a10a3f92e9--info-title--mSyXn' and text() = 'Общая']]/div[@class='a10a3f92e9--info-text--2uhvD']/text()")
+    ROOM_COUNT = XPath('//span[contains(@class,"a10a3f92e9--value--3Ftu5") and contains(ancestor::li/child::span["a10a3f92e9--name--3bt8k"]/text(), "Количество комнат")]')
+    PHONE = XPath("//a[@class='a10a3f92e9--phone--3XYRR']/@href")
+    ADDRESS = XPath("//div[@class='a10a3f92e9--geo--18qoo']/span/@content")
+    BREADCRUMB = XPath("//div[@class='a10a3f92e9--breadcrumbs--1kChM']/span[$number]/a/@title")
+    HOUSING_TYPE = XPath('//span[contains(@class,"a10a3f92e9--value--3Ftu5") and contains(ancestor::li/child::span["a10a3f92e9--name--3bt8k"]/text(), "Тип жилья")]')
+    PAGE_CATEGORY = XPath('//a[contains(@class, \'a10a3f92e9--link--378yo\')]/span/text()')
+    DESCRIPTION = XPath("//meta[@property='og:description']/@content")
+    TITLE = XPath("//h1[@class='a10a3f92e9--title--2Widg']/text()")
+    CONTACT_NAME = XPath("//h2[@class='a10a3f92e9--title--2Zrxn']/text()")
+    MAIN_IMAGES = XPath("//img[@class='a10a3f92e9--photo--3ybE1']/@src")
+    OTHER_IMAGES = XPath("//img[@class='fotorama__img']/@src")
+    DATE = XPath("//div[contains(@class, 'a10a3f92e9--container--3nJ0d')]/text()")
+    LISTING_URLS = XPath("//a[contains(@class, 'c6e8ba5398--header--1fV2A')]/@href")
     total_count = 0
+    # Field -> getter of the offer page, for the fields the XLS export lacks
+    PAGE_GETTERS = {
+        'title': 'get_title',
+        'placed_at': 'get_ad_date',
+        'contact_name': 'get_contact_name',
+        'image_list': 'get_image_list',
+        'phone': 'get_phone',
+        'description': 'get_description',
+        'address': 'get_address',
+        'category': 'get_category',
+        'flat_area': 'get_flat_area',
+        'floor': 'get_floor',
+        'floor_count': 'get_floor_count',
+        'new_building': 'is_new_building',
+    }
+    # Needed by the pipeline, from the page when the export has none (no room
+    # count for a studio or a house)
+    REQUIRED_FIELDS = ('category',)
 
     requests_list = [
         'kupit-kvartiru/',
@@ -37,6 +81,12 @@ class CianSpider(scrapy.Spider):
    ]
 
     def start_requests(self):
+        if CianSettings.EXTRACTION_MODE == 'xls':
+            return [
+                scrapy.Request(CianSpider.base_url_format + '/?' + query, callback=self.parse_export,
+                               headers={'Referer': CianSpider.referer_format}, meta={'query': query})
+                for query in CianSettings.EXPORT_SEARCHES
+            ]
         return [
              scrapy.Request(CianSpider.referer_format + request,
                             meta={'request': request}) for request in CianSpider.requests_list
@@ -45,51 +95,56 @@ class CianSpider(scrapy.Spider):
     def __init__(self):
         scrapy.Spider.__init__(self)
         self.item_selector = '//div[contains(@class, "_93444fe79c-card--2Jgih")]'
+        self.seen_ads = SeenAds(SeenAdsSettings.DB, SeenAdsSettings.MAX_AGE) if SeenAdsSettings.DB else None
+
+    def closed(self, reason):
+        if self.seen_ads is not None:
+            self.seen_ads.close()
 
     # noinspection PyMethodMayBeStatic
     def get_ad_date_from_list(self, item):
-        raw_date = response.xpath(".//div[contains(@class, 'c6e8ba5398-absolute--2Znfs')]/text()").extract_first()
-        if not raw_date:
-            return datetime.datetime.today()
-        raw_date = raw_date.lower()
-        date = CianSpider.date_regex.findall(raw_date)
-        if not date:
-            return datetime.datetime.today()
-        first = date[0].lower()
-        if not first or 'сегодня' in first:
-            return datetime.datetime.today()
-        if 'вчера' in first:
-            return datetime.datetime.today() - datetime.timedelta(1)
-        result = month_format(first)
-        return datetime.strptime(result, '%d %m %Y')
+        raw_date = item.xpath(".//div[contains(@class, 'c6e8ba5398-absolute--2Znfs')]/text()").extract_first()
+        return parse_date(raw_date) or datetime.datetime.today()
 
 
     # noinspection PyMethodMayBeStatic
     def get_cost(self, response):
-        raw = response.xpath("//span[@itemprop='price']/@content").extract_first()
+        raw = CianSpider.COST.extract_first(response)
         if not raw:
             return None
         return raw.replace('\xa0', ' ').replace(' ', '')
 
+    # noinspection PyMethodMayBeStatic
+    @per_response
+    def get_params(self, response):
+        """
+        The parameter list of the page, {'Этаж': '5 из 9', ...}.
+        """
+        params = {}
+        for item in CianSpider.PARAMS(response):
+            for name in CianSpider.PARAM_NAME(item):
+                value = CianSpider.PARAM_VALUE.extract_first(item)
+                if value is not None:
+                    params.setdefault(str(name), value)
+        return params
+
     # noinspection PyMethodMayBeStatic
     def get_floor(self, response):
-        return response.xpath("//li[@class='a10a3f92e9--item--_ipjK' and span[@class='a10a3f92e9--name--3bt8k' and text() = 'Этаж']]/span[@class='a10a3f92e9--value--3Ftu5']/text()").extract_first()
+        return self.get_params(response).get('Этаж')
 
     def get_floor_count(self, response):
-        return response.xpath("//li[@class='a10a3f92e9--item--_ipjK' and span[@class='a10a3f92e9--name--3bt8k' and text() = 'Этажей в доме']]/span[@class='a10a3f92e9--value--3Ftu5']/text()").extract_first()
+        return self.get_params(response).get('Этажей в доме')
 
     # noinspection PyMethodMayBeStatic
     def get_flat_area(self, response):
-        return response.xpath("//div[@class='a10a3f92e9--info--2ywQI' and div[@class='a10a3f92e9--info-title--mSyXn' and text() = 'Общая']]/div[@class='a10a3f92e9--info-text--2uhvD']/text()").extract_first()
+        return CianSpider.FLAT_AREA.extract_first(response)
 
     # noinspection PyMethodMayBeStatic
     def get_room_count(self, response):
-        raw = response.xpath(
-            '//span[contains(@class,"a10a3f92e9--value--3Ftu5") and contains(ancestor::li/child::span["a10a3f92e9--name--3bt8k"]/text(), "Количество комнат")]').extract_first()
+        raw = CianSpider.ROOM_COUNT.extract_first(response)
         if not raw:
             return None
-        regexp = re.compile('>(\d+)<', re.I)
-        count = regexp.findall(raw)
+        count = CianSpider.room_count_regex.findall(raw)
         if not count:
             return None
         return '1 комната' if count[0] == '1' else\
@@ -100,14 +155,13 @@ class CianSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_phone(self, response):
-        raw = response.xpath("//a[@class='a10a3f92e9--phone--3XYRR']/@href").extract_first()
-        reg = re.compile('tel:([\d\+ -]+)', re.I)
-        result = reg.findall(raw)
+        raw = CianSpider.PHONE.extract_first(response)
+        result = CianSpider.phone_regex.findall(raw)
         return result[0] if result else None
 
     # noinspection PyMethodMayBeStatic
     def get_address(self, response):
-        raw = response.xpath("//div[@class='a10a3f92e9--geo--18qoo']/span/@content").extract_first()
+        raw = CianSpider.ADDRESS.extract_first(response)
         return raw
 
     # noinspection PyMethodMayBeStatic
@@ -115,28 +169,27 @@ class CianSpider(scrapy.Spider):
         room_count = self.get_room_count(response)
         if room_count:
             return room_count
-        raw = response.xpath("//div[@class='a10a3f92e9--breadcrumbs--1kChM']/span[3]/a/@title").extract_first()
+        raw = CianSpider.BREADCRUMB.extract_first(response, number=3)
         return raw if raw else "Неизвестно"
 
     def is_new_building(self, response):
-        raw = response.xpath(
-            '//span[contains(@class,"a10a3f92e9--value--3Ftu5") and contains(ancestor::li/child::span["a10a3f92e9--name--3bt8k"]/text(), "Тип жилья")]').extract_first()
+        raw = CianSpider.HOUSING_TYPE.extract_first(response)
         print(raw)
         return raw == 'Новостройка' if raw else False
 
     # noinspection PyMethodMayBeStatic
     def get_category_from_page(self, response):
-        raw = response.xpath('//a[contains(@class, \'a10a3f92e9--link--378yo\')]/span/text()').extract()[2]
+        raw = CianSpider.PAGE_CATEGORY.extract(response)[2]
         return raw
 
     # noinspection PyMethodMayBeStatic
     def get_description(self, response):
-        raw = response.xpath("//meta[@property='og:description']/@content").extract_first()
+        raw = CianSpider.DESCRIPTION.extract_first(response)
         return raw
 
     # noinspection PyMethodMayBeStatic
     def get_order_type(self, response):
-        raw = response.xpath("//div[@class='a10a3f92e9--breadcrumbs--1kChM']/span[2]/a/@title").extract_first()
+        raw = CianSpider.BREADCRUMB.extract_first(response, number=2)
         if 'Продажа' in raw:
             return OrderTypes['SALE']
         if 'Аренда' in raw:
@@ -144,27 +197,21 @@ class CianSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_title(self, response):
-        return response.xpath("//h1[@class='a10a3f92e9--title--2Widg']/text()").extract_first()
+        return CianSpider.TITLE.extract_first(response)
 
     # noinspection PyMethodMayBeStatic
     def get_contact_name(self, response):
-        return response.xpath("//h2[@class='a10a3f92e9--title--2Zrxn']/text()").extract_first()
+        return CianSpider.CONTACT_NAME.extract_first(response)
 
     # noinspection PyMethodMayBeStatic
     def get_image_list(self, response):
-        main = response.xpath("//img[@class='a10a3f92e9--photo--3ybE1']/@src").extract()
-        if not main:
-            main = []
-        other = response.xpath("//img[@class='fotorama__img']/@src").extract()
-        if not other:
-            other = []
-        return main + other
+        return CianSpider.MAIN_IMAGES.extract(response) + CianSpider.OTHER_IMAGES.extract(response)
 
     def parse_ad(self, response):
         """
         @url https://penza.cian.ru/sale/flat/197367444/
         """
-        ad_loader = ItemLoader(item=Ad(), response=response)
+        ad_loader = ItemLoader(item=Ad(), selector=response.selector)
         ad_loader.add_value('title', self.get_title(response))
         ad_loader.add_value('source', 2)
         ad_loader.add_value('link', response.url)
@@ -193,25 +240,66 @@ class CianSpider(scrapy.Spider):
 
     # noinspection PyMethodMayBeStatic
     def get_ad_date(self, response):
-        raw_date = response.xpath("//div[contains(@class, 'a10a3f92e9--container--3nJ0d')]/text()").extract_first()
-        if not raw_date:
-            return datetime.datetime.today()
-        raw_date = raw_date.lower()
-        date = CianSpider.date_regex.findall(raw_date)
-        if not date:
-            return datetime.datetime.today()
-        first = date[0].lower()
-        if not first or 'сегодня' in first:
-            return datetime.datetime.today()
-        if 'вчера' in first:
-            return datetime.datetime.today() - datetime.timedelta(1)
-        result = month_format(first)
-        return datetime.datetime.strptime(result, '%d %m %Y')
+        raw_date = CianSpider.DATE.extract_first(response)
+        return parse_date(raw_date) or datetime.datetime.today()
+
+    # noinspection PyMethodMayBeStatic
+    def get_export_order_type(self, query):
+        deal_type = parse_qs(query).get('deal_type', ['sale'])[0]
+        return OrderTypes['RENT_OUT'] if deal_type == 'rent' else OrderTypes['SALE']
+
+    def parse_export(self, response):
+        """
+        The ads of an XLS export, see CianSettings.EXTRACTION_MODE.
+        """
+        order_type = self.get_export_order_type(response.meta['query'])
+        for offer in read_offers(response.body):
+            link = response.urljoin(offer['link'])
+            CianSpider.total_count += 1
+            if self.seen_ads is not None and self.seen_ads.is_unchanged(link, offer['cost']):
+                self.crawler.stats.inc_value('seen_ads/skipped')
+                continue
+            ad = Ad(source=2, order_type=order_type, city='Пенза', agent=False)
+            for field, value in offer.items():
+                if value is not None:
+                    ad[field] = value
+            ad['link'] = link
+            if 'placed_at' not in CianSettings.EXPORT_PAGE_FIELDS:
+                # Not in the export, today as get_ad_date for a page without a date
+                ad['placed_at'] = datetime.datetime.today()
+            if not self.get_export_page_fields(ad):
+                yield ad
+                continue
+            yield response.follow(link, callback=self.parse_export_ad, meta={'ad': ad},
+                                  headers={'Referer': CianSpider.referer_format, 'Host': 'penza.cian.ru'})
+        print('Total count ' + str(CianSpider.total_count))
+
+    # noinspection PyMethodMayBeStatic
+    def get_export_page_fields(self, ad):
+        """
+        The fields of the ad to take from its page: the EXPORT_PAGE_FIELDS
+        and the REQUIRED_FIELDS the export row left empty.
+        """
+        fields = list(CianSettings.EXPORT_PAGE_FIELDS)
+        fields += [x for x in CianSpider.REQUIRED_FIELDS if x not in fields]
+        return [x for x in fields if ad.get(x) is None]
+
+    def parse_export_ad(self, response):
+        """
+        Completes an ad of the export with the fields of its page.
+        """
+        ad = response.meta['ad']
+        for field in self.get_export_page_fields(ad):
+            ad[field] = getattr(self, CianSpider.PAGE_GETTERS[field])(response)
+        return ad
 
     def parse(self, response):
-        items = response.xpath("//a[contains(@class, 'c6e8ba5398--header--1fV2A')]/@href").extract()
+        items = CianSpider.LISTING_URLS.extract(response)
         for item in items:
             CianSpider.total_count += 1
+            if self.seen_ads is not None and self.seen_ads.is_unchanged(response.urljoin(item)):
+                self.crawler.stats.inc_value('seen_ads/skipped')
+                continue
             yield response.follow(item, headers={"Referer": response.url, "Host": "penza.cian.ru"}, callback=self.parse_ad)
         print(CianSpider.total_count)
         subblocks = response.xpath("//a[contains(@class, 'c-14e8ba5398--other_offers--2E8wn')]/@href").extract()
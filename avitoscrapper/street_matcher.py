@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+
+def normalize_string(s):
+    if s is None:
+        return None
+    return s.lower().replace('ё', 'е')
+
+
+class StreetMatcher(object):
+    """
+    Aho-Corasick automaton over the street names of a city.
+
+    Built once from {street name: district id}, it finds every street name
+    occurring in a text in a single pass, whatever the number of streets;
+    the longest one wins ("Московская" rather than "Москва"), the first one
+    on a tie. Names and texts are lower-cased and 'ё' is replaced by 'е'.
+    """
+
+    def __init__(self, street_map):
+        # Transitions, failure links and the longest name ending in a state
+        self.goto = [{}]
+        self.fail = [0]
+        self.match_length = [0]
+        self.match_value = [None]
+        for name, value in street_map.items():
+            self.add(normalize_string(name), value)
+        self.build()
+
+    def __len__(self):
+        return len(self.goto)
+
+    def add(self, name, value):
+        if not name:
+            return
+        state = 0
+        for char in name:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.match_length.append(0)
+                self.match_value.append(None)
+            state = next_state
+        self.match_length[state] = len(name)
+        self.match_value[state] = value
+
+    def build(self):
+        # Breadth-first, so the failure state of a node is always complete
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail if fail != next_state else 0
+                # A shorter name may end here too, keep the longest one
+                if self.match_length[fail] > self.match_length[next_state]:
+                    self.match_length[next_state] = self.match_length[fail]
+                    self.match_value[next_state] = self.match_value[fail]
+
+    def find(self, text):
+        """
+        Returns the value of the longest street name found in text or None.
+        """
+        if not text:
+            return None
+        goto, fail, match_length = self.goto, self.fail, self.match_length
+        state = 0
+        best_state = 0
+        for char in normalize_string(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if match_length[state] > match_length[best_state]:
+                best_state = state
+        return self.match_value[best_state] if best_state else None
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# CPU time of the Avito ad callbacks on pages with and without the state
+# embedded as JSON, parsing the document included since skipping it is the
+# point, and the fields on which the two paths disagree.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.avito_state [calls]
+import io
+import sys
+import time
+import contextlib
+from avitoscrapper.config import SeenAdsSettings
+from benchmarks import pages
+
+# Nothing to remember across the calls of a benchmark
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+
+
+def ad_of(result):
+    if isinstance(result, list):
+        # parse_ad passes the item on to the mobile page
+        return result[0].meta['ad']
+    return result
+
+
+def run(callback, make_response, calls):
+    responses = [make_response() for _ in range(calls)]
+    start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        items = [ad_of(list(callback(x)) if callback.__name__ == 'parse_ad' else callback(x))
+                 for x in responses]
+    return (time.process_time() - start) / calls, items[0]
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    spider = AvitoRuSpider()
+    cases = [
+        ('parse_ad', spider.parse_ad, pages.AVITO_AD_URL, pages.avito_ad(), False),
+        ('parse_mobile_ad', spider.parse_mobile_ad, pages.AVITO_MOBILE_URL, pages.avito_mobile(), True),
+    ]
+    for name, callback, url, page, encoded in cases:
+        dom, dom_item = run(callback, lambda: pages.response(url, page), calls)
+        state, state_item = run(callback, lambda: pages.response(url, pages.with_state(page, encoded)), calls)
+        print('{:<16} DOM {:8.1f} us/call, state {:8.1f} us/call'.format(name, dom * 1e6, state * 1e6))
+        for field in sorted(set(dom_item) | set(state_item)):
+            if dom_item.get(field) != state_item.get(field):
+                print('    {}: {!r} / {!r}'.format(field, dom_item.get(field), state_item.get(field)))
+
+
+if __name__ == '__main__':
+    main()
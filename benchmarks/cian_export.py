@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# CPU time per offer of CianSpider reading an XLS export, versus parsing
+# the page of each offer (parse_ad, document parsing included).
+#
+# Usage (from the repository root):
+#     python -m benchmarks.cian_export [offers]
+import io
+import sys
+import time
+import random
+import contextlib
+import openpyxl
+from avitoscrapper.config import SeenAdsSettings, CianSettings
+from benchmarks import pages
+
+# Nothing to remember across the calls of a benchmark
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.cian import CianSpider
+
+HEADER = ['ID', 'Количество комнат', 'Тип', 'Метро', 'Адрес', 'Площадь, м2', 'Дом', 'Парковка', 'Цена',
+          'Телефоны', 'Описание', 'Ремонт', 'Балкон', 'Санузел', 'Название ЖК', 'Ссылка на объявление']
+
+
+def export(count):
+    """
+    A workbook shaped like the export of a search, count offers in it.
+    """
+    rng = random.Random(1)
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for i in range(count):
+        rooms = rng.randint(1, 5)
+        sheet.append([197367444 + i, '{}, Изолированная'.format(rooms), 'Продажа, квартира', None,
+                      'Пенза, ул. Пушкина, {}'.format(i % 100), '{}.0/30.0/9.0'.format(30 + rooms * 12),
+                      '{}/9, Кирпичный'.format(rng.randint(1, 9)), None, '{} руб.'.format(3000000 + i * 1000),
+                      '+7900{:07d}'.format(i), pages.DESCRIPTION * 5, 'Косметический', 'Лоджия', 'Раздельный',
+                      rng.choice([None, 'ЖК Лугометрия']), 'https://penza.cian.ru/sale/flat/{}/'.format(197367444 + i)])
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    spider = CianSpider()
+    CianSettings.EXPORT_PAGE_FIELDS = []
+    body = export(count)
+    response = pages.response(CianSpider.base_url_format + '/?' + CianSettings.EXPORT_SEARCHES[0], '',
+                              {'query': CianSettings.EXPORT_SEARCHES[0]})
+    response = response.replace(body=body)
+    start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ads = list(spider.parse_export(response))
+    export_time = (time.process_time() - start) / len(ads)
+
+    page = pages.cian_ad()
+    calls = min(count, 200)
+    responses = [pages.response(pages.CIAN_AD_URL, page) for _ in range(calls)]
+    start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for x in responses:
+            spider.parse_ad(x)
+    page_time = (time.process_time() - start) / calls
+    print('XLS export ({} KB) {:8.1f} us/offer, {} ads'.format(len(body) // 1024, export_time * 1e6, len(ads)))
+    print('offer pages        {:8.1f} us/offer, plus a request each'.format(page_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Checks that the ads of a Cian XLS export go through the pipeline: an
+# export with a flat, a studio and a house (the last two without a room
+# count, so without a category in the export) is read by
+# CianSpider.parse_export with EXPORT_PAGE_FIELDS = [], the offer pages the
+# spider asks for are answered with pages.cian_ad(), and every ad is pushed
+# by AvitoscrapperPipeline to the stand-in orders API. Exit status 1 if an
+# ad is dropped or an order lacks its category or date.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.cian_export_items
+import io
+import sys
+import shutil
+import logging
+import argparse
+import tempfile
+import contextlib
+import openpyxl
+import scrapy
+from avitoscrapper.config import SeenAdsSettings, CianSettings
+from avitoscrapper.pipelines import AvitoscrapperPipeline
+from benchmarks import pages
+from benchmarks.cian_export import HEADER
+from benchmarks.orders_api import configure
+from benchmarks.stand_in import StandInOrdersApi
+
+# Nothing to remember across the runs of a check
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.cian import CianSpider
+
+SEARCH = 'deal_type=sale&engine_version=2&offer_type=suburban&region=4969'
+# Rooms, type, area, house of the rows
+ROWS = [
+    ('2, Изолированная', 'Продажа, квартира', '54.0/30.0/9.0', '5/9, Кирпичный'),
+    ('Студия', 'Продажа, квартира', '25.0/15.0/5.0', '3/9, Панельный'),
+    (None, 'Продажа, дом', '120.0', None),
+]
+
+
+def export():
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(HEADER)
+    for i, (rooms, kind, area, house) in enumerate(ROWS):
+        sheet.append([197367444 + i, rooms, kind, None, 'Пенза, ул. Пушкина, {}'.format(i + 1), area, house, None,
+                      '{} руб.'.format(3000000 + i * 1000), '+7900000000{}'.format(i), pages.DESCRIPTION, None,
+                      None, None, None, 'https://penza.cian.ru/sale/flat/{}/'.format(197367444 + i)])
+    data = io.BytesIO()
+    workbook.save(data)
+    return data.getvalue()
+
+
+def scrape(spider):
+    """
+    The ads of the export, completed from their pages where asked.
+    """
+    response = pages.response(CianSpider.base_url_format + '/?' + SEARCH, '', {'query': SEARCH})
+    ads = []
+    for x in spider.parse_export(response.replace(body=export())):
+        if isinstance(x, scrapy.Request):
+            x = x.callback(pages.response(x.url, pages.cian_ad(), x.meta))
+        ads.append(x)
+    return ads
+
+
+def main():
+    argparse.ArgumentParser(description='Cian export ads through AvitoscrapperPipeline').parse_args()
+    logging.basicConfig(level=logging.ERROR)
+    CianSettings.EXPORT_PAGE_FIELDS = []
+    api = StandInOrdersApi().start_in_thread()
+    directory = tempfile.mkdtemp()
+    dropped = []
+    try:
+        configure(api, directory, argparse.Namespace(batch=False, gzip=False))
+        spider = CianSpider()
+        # The spider and the pipeline print every ad
+        with contextlib.redirect_stdout(io.StringIO()):
+            ads = scrape(spider)
+            pipeline = AvitoscrapperPipeline()
+            pipeline.open_spider(spider)
+            for ad in ads:
+                try:
+                    pipeline.process_item(ad, spider)
+                except Exception as e:
+                    dropped.append('{}: {!r}'.format(ad.get('link'), e))
+            pipeline.close_spider(spider)
+    finally:
+        api.stop()
+        shutil.rmtree(directory)
+    incomplete = [x['link'] for x in api.orders if not x.get('category_id') or not x.get('placed_at')]
+    print('{} rows, {} ads, {} orders received'.format(len(ROWS), len(ads), len(api.orders)))
+    for order in api.orders:
+        print('    {:<42} category {!r}, placed_at {}'.format(order['link'], order.get('category'),
+                                                               order.get('placed_at')))
+    for problem in dropped:
+        print('    dropped {}'.format(problem))
+    for link in incomplete:
+        print('    incomplete {}'.format(link))
+    return 1 if dropped or incomplete or len(api.orders) != len(ROWS) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
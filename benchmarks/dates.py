@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Parses per minute of the dates of the ads: the month_format() based code
+# the spiders had (24 str.replace calls, then strptime) against
+# date_parser, on texts repeating like on the listing pages and on texts
+# all different (no memo hits).
+#
+# Usage (from the repository root):
+#     python -m benchmarks.dates [dates]
+import re
+import sys
+import time
+import random
+import datetime
+from avitoscrapper import date_parser
+
+MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа', 'сентября', 'октября',
+          'ноября', 'декабря']
+SHORT_MONTHS = ['янв', 'фев', 'мар', 'апр', 'май', 'июн', 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек']
+DATE_REGEX = re.compile(r"размещено\s*(\d+\s*\w+|сегодня|вчера)", re.I)
+TIME_REGEX = re.compile(r"\d\d:\d\d")
+
+
+def month_format(date_str):
+    # order_types.month_format as it was
+    date_str = date_str.lower()
+    for i, month in enumerate(MONTHS):
+        date_str = date_str.replace(month, str(i + 1))
+    for i, month in enumerate(SHORT_MONTHS):
+        date_str = date_str.replace(month, str(i + 1))
+    return date_str + ' 2018'
+
+
+def legacy(raw_data):
+    # AvitoRuSpider.get_ad_date as it was
+    date = DATE_REGEX.findall(raw_data)
+    if not date:
+        dt = datetime.datetime.today()
+    elif date[0].lower() == 'сегодня':
+        dt = datetime.datetime.today()
+    elif date[0].lower() == 'вчера':
+        dt = datetime.date.today() - datetime.timedelta(1)
+    else:
+        dt = datetime.datetime.strptime(month_format(date[0].lower()), '%d %m %Y')
+    found = TIME_REGEX.findall(raw_data)
+    t = found[0].split(':') if found else (0, 0)
+    return datetime.datetime(dt.year, dt.month, dt.day) + datetime.timedelta(hours=int(t[0]), minutes=int(t[1]))
+
+
+def make_text(rng):
+    when = '{:02d}:{:02d}'.format(rng.randint(0, 23), rng.randint(0, 59))
+    day = rng.choice(['сегодня', 'вчера', '{} {}'.format(rng.randint(1, 28), rng.choice(MONTHS))])
+    return '№ {}, размещено {} в {}'.format(rng.randint(10 ** 9, 2 * 10 ** 9), day, when)
+
+
+def run(name, texts, parse):
+    start = time.process_time()
+    for text in texts:
+        parse(text)
+    elapsed = time.process_time() - start
+    print('{:<28} {:6.2f}M parses/min'.format(name, len(texts) / elapsed * 60 / 1e6))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rng = random.Random(1)
+    distinct = [make_text(rng) for _ in range(count)]
+    # A listing shows the same few hundred timestamps over and over
+    repeated = [rng.choice(distinct[:500]) for _ in range(count)]
+    run('month_format, repeated', repeated, legacy)
+    run('month_format, distinct', distinct, legacy)
+    date_parser.parse_parts.cache_clear()
+    run('date_parser, repeated', repeated, date_parser.parse_date)
+    run('date_parser, distinct', distinct, date_parser.parse_date)
+    print(date_parser.parse_parts.cache_info())
+    same = sum(legacy(x).replace(year=2000) == date_parser.parse_date(x).replace(year=2000) for x in distinct[:1000])
+    print('same day and time as before (the year aside): {}/1000'.format(same))
+
+
+if __name__ == '__main__':
+    main()
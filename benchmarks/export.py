@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Item export: the former open/write/close per item versus the buffered
+# JsonLinesWriter, plain and compressed.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.export [items]
+import os
+import sys
+import json
+import time
+import codecs
+import shutil
+import tempfile
+from avitoscrapper.export import JsonLinesWriter, zstandard
+from benchmarks.order_push import ORDER
+
+
+def legacy(directory, count):
+    for i in range(count):
+        file = codecs.open(os.path.join(directory, 'scraped_data_utf8.json'), 'w', encoding='utf-8')
+        file.write(json.dumps(dict(ORDER, id=i), ensure_ascii=False) + "\n")
+        file.close()
+
+
+def writer(directory, count, **kwargs):
+    export = JsonLinesWriter(directory, 'bench', max_bytes=16 * 1024 * 1024, **kwargs)
+    for i in range(count):
+        export.write(dict(ORDER, id=i))
+    export.close()
+
+
+def run(name, count, send):
+    directory = tempfile.mkdtemp()
+    try:
+        start = time.time()
+        send(directory)
+        elapsed = time.time() - start
+        size = sum(os.path.getsize(os.path.join(directory, x)) for x in os.listdir(directory))
+        print('{:<18} {:9.0f} items/min, {:3d} files, {:8.1f} KB on disk'.format(
+            name, count / elapsed * 60, len(os.listdir(directory)), size / 1024.0))
+    finally:
+        shutil.rmtree(directory)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    run('open per item', count, lambda d: legacy(d, count))
+    run('buffered', count, lambda d: writer(d, count))
+    run('buffered, gzip', count, lambda d: writer(d, count, compression='gzip'))
+    if zstandard is not None:
+        run('buffered, zstd', count, lambda d: writer(d, count, compression='zstd'))
+
+
+if __name__ == '__main__':
+    main()
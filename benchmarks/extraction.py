@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# CPU time of the spider callbacks on synthetic pages (see pages.py), the
+# document being parsed beforehand so only the extraction is measured.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.extraction [calls]
+import io
+import sys
+import time
+import contextlib
+from avitoscrapper.config import SeenAdsSettings
+from avitoscrapper.items import Ad
+from benchmarks import pages
+
+# Nothing to remember across the calls of a benchmark
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+from avitoscrapper.spiders.bazarpnz import BazarpnzSpider
+from avitoscrapper.spiders.cian import CianSpider
+
+
+def consume(result):
+    if result is None or isinstance(result, (dict, Ad)):
+        return result
+    return list(result)
+
+
+def measure(callback, make_response, calls, rounds=3):
+    """
+    CPU seconds per call, the best of a few rounds.
+    """
+    best = None
+    for _ in range(rounds):
+        responses = [make_response() for _ in range(calls)]
+        for response in responses:
+            response.selector
+        start = time.process_time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for response in responses:
+                consume(callback(response))
+        elapsed = (time.process_time() - start) / calls
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def callbacks():
+    avito = AvitoRuSpider()
+    bazar = BazarpnzSpider()
+    cian = CianSpider()
+    avito_ad, avito_mobile, avito_listing = pages.avito_ad(), pages.avito_mobile(), pages.avito_listing()
+    bazar_ad, cian_ad = pages.bazar_ad(), pages.cian_ad()
+    bazar_meta = {'ad': {'title': '2-к квартира', 'order_type': 1, 'url': pages.BAZAR_AD_URL}}
+    return [
+        ('avito parse (listing)', avito.parse, lambda: pages.response(pages.AVITO_LIST_URL, avito_listing)),
+        ('avito parse_ad', avito.parse_ad, lambda: pages.response(pages.AVITO_AD_URL, avito_ad)),
+        ('avito parse_mobile', avito.parse_mobile,
+         lambda: pages.response(pages.AVITO_MOBILE_URL, avito_mobile, {'ad': Ad(title='2-к квартира')})),
+        ('avito parse_mobile_ad', avito.parse_mobile_ad, lambda: pages.response(pages.AVITO_MOBILE_URL, avito_mobile)),
+        ('bazarpnz parse_ad', bazar.parse_ad, lambda: pages.response(pages.BAZAR_AD_URL, bazar_ad, bazar_meta)),
+        ('cian parse_ad', cian.parse_ad, lambda: pages.response(pages.CIAN_AD_URL, cian_ad)),
+    ]
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for name, callback, make_response in callbacks():
+        print('{:<24} {:8.1f} us/call'.format(name, measure(callback, make_response, calls) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Checks that AvitoSettings.EXTRACTION_MODE = 'mobile' scrapes the same ads
+# as 'desktop+mobile': for each ad of fixtures/manifest.json with both a
+# parse_ad and a parse_mobile_ad fixture (same ad, same "state"), the item
+# of parse_ad -> parse_mobile is compared field by field with the item of
+# parse_mobile_ad on the mobile page alone.
+#
+# Fields of EXPECTED_DIFFERENCES are reported but allowed to differ, any
+# other difference is a failure (exit status 1).
+#
+# Usage (from the repository root):
+#     python -m benchmarks.mobile_parity
+import io
+import sys
+import logging
+import contextlib
+from benchmarks.parsing import load_page, manifest
+from benchmarks import pages
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+
+EXPECTED_DIFFERENCES = {
+    # The mobile markup only has the cover (og:image); with the embedded
+    # state both modes take the whole gallery from it
+    'image_list': 'only the cover on a mobile page without the state',
+}
+
+
+def pairs(fixtures):
+    """
+    (desktop fixture, mobile fixture) of the same ad.
+    """
+    mobile = dict(((x['url'], bool(x.get('state'))), x) for x in fixtures
+                  if x['spider'] == 'avito' and x['callback'] == 'parse_mobile_ad')
+    for fixture in fixtures:
+        if fixture['spider'] != 'avito' or fixture['callback'] != 'parse_ad':
+            continue
+        key = (fixture['url'].replace('//www.', '//m.', 1), bool(fixture.get('state')))
+        if key in mobile:
+            yield fixture, mobile[key]
+
+
+def scrape(spider, desktop, mobile):
+    """
+    The items of both modes for the ad: (desktop+mobile, mobile).
+    """
+    mobile_page = load_page(mobile)
+    with contextlib.redirect_stdout(io.StringIO()):
+        request = next(iter(spider.parse_ad(pages.response(desktop['url'], load_page(desktop)))))
+        both = spider.parse_mobile(pages.response(request.url, mobile_page, request.meta))
+        alone = spider.parse_mobile_ad(pages.response(mobile['url'], mobile_page))
+    return both, alone
+
+
+def main():
+    # The spider logs every ad
+    logging.disable(logging.CRITICAL)
+    spider = AvitoRuSpider()
+    failures = 0
+    checked = 0
+    for desktop, mobile in pairs(manifest()):
+        checked += 1
+        both, alone = scrape(spider, desktop, mobile)
+        fields = sorted(set(both) | set(alone))
+        differences = [x for x in fields if both.get(x) != alone.get(x)]
+        print('{} / {}: {} fields, {} differ'.format(desktop['name'], mobile['name'], len(fields), len(differences)))
+        for field in differences:
+            expected = EXPECTED_DIFFERENCES.get(field)
+            if expected is None:
+                failures += 1
+            print('    {:<14} {}: desktop+mobile {!r}, mobile {!r}'.format(
+                field, 'expected, ' + expected if expected else 'UNEXPECTED', both.get(field), alone.get(field)))
+    if not checked:
+        print('No ad with both a parse_ad and a parse_mobile_ad fixture')
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
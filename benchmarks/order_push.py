@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+# Order push throughput against a local stand-in of the orders API: the
+# former synchronous post per item versus the background OrderPusher.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.order_push [orders] [latency]
+import sys
+import json
+import time
+import logging
+import requests
+from benchmarks.stand_in import StandInOrdersApi
+from avitoscrapper.order_push import OrderPusher
+
+ORDER = {
+    'title': '2-к квартира, 54 м², 5/9 эт.', 'cost': 3150000, 'source': 1,
+    'link': 'https://www.avito.ru/penza/kvartiry/2-k_kvartira_54_m_59_et._1238892161',
+    'order_type': 3, 'placed_at': '2018-11-20 12:30:00', 'city': 'Пенза',
+    'address': 'Пенза, ул. Пушкина, 15', 'category': '2 комнаты', 'category_id': 4,
+    'description': 'Продается светлая квартира в кирпичном доме. ' * 20,
+}
+
+
+def legacy(api, count):
+    for i in range(count):
+        requests.post(api.push_url(), data=json.dumps({'order': dict(ORDER, id=i)}),
+                      headers={'Accept': 'application/json', 'Content-Type': 'application/json'})
+
+
+def pusher(api, count, **kwargs):
+    order_pusher = OrderPusher(api.push_url(), batch_interval=0.2, **kwargs).start()
+    start = time.time()
+    for i in range(count):
+        order_pusher.push(dict(ORDER, id=i))
+    enqueue_time = time.time() - start
+    order_pusher.close()
+    return enqueue_time
+
+
+def run(name, count, latency, send):
+    api = StandInOrdersApi(latency=latency).start_in_thread()
+    start = time.time()
+    enqueue_time = send(api)
+    elapsed = time.time() - start
+    received = len(api.orders)
+    api.stop()
+    blocked = elapsed if enqueue_time is None else enqueue_time
+    print('{:<22} {} orders: {:.2f}s ({:.0f} orders/s), caller blocked {:.3f}s, {} requests, {} received'
+          .format(name, count, elapsed, count / elapsed, blocked, api.requests, received))
+
+
+def main():
+    logging.basicConfig(level=logging.WARNING)
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    run('sync post per item', count, latency, lambda api: legacy(api, count) or None)
+    run('pusher, single posts', count, latency, lambda api: pusher(api, count))
+    run('pusher, batches', count, latency,
+        lambda api: pusher(api, count, batch_url=api.batch_url()))
+    run('pusher, gzip batches', count, latency,
+        lambda api: pusher(api, count, batch_url=api.batch_url(), use_gzip=True))
+
+
+if __name__ == '__main__':
+    main()
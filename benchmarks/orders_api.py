@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# Load test of the paths to the orders API against its local stand-in:
+# AvitoscrapperPipeline (streets and categories at start, create_category
+# for the unknown categories, the orders through its OrderPusher and outbox)
+# and AvitoStandalone's WebClient.post_ad, with the start and stop of a run
+# (create_log.json, remove_old.json) as run.py does them.
+#
+# The stand-in answers after --latency seconds give or take --jitter, fails
+# --error-rate of the requests with 500 and throttles beyond --rate-limit
+# requests/s with 429. Reported for each path: items/s until every order is
+# acknowledged, the time the caller was blocked per item (p99), the latency
+# of the push requests (p50, p95, p99, max) and what the server answered.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.orders_api [--items N] [--latency S] [--jitter S] [--error-rate P]
+#                                     [--rate-limit N] [--burst N] [--batch] [--gzip] [--seed N]
+import io
+import os
+import sys
+import time
+import types
+import shutil
+import asyncio
+import logging
+import argparse
+import tempfile
+import contextlib
+import requests
+from benchmarks.stand_in import StandInOrdersApi
+from benchmarks.order_push import ORDER
+from avitoscrapper.config import RemoteServerSettings
+from avitoscrapper.logger import Logger
+from avitoscrapper.order_push import OrderPusher
+from avitoscrapper.outbox import Outbox
+from avitoscrapper.pipelines import AvitoscrapperPipeline
+
+# Known to the stand-in, through a mapping, or created on the first item
+CATEGORIES = ['2 комнаты', 'Квартиры', 'Дома, дачи, коттеджи', 'Гаражи и машиноместа', 'Коммерческая недвижимость']
+ADDRESSES = ['Пенза, ул. Пушкина, 15', 'Пенза, ул. Кирова, 3', 'Пенза, Московская ул., 40', 'Пенза, ул. Мира, 1']
+
+
+def make_item(i):
+    return dict(ORDER, link='{}?{}'.format(ORDER['link'], i), category=CATEGORIES[i % len(CATEGORIES)],
+                address=ADDRESSES[i % len(ADDRESSES)], image_list=['//img.avito.st/{}.jpg'.format(i)])
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def configure(api, directory, args):
+    AvitoscrapperPipeline.push_url = api.push_url()
+    AvitoscrapperPipeline.get_category_url = api.path_url(StandInOrdersApi.CATEGORIES_PATH)
+    AvitoscrapperPipeline.add_category_url = api.path_url(StandInOrdersApi.ADD_CATEGORY_PATH)
+    RemoteServerSettings.GET_STREET_URL = api.path_url(StandInOrdersApi.STREETS_PATH)
+    RemoteServerSettings.DELETE_URL = api.path_url(StandInOrdersApi.DELETE_PATH)
+    RemoteServerSettings.GET_DISTRICT = True
+    RemoteServerSettings.PUSH_BATCH_URL = api.batch_url() if args.batch else None
+    RemoteServerSettings.PUSH_BATCH_INTERVAL = 0.2
+    RemoteServerSettings.PUSH_GZIP = args.gzip
+    RemoteServerSettings.OUTBOX_DIR = os.path.join(directory, 'outbox')
+    RemoteServerSettings.REFERENCE_CACHE_DIR = os.path.join(directory, 'reference_cache')
+    Logger._Logger__url = api.path_url(StandInOrdersApi.LOG_PATH)
+
+
+def drive_pipeline(count):
+    """
+    A crawl through the pipeline, returns (blocked seconds per item, pusher).
+    The items the pipeline raises on are counted in the stats of the pusher.
+    """
+    Logger.log('INFO', 'Starting the realty scrappers.')
+    pipeline = AvitoscrapperPipeline()
+    spider = types.SimpleNamespace(name='load-test', seen_ads=None)
+    pipeline.open_spider(spider)
+    blocked = []
+    for i in range(count):
+        start = time.perf_counter()
+        try:
+            pipeline.process_item(make_item(i), spider)
+        except Exception as e:
+            # Scrapy logs the error and drops the item
+            pipeline.pusher.count('dropped: {!r}'.format(e), 1)
+        blocked.append(time.perf_counter() - start)
+    pipeline.close_spider(spider)
+    Logger.log('INFO', 'Stopping the realty scrappers')
+    requests.delete(RemoteServerSettings.DELETE_URL)
+    return blocked, pipeline.pusher
+
+
+def drive_web_client(count, api, directory):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'avito_standalone'))
+    from web_client import WebClient
+    outbox = Outbox(os.path.join(directory, 'standalone-outbox'))
+    # Without the proxies, only post_ad is run, with the pusher AvitoStandalone makes
+    web_client = WebClient.__new__(WebClient)
+    web_client.pusher = OrderPusher(api.push_url(), queue=outbox).start()
+    blocked = []
+
+    async def post_all():
+        for i in range(count):
+            start = time.perf_counter()
+            await web_client.post_ad(make_item(i))
+            blocked.append(time.perf_counter() - start)
+
+    asyncio.run(post_all())
+    web_client.pusher.close()
+    outbox.close()
+    return blocked, web_client.pusher
+
+
+def run(name, args, drive):
+    api = StandInOrdersApi(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                           rate_limit=args.rate_limit, burst=args.burst, seed=args.seed).start_in_thread()
+    directory = tempfile.mkdtemp()
+    try:
+        configure(api, directory, args)
+        start = time.time()
+        # The pipeline prints every item
+        with contextlib.redirect_stdout(io.StringIO()):
+            blocked, pusher = drive(api, directory)
+        elapsed = time.time() - start
+    finally:
+        api.stop()
+        shutil.rmtree(directory)
+    latencies = list(pusher.latencies)
+    received = len(set(x['link'] for x in api.orders)) + api.removed
+    print('{}: {} items in {:.2f}s, {:.0f} items/s, {} received'.format(
+        name, args.items, elapsed, args.items / elapsed, received))
+    print('    caller blocked p99 {:.3f} ms/item'.format(percentile(blocked, 0.99) * 1e3))
+    print('    push requests {}: p50 {:.1f} ms, p95 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        len(latencies), percentile(latencies, 0.5) * 1e3, percentile(latencies, 0.95) * 1e3,
+        percentile(latencies, 0.99) * 1e3, max(latencies or [0]) * 1e3))
+    print('    pusher {}'.format(dict(pusher.stats)))
+    for (path, status), answers in sorted(api.answers.items()):
+        print('    {:<26} {} x{}'.format(path, status, answers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline and WebClient pushes against a stand-in orders API')
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.01)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with 500')
+    parser.add_argument('--rate-limit', type=float, default=None, help='requests/s beyond which 429 is answered')
+    parser.add_argument('--burst', type=float, default=None)
+    parser.add_argument('--batch', action='store_true', help='push the batches to create_orders.json')
+    parser.add_argument('--gzip', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    # Failed pushes are retried after OrderPusher.RETRY_DELAY, 2x at each attempt
+    OrderPusher.RETRY_DELAY = 0.1
+    run('AvitoscrapperPipeline', args, lambda api, directory: drive_pipeline(args.items))
+    run('WebClient.post_ad', args, lambda api, directory: drive_web_client(args.items, api, directory))
+
+
+if __name__ == '__main__':
+    main()
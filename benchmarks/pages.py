@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# Synthetic pages shaped like the ones the spiders parse (same markup for
+# every element they look for), and responses built from them.
+import json
+from html import escape
+from urllib.parse import quote
+from scrapy.http import HtmlResponse, Request
+
+AVITO_AD_URL = 'https://www.avito.ru/penza/kvartiry/2-k_kvartira_54_m_59_et._1238892161'
+AVITO_MOBILE_URL = AVITO_AD_URL.replace('www.', 'm.')
+AVITO_LIST_URL = 'https://www.avito.ru/penza/kvartiry?view=list&s=104'
+BAZAR_AD_URL = 'http://bazarpnz.ru/ann/36330946/'
+CIAN_AD_URL = 'https://penza.cian.ru/sale/flat/197367444/'
+
+DESCRIPTION = 'Продается светлая квартира в кирпичном доме, рядом школа, детский сад и остановка. '
+FILLER = ''.join('<div class="banner-{0}"><ul>{1}</ul></div>'.format(
+    i, ''.join('<li><a href="/penza/link_{0}_{1}">Ссылка {1}</a></li>'.format(i, k) for k in range(10)))
+    for i in range(30))
+
+
+def avito_ad():
+    params = [('Количество комнат', '2'), ('Этаж', '5'), ('Этажей в доме', '9'), ('Тип дома', 'кирпичный'),
+              ('Общая площадь', '54 м²'), ('Жилая площадь', '30 м²'), ('Площадь кухни', '9 м²')]
+    return '''<html><head><title>2-к квартира</title>
+<meta itemprop="addressLocality" content="Пенза"></head><body>{filler}
+<div class="breadcrumbs"><a class="js-breadcrumbs-link js-breadcrumbs-link-interaction" href="/penza">Пенза</a>
+<a class="js-breadcrumbs-link js-breadcrumbs-link-interaction" href="/penza/nedvizhimost">Недвижимость</a>
+<a class="js-breadcrumbs-link js-breadcrumbs-link-interaction" href="/penza/kvartiry">Квартиры</a>
+<a class="js-breadcrumbs-link js-breadcrumbs-link-interaction" href="/penza/kvartiry/prodam">Продам</a>
+<a class="js-breadcrumbs-link js-breadcrumbs-link-interaction" href="/penza/kvartiry/prodam/vtorichka">Вторичка</a></div>
+<h1 class="title-info-title"><span class="title-info-title-text">2-к квартира, 54 м², 5/9 эт.</span></h1>
+<div class="title-info-metadata-item">№ 1238892161, размещено 20 ноября в 12:30</div>
+<div class="gallery-imgs-wrapper">{images}</div>
+<span class="price-value-string js-price-value-string"><span class="js-item-price" content="3150000">3 150 000</span></span>
+<div class="seller-info-name"><a href="/user/1">Иван</a></div>
+<ul class="item-params-list">{params}</ul>
+<div class="item-map-location"><span class="item-map-address"><span>Пенза, р-н Октябрьский, ул. Пушкина, 15</span></span></div>
+<div class="item-description"><div class="item-description-text">{description}</div></div>
+{filler}</body></html>'''.format(
+        filler=FILLER,
+        images=''.join('<div class="gallery-img-frame js-gallery-img-frame" data-url="//img.avito.st/{}.jpg"></div>'
+                       .format(i) for i in range(10)),
+        params=''.join('<li class="item-params-list-item"><span class="item-params-label">{}: </span>{}</li>'
+                       .format(k, v) for k, v in params),
+        description=''.join('<p>{}</p>'.format(DESCRIPTION) for _ in range(5)))
+
+
+def avito_state(encoded=False):
+    """
+    The script with the state Avito embeds for its client-side code, the ad
+    being the same as on avito_ad() and avito_mobile(); encoded as a
+    URL-encoded JSON string like on the newer pages.
+    """
+    item = {
+        'id': 1238892161,
+        'title': '2-к квартира, 54 м², 5/9 эт.',
+        'description': '\r\n'.join([DESCRIPTION] * 5),
+        'price': 3150000,
+        'time': 1542706200,
+        'address': 'Пенза, р-н Октябрьский, ул. Пушкина, 15',
+        'location': {'id': 628780, 'name': 'Пенза'},
+        'seller': {'name': 'Иван', 'isCompany': False},
+        'images': [{'75x55': '//img.avito.st/75x55/{}.jpg'.format(i), '640x480': '//img.avito.st/{}.jpg'.format(i)}
+                   for i in range(10)],
+        'parameters': {'flat': [{'title': k, 'description': v} for k, v in
+                                [('Количество комнат', '2'), ('Этаж', '5'), ('Этажей в доме', '9'),
+                                 ('Общая площадь', '54 м²')]]},
+        'phone': '+7 900 123-45-67',
+    }
+    state = {'item': {'item': item},
+             'breadcrumbs': [{'title': x} for x in ['Пенза', 'Недвижимость', 'Квартиры', 'Продам', 'Вторичка']],
+             'banners': [{'id': i, 'links': ['/penza/link_{}_{}'.format(i, k) for k in range(10)]} for i in range(30)]}
+    data = json.dumps(state, ensure_ascii=False)
+    if encoded:
+        data = json.dumps(quote(data))
+    return '<script>window.__initialData__ = {};</script>'.format(data)
+
+
+def with_state(page, encoded=False):
+    return page.replace('</head>', avito_state(encoded) + '</head>', 1)
+
+
+def avito_mobile():
+    params = [('Количество комнат', '2'), ('Этаж', '5'), ('Этажей в доме', '9'), ('Общая площадь', '54 м²')]
+    return '''<html><head><meta property="og:image" content="//img.avito.st/0.jpg"></head><body>{filler}
+<h1 data-marker="item-description/title">2-к квартира, 54 м², 5/9 эт.</h1>
+<span data-marker="item-description/price">3 150 000 ₽</span>
+<div data-marker="item-stats/timestamp">20 ноября в 12:30</div>
+<ul data-marker="item-properties/list">{params}</ul>
+<div data-marker="item-description/text">{description}</div>
+<span data-marker="seller-info/name">Иван</span>
+<div class="_1qEI9"><div class="_1Jm7J">Частное лицо</div></div>
+<span data-marker="delivery/location">Пенза, р-н Октябрьский, ул. Пушкина, 15</span>
+<a data-marker="item-contact-bar/call" href="tel:+7 900 123-45-67">Позвонить</a>
+{filler}</body></html>'''.format(
+        filler=FILLER,
+        params=''.join('<li>{}: {}</li>'.format(k, v) for k, v in params),
+        description=''.join('<p>{}</p>'.format(DESCRIPTION) for _ in range(5)))
+
+
+def avito_listing(count=50, first_id=1238892000, next_url='/penza/kvartiry?p=2&view=list&s=104', total=None,
+                  ads=None):
+    """
+    A listing of count ads numbered from first_id, or of the (id, price)
+    of ads; next_url None for the last page, total the number of ads the
+    title shows.
+    """
+    ads = ads if ads is not None else [(first_id + i, 3000000 + i * 1000) for i in range(count)]
+    items = ''.join('''<div class="item item_table clearfix js-catalog-item-enum" id="i{0}">
+<div class="description"><h3><a class="item-description-title-link" href="/penza/kvartiry/2-k_kvartira_{0}">
+2-к квартира, 54 м², 5/9 эт.</a></h3><span class="price" itemprop="price" content="{1}">{1} ₽</span>
+<div class="data"><p>Пенза, ул. Пушкина, 15</p></div></div></div>'''.format(ad_id, price)
+                    for ad_id, price in ads)
+    title = '<h1>Квартиры <span class="page-title-count">{}</span></h1>'.format(total) if total is not None else ''
+    pagination = '''
+<div class="pagination"><a class="pagination-page js-pagination-next" href="{}">
+Следующая</a></div>'''.format(escape(next_url)) if next_url else ''
+    return '''<html><body>{filler}{title}<div class="catalog-list">{items}</div>{pagination}</body></html>'''.format(
+        filler=FILLER, title=title, items=items, pagination=pagination)
+
+
+def bazar_ad():
+    return '''<html><body>{filler}
+<div id="nav"><a href="/">Базар</a> <a href="/nedvizhimost/">Недвижимость</a> <a href="/kvartiry/">Квартиры</a>
+<a href="/kvartiry/vtor/">Вторичное жилье</a></div>
+<p class="adv_text">{description}</p><span class="price">3&nbsp;150&nbsp;000 руб.</span>
+<p class="contact_info">Количество комнат: 2<br>Общая площадь: 54 кв.м.<br>Этаж: 5</p>
+<p class="contact_info">Имя: Иван<br><a href="/map/">Пенза, ул. Пушкина, 15</a>
+<script>document.write('<a href="tel: 8 902 345-67-89">8&#45;902&#45;345&#45;67&#45;89</a>');</script></p>
+<span class="views">Дата публикации объявления: 20.11.2018 12:30</span>
+{photos}{filler}</body></html>'''.format(
+        filler=FILLER, description=DESCRIPTION * 5,
+        photos=''.join('<a class="big_photo" href="/photos/{}.jpg"></a>'.format(i) for i in range(5)))
+
+
+def cian_ad():
+    params = [('Количество комнат', '2'), ('Этаж', '5 из 9'), ('Этажей в доме', '9'), ('Тип жилья', 'Вторичка')]
+    return '''<html><head><meta property="og:description" content="{description}"></head><body>{filler}
+<div class="a10a3f92e9--breadcrumbs--1kChM"><span><a title="Пенза">Пенза</a></span>
+<span><a title="Продажа">Продажа</a></span><span><a title="2-комнатные">2-комнатные</a></span></div>
+<h1 class="a10a3f92e9--title--2Widg">2-комн. квартира, 54 м²</h1>
+<div class="a10a3f92e9--container--3nJ0d">20 ноя, 12:30</div>
+<span itemprop="price" content="3&nbsp;150&nbsp;000 ₽"></span>
+<a class="a10a3f92e9--phone--3XYRR" href="tel:+79001234567">+7 900 123-45-67</a>
+<div class="a10a3f92e9--geo--18qoo"><span content="Пензенская область, Пенза, ул. Пушкина, 15"></span></div>
+<div class="a10a3f92e9--info--2ywQI"><div class="a10a3f92e9--info-title--mSyXn">Общая</div>
+<div class="a10a3f92e9--info-text--2uhvD">54 м²</div></div>
+<ul>{params}</ul><h2 class="a10a3f92e9--title--2Zrxn">Иван</h2>
+<img class="a10a3f92e9--photo--3ybE1" src="https://cdn.cian.ru/0.jpg">{photos}{filler}</body></html>'''.format(
+        filler=FILLER, description=DESCRIPTION,
+        params=''.join('<li class="a10a3f92e9--item--_ipjK"><span class="a10a3f92e9--name--3bt8k">{}</span>'
+                       '<span class="a10a3f92e9--value--3Ftu5">{}</span></li>'.format(k, v) for k, v in params),
+        photos=''.join('<img class="fotorama__img" src="https://cdn.cian.ru/{}.jpg">'.format(i) for i in range(1, 6)))
+
+
+def response(url, body, meta=None):
+    request = Request(url, meta=meta or {})
+    return HtmlResponse(url, body=body.encode('utf-8'), encoding='utf-8', request=request)
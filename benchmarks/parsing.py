@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# Offline benchmark of every spider callback over the pages of
+# fixtures/manifest.json, without the sites. A fixture is either a recorded
+# page (a file of fixtures/, .html or .html.gz) or 'pages:<function>' for
+# a synthetic page of pages.py; "state" adds the JSON state Avito embeds.
+#
+# No recorded page ships with the repository, every fixture of the manifest
+# is synthetic: the sites could not be reached to record them, and a real
+# ad page holds the phone and name of its seller, which are not to be
+# committed. The synthetic pages have the markup the spiders select (and
+# banners and link lists around it for a realistic size), so the numbers
+# compare versions of the callbacks with each other; they do not tell the
+# cost of the real pages, which are larger and vary between sections. To
+# benchmark real pages, save them gzipped under fixtures/ (with the seller's
+# details replaced) and add an entry per spider and callback, e.g.
+#     {"name": "avito ad, recorded", "spider": "avito", "callback": "parse_ad",
+#      "url": "https://www.avito.ru/...", "page": "avito_ad_1238892161.html.gz"}
+#
+# For each fixture it reports:
+#   - pages/s of the callback on fresh responses, document parsing included,
+#   - the time lxml alone takes to build the tree of the page,
+#   - the time of each of its "fields" getters on a parsed document (the
+#     first getter of a shared structure, e.g. the parameter list, pays for
+#     it),
+#   - the peak Python memory allocated for a page and what remains of it
+#     (tracemalloc does not see the memory of libxml2's trees).
+#
+# The results are compared with baseline.json, a fixture slower or taking
+# more memory than --tolerance is a regression (exit status 1). Speed is
+# compared as the time of the callback over the time of lxml on the same
+# page, which depends much less on the machine than pages/s.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.parsing [--calls N] [--fields] [--save-baseline] [--tolerance 0.25] [name ...]
+import gc
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tracemalloc
+import contextlib
+from lxml import html
+from avitoscrapper.config import SeenAdsSettings
+from benchmarks import pages
+
+# Nothing to remember across the calls of a benchmark
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+from avitoscrapper.spiders.bazarpnz import BazarpnzSpider
+from avitoscrapper.spiders.cian import CianSpider
+
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(DIRECTORY, 'fixtures')
+BASELINE = os.path.join(DIRECTORY, 'baseline.json')
+
+
+class FixtureClient(object):
+    """
+    Stands for AvitoStandalone's WebClient: serves the page of the fixture
+    and keeps the ads posted.
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.posted = []
+
+    async def get(self, url, session):
+        return self.page
+
+    async def post_ad(self, ad):
+        self.posted.append(ad)
+
+
+def manifest():
+    with open(os.path.join(FIXTURES, 'manifest.json'), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_page(fixture):
+    source = fixture['page']
+    if source.startswith('pages:'):
+        page = getattr(pages, source[len('pages:'):])()
+    else:
+        path = os.path.join(FIXTURES, source)
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as f:
+            page = f.read().decode('utf-8')
+    return pages.with_state(page, fixture['url'].startswith('https://m.')) if fixture.get('state') else page
+
+
+def standalone():
+    sys.path.insert(0, os.path.join(os.path.dirname(DIRECTORY), 'avito_standalone'))
+    from avito_standalone import AvitoStandalone
+    # Without its proxies, pusher and sessions, only process_ad is run
+    return AvitoStandalone.__new__(AvitoStandalone)
+
+
+def consume(result):
+    if result is None or isinstance(result, dict) or hasattr(result, 'fields'):
+        return result
+    return list(result)
+
+
+class Case(object):
+    SPIDERS = {'avito': AvitoRuSpider, 'bazarpnz': BazarpnzSpider, 'cian': CianSpider}
+
+    def __init__(self, fixture, spiders):
+        self.fixture = fixture
+        self.name = fixture['name']
+        self.page = load_page(fixture)
+        kind = fixture['spider']
+        if kind not in spiders:
+            spiders[kind] = standalone() if kind == 'standalone' else Case.SPIDERS[kind]()
+        self.spider = spiders[kind]
+        self.callback = getattr(self.spider, fixture['callback'])
+        self.loop = asyncio.new_event_loop() if kind == 'standalone' else None
+
+    def response(self):
+        meta = dict((k, dict(v) if isinstance(v, dict) else v) for k, v in self.fixture.get('meta', {}).items())
+        return pages.response(self.fixture['url'], self.page, meta)
+
+    def run(self):
+        """
+        A callback on a fresh response, or process_ad on the page as is.
+        """
+        if self.fixture['spider'] == 'standalone':
+            self.spider.web_client = FixtureClient(self.page)
+            self.loop.run_until_complete(self.callback({'link': self.fixture['url']}, None))
+            return self.spider.web_client.posted
+        return consume(self.callback(self.response()))
+
+
+def timed(function, calls, rounds=5):
+    """
+    CPU seconds per call, the best of a few rounds.
+    """
+    best = None
+    for _ in range(rounds):
+        start = time.process_time()
+        for _ in range(calls):
+            function()
+        elapsed = (time.process_time() - start) / calls
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(case, calls, fields):
+    result = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        result['pages_per_sec'] = 1.0 / timed(case.run, calls)
+        result['lxml_us'] = timed(lambda: html.fromstring(case.page), calls) * 1e6
+        result['lxml_ratio'] = 1e6 / result['pages_per_sec'] / result['lxml_us']
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        case.run()
+        # Responses and their selectors reference each other
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result['peak_kb'] = (peak - before) / 1024.0
+        result['retained_kb'] = (current - before) / 1024.0
+        if fields:
+            result['fields_us'] = {}
+            for field, getter in sorted(case.fixture.get('fields', {}).items()):
+                responses = [case.response() for _ in range(calls)]
+                for response in responses:
+                    response.selector
+                method = getattr(case.spider, getter)
+                start = time.process_time()
+                for response in responses:
+                    method(response)
+                result['fields_us'][field] = (time.process_time() - start) / calls * 1e6
+    return result
+
+
+def compare(name, result, baseline, tolerance):
+    """
+    The regressions of result against the baseline of the fixture.
+    """
+    if name not in baseline:
+        return []
+    old = baseline[name]
+    problems = []
+    if result['lxml_ratio'] > old['lxml_ratio'] * (1 + tolerance):
+        problems.append('{:.2f} lxml parses/page, was {:.2f}'.format(result['lxml_ratio'], old['lxml_ratio']))
+    if result['peak_kb'] > old['peak_kb'] * (1 + tolerance):
+        problems.append('peak {:.0f} KB, was {:.0f}'.format(result['peak_kb'], old['peak_kb']))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Spider callbacks over the recorded and synthetic pages')
+    parser.add_argument('names', nargs='*', help='fixtures to run, all by default')
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--fields', action='store_true', help='time each field getter')
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    fixtures = [x for x in manifest() if not args.names or x['name'] in args.names]
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    # The spiders and AvitoStandalone log every ad
+    logging.disable(logging.CRITICAL)
+    spiders = {}
+    results = {}
+    regressions = 0
+    print('{:<26} {:>9} {:>9} {:>9} {:>9} {:>9}'.format('fixture', 'pages/s', 'lxml us', '/ lxml', 'peak KB',
+                                                      'kept KB'))
+    for fixture in fixtures:
+        case = Case(fixture, spiders)
+        result = results[case.name] = measure(case, args.calls, args.fields)
+        problems = compare(case.name, result, baseline, args.tolerance)
+        regressions += bool(problems)
+        print('{:<26} {:9.0f} {:9.0f} {:9.2f} {:9.1f} {:9.1f}{}'.format(
+            case.name, result['pages_per_sec'], result['lxml_us'], result['lxml_ratio'], result['peak_kb'],
+            result['retained_kb'],
+            '  REGRESSION: ' + '; '.join(problems) if problems else ''))
+        for field, elapsed in sorted(result.get('fields_us', {}).items(), key=lambda x: -x[1]):
+            print('    {:<22} {:8.1f} us'.format(field, elapsed))
+
+    if args.save_baseline:
+        baseline.update((k, dict((x, y) for x, y in v.items() if x != 'fields_us')) for k, v in results.items())
+        with open(BASELINE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+        print('Baseline saved to {}'.format(BASELINE))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Crawl of a large search with and without AvitoSettings.PARTITION, the
+# spider callbacks being run on the listings of a synthetic market: --ads
+# ads with log-normal prices, a pagination stopping after --page-cap pages
+# like Avito's. Downloads are simulated (every listing takes --latency
+# seconds, --concurrency at a time), so the report gives the ads reached,
+# the listing requests and the time it would take to go through the
+# listings, serially page after page versus in price slices at once.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.partitioning [--ads N] [--page-cap N] [--slice-pages N] [--latency S] [--concurrency N]
+import io
+import heapq
+import random
+import argparse
+import collections
+import contextlib
+from urllib.parse import urlsplit, parse_qs, urlencode
+from avitoscrapper.config import AvitoSettings, SeenAdsSettings
+from benchmarks import pages
+
+# Nothing to remember across the runs of a benchmark
+SeenAdsSettings.DB = None
+
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+
+SEARCH = 'https://www.avito.ru/{}/kvartiry?view=list&s=104'
+FIRST_ID = 1000000000
+
+
+class Market(object):
+    """
+    The site: the listing of a search URL (pmin, pmax, p), newest first.
+    """
+
+    def __init__(self, count, page_cap, seed=1):
+        rng = random.Random(seed)
+        self.prices = [int(rng.lognormvariate(15, 0.6)) for _ in range(count)]
+        self.page_cap = page_cap
+
+    def listing(self, url):
+        query = parse_qs(urlsplit(url).query)
+        low = int(query.get('pmin', ['0'])[0])
+        high = int(query['pmax'][0]) if 'pmax' in query else None
+        page = int(query.get('p', ['1'])[0])
+        ids = [i for i, x in enumerate(self.prices) if x >= low and (high is None or x <= high)]
+        per_page = AvitoSettings.ADS_PER_PAGE
+        last_page = min(self.page_cap, (len(ids) + per_page - 1) // per_page)
+        shown = ids[(page - 1) * per_page:page * per_page] if page <= last_page else []
+        next_url = None
+        if page < last_page:
+            next_query = dict((k, v[0]) for k, v in query.items())
+            next_query['p'] = page + 1
+            next_url = urlsplit(url).path + '?' + urlencode(next_query)
+        return pages.avito_listing(next_url=next_url, total=len(ids),
+                                   ads=[(FIRST_ID + i, self.prices[i]) for i in shown])
+
+
+class Stats(object):
+    def __init__(self):
+        self.values = collections.Counter()
+
+    def inc_value(self, key, count=1):
+        self.values[key] += count
+
+
+def crawl(market, partition, latency, concurrency):
+    """
+    Runs the listings of the search through the spider, returns
+    (ads reached, listing requests, simulated seconds, spider stats).
+    """
+    AvitoSettings.PARTITION = partition
+    spider = AvitoRuSpider()
+    spider.crawler = type('Crawler', (object, ), {'stats': Stats()})()
+    waiting = collections.deque(spider.start_requests())
+    running = []
+    seen = set()
+    ads = set()
+    requests = 0
+    now = 0.0
+    while waiting or running:
+        while waiting and len(running) < concurrency:
+            request = waiting.popleft()
+            if request.url in seen and not request.dont_filter:
+                continue
+            seen.add(request.url)
+            requests += 1
+            heapq.heappush(running, (now + latency, requests, request))
+        if not running:
+            break
+        now, _, request = heapq.heappop(running)
+        response = pages.response(request.url, market.listing(request.url), request.meta)
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = request.callback(response)
+        for x in result or []:
+            if x.callback in (spider.parse, spider.parse_partition):
+                waiting.append(x)
+            else:
+                ads.add(x.url)
+    return len(ads), requests, now, dict(spider.crawler.stats.values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Listings crawled serially versus in price slices')
+    parser.add_argument('--ads', type=int, default=30000)
+    parser.add_argument('--page-cap', type=int, default=AvitoSettings.PAGE_CAP)
+    parser.add_argument('--slice-pages', type=int, default=AvitoSettings.SLICE_PAGES)
+    parser.add_argument('--latency', type=float, default=1.0, help='seconds per listing page')
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    AvitoSettings.URL_FORMATS = [SEARCH]
+    AvitoSettings.LOCATION_PARTS = ['penza']
+    AvitoSettings.SCRAPPING_DEPTH = None
+    AvitoSettings.AD_DEPTH = AvitoSettings.RANGE_LEFT = AvitoSettings.RANGE_RIGHT = None
+    AvitoSettings.PAGE_CAP = args.page_cap
+    AvitoSettings.SLICE_PAGES = args.slice_pages
+    market = Market(args.ads, args.page_cap)
+    for name, partition in (('serial pagination', False), ('price partitions', True)):
+        ads, requests, elapsed, stats = crawl(market, partition, args.latency, args.concurrency)
+        print('{:<18} {:6d}/{} ads reached, {:5d} listings, {:7.0f} s of listings{}'.format(
+            name, ads, args.ads, requests, elapsed,
+            ', {}'.format(stats) if stats else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Phone scripts of bazarpnz.ru/i58.ru ads: js2py, as BazarpnzSpider ran
+# them before, versus the native phone_decoder, without and with its memo.
+#
+# Two sets of scripts are run: the fixtures of fixtures/phone_scripts.json,
+# one per form a site may write the contacts in, and `scripts` generated
+# from TEMPLATES with random numbers. No script recorded on the sites ships
+# (they could not be reached, and each holds a seller's phone): the
+# fixtures are reconstructions of what BazarpnzSpider.get_phone is written
+# to handle (a tel: link or the bare number, -, +, ( and ) as HTML
+# entities) in the usual ways of hiding a string in JavaScript, and a few
+# beyond the native decoder (a function, operations on values of the wrong
+# type) which must go to the js2py fallback. For each script the output
+# must be the one of js2py.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.phone_scripts [scripts]
+import os
+import sys
+import json
+import time
+import random
+import js2py
+from avitoscrapper.phone_decoder import PhoneScriptDecoder, UnsupportedScript, decode_script
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'phone_scripts.json')
+
+# The shapes the sites write the contacts with, {} being the phone number
+TEMPLATES = [
+    """document.write('<a href="tel: {tel}">{html}</a>');""",
+    """document.write('<a href="tel:' + '{tel}' + '">' + '{html}' + '</a>');""",
+    """document.write(String.fromCharCode({codes}));""",
+    """var p = unescape('{percent}');
+document.write('<a href="tel:' + p + '">' + p + '</a>');""",
+    """var s = '{reversed}';
+document.write(s.split('').reverse().join(''));""",
+]
+
+
+def make_script(rng):
+    tel = '8 9{:02d} {:03d}-{:02d}-{:02d}'.format(rng.randint(0, 99), rng.randint(0, 999),
+                                                  rng.randint(0, 99), rng.randint(0, 99))
+    return rng.choice(TEMPLATES).format(
+        tel=tel, html=tel.replace('-', '&#45;'), codes=', '.join(str(ord(x)) for x in tel),
+        percent=''.join('%{:02X}'.format(ord(x)) for x in tel), reversed=tel[::-1])
+
+
+def load_fixtures():
+    with open(FIXTURES, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def run_js2py(scripts):
+    context = js2py.EvalJs()
+    outputs = []
+    for script in scripts:
+        context.execute('var output; document = {write: function(value){ output = value; }};\n' + script)
+        outputs.append(str(context.output))
+    return outputs
+
+
+def run_native(scripts):
+    outputs = []
+    for script in scripts:
+        try:
+            outputs.append(decode_script(script))
+        except UnsupportedScript:
+            outputs.append(None)
+    return outputs
+
+
+def check_fixtures(fixtures):
+    """
+    Prints the fixtures the native decoder gets wrong or leaves to the
+    fallback, returns the number of wrong ones.
+    """
+    scripts = [x['script'] for x in fixtures]
+    wrong = 0
+    for fixture, expected, native in zip(fixtures, run_js2py(scripts), run_native(scripts)):
+        if native is None:
+            print('    {:<24} fallback ({})'.format(fixture['name'], fixture['note']))
+        elif native != expected:
+            wrong += 1
+            print('    {:<24} WRONG: {!r}, js2py {!r}'.format(fixture['name'], native, expected))
+    return wrong
+
+
+def run(name, scripts, decode):
+    start = time.process_time()
+    outputs = decode(scripts)
+    elapsed = time.process_time() - start
+    print('{:<26} {:9.1f} us/script'.format(name, elapsed / len(scripts) * 1e6))
+    return outputs
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rng = random.Random(1)
+    fixtures = load_fixtures()
+    print('{} fixtures'.format(len(fixtures)))
+    wrong = check_fixtures(fixtures)
+    # As many scripts as generated ones, the fixtures in turn
+    scripts = [fixtures[i % len(fixtures)]['script'] for i in range(count)]
+    decoder = PhoneScriptDecoder(fallback=lambda x: run_js2py([x])[0], memo_size=0)
+    expected = run('js2py', scripts, run_js2py)
+    native = run('native + fallback', scripts, lambda x: [decoder.decode(y) for y in x])
+    identical = native == expected
+    print('outputs identical to js2py: {}, decoder {}'.format(identical, dict(decoder.stats)))
+
+    print('{} generated scripts'.format(count))
+    scripts = [make_script(rng) for _ in range(count)]
+    # The same few agencies post most of the ads
+    repeated = [rng.choice(scripts[:count // 10 or 1]) for _ in range(count)]
+    expected = run('js2py', scripts, run_js2py)
+    native = run('native', scripts, lambda x: [decode_script(y) for y in x])
+    decoder = PhoneScriptDecoder()
+    run('native + memo, repeated', repeated, lambda x: [decoder.decode(y) for y in x])
+    print('outputs identical to js2py: {}, decoder {}'.format(native == expected, dict(decoder.stats)))
+    return 0 if not wrong and identical and native == expected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
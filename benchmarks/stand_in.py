@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+# Local stand-ins for the remote services, so that tools and benchmarks can
+# run on a single machine without touching the real ones.
+import json
+import gzip
+import zlib
+import random
+import asyncio
+import threading
+import collections
+
+
+class StandInServer(object):
+    """
+    Base asyncio server which can also be run from a background thread, so
+    that blocking clients (requests, scrapy) can talk to it.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def accept(self, reader, writer):
+        self.connections += 1
+        try:
+            await self.handle(reader, writer)
+        except (OSError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle(self, reader, writer):
+        raise NotImplementedError()
+
+    def start_in_thread(self):
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self.thread is not None:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+        elif self.server is not None:
+            self.server.close()
+
+    async def shutdown(self):
+        self.server.close()
+        tasks = [x for x in asyncio.all_tasks() if x is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self.port)
+
+    @staticmethod
+    async def read_head(reader):
+        """
+        Returns (method, target, headers) of the next request on the
+        connection or None when the client has closed it.
+        """
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+        return method, target, headers
+
+    @staticmethod
+    def response(status, reason, body=b'', headers=None, keep_alive=True):
+        lines = ['HTTP/1.1 {} {}'.format(status, reason),
+                 'Content-Length: {}'.format(len(body)),
+                 'Connection: {}'.format('keep-alive' if keep_alive else 'close')]
+        lines += ['{}: {}'.format(k, v) for k, v in (headers or {}).items()]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+
+
+class StandInProxy(StandInServer):
+    """
+    Stand-in for the superproxy. Plain http requests are answered by the
+    proxy itself, CONNECT tunnels are piped to the requested host (usually
+    another stand-in). Connections are kept alive, and the credentials seen
+    on every request are recorded, so that connection reuse and per-request
+    sessions can be checked.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0,
+                 accepted_auth=None, body=b'User-agent: *\n', seed=None):
+        StandInServer.__init__(self, host, port)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        # None accepts any credentials, otherwise a set of Proxy-Authorization values
+        self.accepted_auth = accepted_auth
+        self.body = body
+        self.random = random.Random(seed)
+        self.auth_seen = []
+
+    async def handle(self, reader, writer):
+        while True:
+            head = await self.read_head(reader)
+            if head is None:
+                return
+            method, target, headers = head
+            self.requests += 1
+            auth = headers.get('proxy-authorization')
+            self.auth_seen.append(auth)
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            if self.accepted_auth is not None and auth not in self.accepted_auth:
+                writer.write(self.response(407, 'Proxy Authentication Required', keep_alive=keep_alive))
+            elif self.random.random() < self.failure_rate:
+                writer.write(self.response(502, 'Bad Gateway', keep_alive=keep_alive))
+            elif method == 'CONNECT':
+                await self.tunnel(target, reader, writer)
+                return
+            else:
+                length = int(headers.get('content-length', 0))
+                if length:
+                    await reader.readexactly(length)
+                writer.write(self.response(200, 'OK', self.body, keep_alive=keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+
+    async def tunnel(self, target, reader, writer):
+        host, port = target.rsplit(':', 1)
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(host, int(port))
+        except OSError:
+            writer.write(self.response(502, 'Bad Gateway', keep_alive=False))
+            return
+        writer.write(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        await writer.drain()
+
+        async def pipe(source, destination):
+            try:
+                while True:
+                    data = await source.read(65536)
+                    if not data:
+                        break
+                    destination.write(data)
+                    await destination.drain()
+            except OSError:
+                pass
+            finally:
+                destination.close()
+
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+
+class StandInOrdersApi(StandInServer):
+    """
+    Stand-in for the orders API (RemoteServerSettings):
+
+        POST /api/create_order.json   an order, {'order': {...}}
+        POST /api/create_orders.json  a batch, {'orders': [...]}
+        GET  /api/get_categories      the categories, with an ETag
+        POST /api/create_category     {'category': {'name': ...}}
+        GET  /api/get_streets         the streets, with an ETag
+        *    /api/remove_old.json     drops the orders received so far
+        POST /api/create_log.json     {'grubber_log': {...}}
+
+    Bodies may be gzip-compressed. Every answer comes after latency seconds,
+    give or take jitter. A request fails with 500 with probability
+    error_rate, and with 429 beyond rate_limit requests per second (bursts
+    of up to burst requests), like an overloaded server would.
+    """
+    PUSH_PATH = '/api/create_order.json'
+    BATCH_PATH = '/api/create_orders.json'
+    CATEGORIES_PATH = '/api/get_categories'
+    ADD_CATEGORY_PATH = '/api/create_category'
+    STREETS_PATH = '/api/get_streets'
+    DELETE_PATH = '/api/remove_old.json'
+    LOG_PATH = '/api/create_log.json'
+    CATEGORIES = [{'id': 1, 'name': 'Квартиры', 'mapping': '1 комната|2 комнаты|3 комнаты'},
+                  {'id': 2, 'name': 'Комнаты', 'mapping': ''},
+                  {'id': 3, 'name': 'Дома', 'mapping': ''},
+                  {'id': 4, 'name': 'Участки', 'mapping': ''}]
+    STREETS = [{'name': 'Пушкина', 'district_id': 1}, {'name': 'Лермонтова', 'district_id': 2},
+               {'name': 'Кирова', 'district_id': 3}, {'name': 'Московская', 'district_id': 1}]
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate_limit=None,
+                 burst=None, seed=None, categories=None, streets=None):
+        StandInServer.__init__(self, host, port)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self.tokens = self.burst
+        self.refilled_at = None
+        self.random = random.Random(seed)
+        self.orders = []
+        self.logs = []
+        self.removed = 0
+        self.categories = [dict(x) for x in (categories if categories is not None else StandInOrdersApi.CATEGORIES)]
+        self.streets = list(streets if streets is not None else StandInOrdersApi.STREETS)
+        # (path, status) -> count
+        self.answers = collections.Counter()
+
+    def path_url(self, path):
+        return self.url + path
+
+    def push_url(self):
+        return self.path_url(StandInOrdersApi.PUSH_PATH)
+
+    def batch_url(self):
+        return self.path_url(StandInOrdersApi.BATCH_PATH)
+
+    def delay(self):
+        if self.jitter:
+            return max(0.0, self.random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+        return self.latency
+
+    def throttled(self):
+        """
+        Takes a token of the bucket, True if there was none left.
+        """
+        if self.rate_limit is None:
+            return False
+        now = self.loop.time()
+        if self.refilled_at is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate_limit)
+        self.refilled_at = now
+        if self.tokens < 1:
+            return True
+        self.tokens -= 1
+        return False
+
+    async def handle(self, reader, writer):
+        while True:
+            head = await self.read_head(reader)
+            if head is None:
+                return
+            method, target, headers = head
+            self.requests += 1
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            if headers.get('content-encoding') == 'gzip':
+                body = gzip.decompress(body)
+            path = target.split('?')[0]
+            throttled = self.throttled()
+            delay = self.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            extra = {'Content-Type': 'application/json'}
+            if throttled:
+                status, data = 429, {'error': 'Too many requests'}
+                extra['Retry-After'] = '1'
+            elif self.random.random() < self.error_rate:
+                status, data = 500, {'error': 'Internal server error'}
+            else:
+                status, data = self.route(method, path, json.loads(body.decode()) if body else None)
+                if method == 'GET' and status == 200:
+                    extra['ETag'] = etag = '"{:08x}"'.format(zlib.crc32(json.dumps(data).encode()))
+                    if headers.get('if-none-match') == etag:
+                        status, data = 304, None
+            self.answers[path, status] += 1
+            keep_alive = headers.get('connection', '').lower() != 'close'
+            writer.write(self.response(status, 'OK' if status < 400 else 'Error',
+                                       json.dumps(data).encode() if data is not None else b'', extra, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                return
+
+    def route(self, method, path, data):
+        if method == 'POST' and path == StandInOrdersApi.PUSH_PATH:
+            self.orders.append(data['order'])
+            return 200, {'status': 'ok'}
+        if method == 'POST' and path == StandInOrdersApi.BATCH_PATH:
+            self.orders += data['orders']
+            return 200, {'status': 'ok', 'count': len(data['orders'])}
+        if method == 'GET' and path == StandInOrdersApi.CATEGORIES_PATH:
+            return 200, self.categories
+        if method == 'POST' and path == StandInOrdersApi.ADD_CATEGORY_PATH:
+            category = {'id': max([x['id'] for x in self.categories] or [0]) + 1,
+                        'name': data['category']['name'], 'mapping': ''}
+            self.categories.append(category)
+            return 200, category
+        if method == 'GET' and path == StandInOrdersApi.STREETS_PATH:
+            return 200, self.streets
+        if path == StandInOrdersApi.DELETE_PATH:
+            removed, self.removed, self.orders = len(self.orders), self.removed + len(self.orders), []
+            return 200, {'status': 'ok', 'removed': removed}
+        if method == 'POST' and path == StandInOrdersApi.LOG_PATH:
+            self.logs.append(data['grubber_log'])
+            return 200, {'status': 'ok'}
+        return 404, {'error': 'Not found'}
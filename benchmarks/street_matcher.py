@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# District resolution: the former street-by-street substring scan versus
+# the Aho-Corasick StreetMatcher, on a city-sized street list.
+#
+# Usage (from the repository root):
+#     python -m benchmarks.street_matcher [streets] [items]
+import sys
+import time
+import random
+from avitoscrapper.street_matcher import StreetMatcher, normalize_string
+
+ROOTS = ['москов', 'пушкин', 'лермонтов', 'гагарин', 'киров', 'ленин', 'чехов', 'толст', 'горьк', 'суворов',
+         'кутузов', 'жуков', 'чкалов', 'королёв', 'циолковск', 'мичурин', 'некрасов', 'тургенев', 'белинск',
+         'радищев', 'ломоносов', 'менделеев', 'попов', 'павлов', 'титов', 'фрунзе', 'чапаев', 'щорс', 'дзержинск',
+         'калинин', 'свердлов', 'урицк', 'володарск', 'бакунин', 'герцен', 'огарёв', 'плеханов', 'крупск',
+         'луначарск', 'островск', 'маяковск', 'есенин', 'блок', 'пархоменк', 'ворошилов', 'будённ', 'тухачевск',
+         'строител', 'садов', 'лугов', 'лесн', 'полев', 'речн', 'озёрн', 'школьн', 'заводск', 'вокзальн',
+         'пролетарск', 'советск', 'красноармейск', 'комсомольск', 'пионерск', 'октябрьск', 'первомайск']
+SUFFIXES = ['ая', 'ий проезд', 'ий переулок', 'ая набережная', 'ий тупик', 'ое шоссе', 'ий бульвар', 'ая площадь']
+TEMPLATES = ['{}-к квартира, {} м², {}/9 эт.', 'Дом {} м² на участке {} сот.', 'Комната {} м² в {}-к, {}/5 эт.']
+ADDRESSES = ['Пенза, ул. {}, {}', 'Пензенская область, Пенза, {} {}', 'Пенза, р-н Октябрьский, {}, {}']
+
+
+def make_streets(count):
+    streets = []
+    for i in range(count):
+        root = ROOTS[i % len(ROOTS)]
+        suffix = SUFFIXES[(i // len(ROOTS)) % len(SUFFIXES)]
+        number = i // (len(ROOTS) * len(SUFFIXES))
+        streets.append('{}{}{}'.format(number + 1 if number else '', '-я ' if number else '', root + suffix))
+    return dict((x, i % 6 + 1) for i, x in enumerate(streets))
+
+
+def make_items(streets, count, rng):
+    names = list(streets)
+    items = []
+    for _ in range(count):
+        street = rng.choice(names) if rng.random() < 0.8 else 'Неизвестная'
+        items.append({
+            'title': rng.choice(TEMPLATES).format(rng.randint(1, 4), rng.randint(20, 120), rng.randint(1, 9)),
+            'address': rng.choice(ADDRESSES).format(street.capitalize(), rng.randint(1, 200)),
+        })
+    return items
+
+
+def legacy_get_district(street_map, item):
+    title = normalize_string(item['title'] if 'title' in item else None)
+    address = normalize_string(item['address'] if 'address' in item else None)
+    if title:
+        for key in street_map:
+            if key in title:
+                return street_map[key]
+    if address:
+        for key in street_map:
+            if key in address:
+                return street_map[key]
+    return None
+
+
+def main():
+    street_count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    item_count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    rng = random.Random(1)
+    streets = make_streets(street_count)
+    items = make_items(streets, item_count, rng)
+    normalized = dict((normalize_string(k), v) for k, v in streets.items())
+
+    start = time.time()
+    matcher = StreetMatcher(streets)
+    build_time = time.time() - start
+
+    start = time.time()
+    legacy = [legacy_get_district(normalized, x) for x in items]
+    legacy_time = time.time() - start
+
+    start = time.time()
+    found = [matcher.find(x['title']) or matcher.find(x['address']) for x in items]
+    matcher_time = time.time() - start
+
+    print('{} streets ({} states, built in {:.1f}ms), {} items'.format(
+        street_count, len(matcher), build_time * 1e3, item_count))
+    print('substring scan: {:8.1f} us/item'.format(legacy_time / item_count * 1e6))
+    print('aho-corasick:   {:8.1f} us/item'.format(matcher_time / item_count * 1e6))
+    print('resolved: scan {}, automaton {}, other district (longer name won) {}'.format(
+        sum(x is not None for x in legacy), sum(x is not None for x in found),
+        sum(a != b for a, b in zip(legacy, found))))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,27 @@
-file_name = 'ips-zone1.txt'
-with open(file_name, 'r') as f:
-	lines = f.readlines()
-	for line in lines:
-		items = line.strip().split(':')
-		print('http://{}:{}@{}:{}'.format(items[2], items[3], items[0], items[1]))
+import sys
+import argparse
+from avitoscrapper.proxy_pool import parse_proxy_lines
+from avitoscrapper.proxy_index import write_proxy_index
+
+# Converts ips-zone1.txt / test.txt style proxy lists (host:port:user:pass,
+# user:pass@host:port or full urls), drops malformed lines and duplicates and
+# writes either a text list of urls or a compiled index for PROXY_LIST.
+parser = argparse.ArgumentParser(description='Normalize and compile a proxy list')
+parser.add_argument('source', nargs='?', default='ips-zone1.txt')
+parser.add_argument('-o', '--output', help='write a compiled (mmap) index to this file')
+parser.add_argument('-t', '--text', help='write the normalized text list to this file instead of stdout')
+args = parser.parse_args()
+
+with open(args.source, 'r') as f:
+    proxies = parse_proxy_lines(f)
+
+if args.output:
+    write_proxy_index(proxies, args.output)
+    sys.stderr.write('{} proxies compiled into {}\n'.format(len(proxies), args.output))
+else:
+    text = ''.join(x.url + '\n' for x in proxies)
+    if args.text:
+        with open(args.text, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
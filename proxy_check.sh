@@ -1,8 +1,4 @@
 #!/bin/bash
-cat ips-zone-processed.txt | while read line; do
-response=`curl -L http://avito.ru/robots.txt -x $line  --write-out %{http_code} --silent --output /dev/null`
-if [ $response <> 502 ]
-then
-	echo  $line;
-fi;
-done
+# Checks all proxies concurrently and keeps the working ones, fastest first.
+# Extra arguments are passed to the checker, e.g. -c 1000 -o proxies.idx
+python3 avito_standalone/proxy_checker.py ips-zone-processed.txt -t checked_proxies.txt -r proxy_report.tsv "$@"
@@ -0,0 +1,96 @@
+# Runs AvitoRuSpider split in shards (see avitoscrapper/sharding.py), a
+# process per shard, and merges their stats.
+#
+#   python run_sharded.py --shards 8                 all 8 shards on this machine
+#   python run_sharded.py --shards 16 --ids 0-7      shards 0 to 7 of 16 (one node)
+#   python run_sharded.py --shards 16 --ids 8-15     the others (another node)
+#   python run_sharded.py --merge shard_stats        the stats of all the nodes, once copied together
+#   python run_sharded.py --shards 16 --plan         the seeds of each shard
+#
+# Each shard keeps its own seen ads, outbox and feed (<name>.shard-<i>), so
+# no state is shared between the nodes but the API; its stats are written to
+# <ShardSettings.STATS_DIR>/shard-<i>-of-<n>.json.
+import os
+import sys
+import json
+import glob
+import argparse
+from multiprocessing import Process
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from avitoscrapper.config import AvitoSettings, ShardSettings
+from avitoscrapper.sharding import plan, dump_stats, merge_stats
+from avitoscrapper.spiders.avito_ru import AvitoRuSpider
+
+
+def stats_file(directory, index, count):
+    return os.path.join(directory, 'shard-{}-of-{}.json'.format(index, count))
+
+
+def run_shard(index, count, stats_dir):
+    # The spider, its pipelines and feed take the files of its shard
+    process = CrawlerProcess(get_project_settings())
+    crawler = process.create_crawler(AvitoRuSpider)
+    process.crawl(crawler, shard=index, shards=count)
+    process.start()
+    dump_stats(crawler.stats.get_stats(), stats_file(stats_dir, index, count))
+
+
+def parse_ids(text, count):
+    if not text:
+        return list(range(count))
+    result = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        result += range(int(first), int(last or first) + 1)
+    return result
+
+
+def merge(files):
+    shard_stats = []
+    for file_name in files:
+        with open(file_name, encoding='utf-8') as f:
+            shard_stats.append(json.load(f))
+    return merge_stats(shard_stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AvitoRuSpider in shards, a process each')
+    parser.add_argument('--shards', type=int, default=ShardSettings.COUNT, help='shards of the whole crawl')
+    parser.add_argument('--ids', help="the shards to run here, e.g. '0-3,6', all by default")
+    parser.add_argument('--stats-dir', default=ShardSettings.STATS_DIR)
+    parser.add_argument('--plan', action='store_true', help='print the seeds of each shard and exit')
+    parser.add_argument('--merge', metavar='DIRECTORY', help='merge the stats files of DIRECTORY and exit')
+    args = parser.parse_args()
+
+    if args.merge:
+        print(json.dumps(merge(sorted(glob.glob(os.path.join(args.merge, 'shard-*.json')))), indent=4,
+                         sort_keys=True))
+        return 0
+    if args.plan:
+        urls = [x.format(loc) for x in AvitoSettings.URL_FORMATS for loc in AvitoSettings.LOCATION_PARTS]
+        for index, seeds in sorted(plan(urls, args.shards, ShardSettings.VIRTUAL_NODES).items()):
+            print('shard {}: {} seeds'.format(index, len(seeds)))
+            for url in seeds:
+                print('    ' + url)
+        return 0
+
+    ids = parse_ids(args.ids, args.shards)
+    sys.path.append(os.getcwd())
+    processes = [Process(target=run_shard, args=(x, args.shards, args.stats_dir), name='shard-{}'.format(x))
+                 for x in ids]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    failed = [x.name for x in processes if x.exitcode != 0]
+    if failed:
+        print('Failed: {}'.format(', '.join(failed)))
+    files = [stats_file(args.stats_dir, x, args.shards) for x in ids]
+    merged = merge([x for x in files if os.path.exists(x)])
+    print(json.dumps(merged, indent=4, sort_keys=True))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())